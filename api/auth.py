@@ -0,0 +1,127 @@
+import datetime
+import time
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+from .models import Organization, User, TokenRevocation
+
+TOKEN_SALT = "api.session"
+
+# Process-local copy of the revocation list, reloaded only when its version (highest pk) changes
+_revocations = {"version": None, "checked": 0.0, "users": {}}
+
+class SessionUser:
+    """
+    User making a request, resolved from a signed token or a legacy user_hash
+    """
+    def __init__(self, pk, organization_id, role, user=None):
+        self.pk = pk
+        self.organization_id = organization_id
+        self.role = role
+        self._user = user
+        self._organization = None
+
+    def get_user(self):
+        # Only views that need the full row (password, profile) pay for this query
+        if self._user is None:
+            self._user = User.objects.get(pk=self.pk)
+        return self._user
+
+    @property
+    def organization(self):
+        if self._organization is None:
+            self._organization = Organization.objects.get(pk=self.organization_id)
+        return self._organization
+
+def now_ms():
+    return int(time.time() * 1000)
+
+def issue_token(user):
+    """
+    Issuing a signed token carrying the user id, organization id, role and expiry
+    """
+    issued_at = now_ms()
+    payload = {
+        "u": user.pk,
+        "o": user.organization_id,
+        "r": user.role,
+        "i": issued_at,
+        "e": issued_at + settings.API_TOKEN_MAX_AGE * 1000,
+    }
+    return signing.dumps(payload, salt=TOKEN_SALT)
+
+def verify_token(token):
+    """
+    Verifying a signed token in memory, returns None if it is invalid, expired or revoked
+    """
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        return None
+
+    if payload["e"] <= now_ms():
+        return None
+
+    if is_revoked(payload["u"], payload["i"]):
+        return None
+
+    return SessionUser(payload["u"], payload["o"], payload["r"])
+
+def get_session_user(credential, load_user=False):
+    """
+    Resolving either a signed token or a legacy user_hash to a SessionUser
+    """
+    if not credential:
+        return None
+
+    # Signed tokens always contain the signer separator, legacy hashes are letters only
+    if ":" in credential:
+        user = verify_token(credential)
+        if user is not None and load_user:
+            try:
+                user.get_user()
+            except User.DoesNotExist:
+                return None
+        return user
+
+    try:
+        user = User.objects.get(user_hash=credential)
+    except User.DoesNotExist:
+        return None
+
+    return SessionUser(user.pk, user.organization_id, user.role, user=user)
+
+def revoke_tokens(user_id):
+    """
+    Revoking every token issued to a user up to now
+    """
+    revocation = TokenRevocation.objects.create(user_id=user_id)
+
+    # Revocations older than the token lifetime can no longer match anything
+    TokenRevocation.objects.filter(creation_date__lt=revocation.creation_date - datetime.timedelta(seconds=settings.API_TOKEN_MAX_AGE)).delete()
+
+    # Apply locally straight away, other processes pick it up on their next version check
+    users = dict(_revocations["users"])
+    users[user_id] = int(revocation.creation_date.timestamp() * 1000)
+    _revocations["users"] = users
+
+def is_revoked(user_id, issued_at):
+    refresh_revocations()
+    revoked_at = _revocations["users"].get(user_id)
+    return revoked_at is not None and issued_at < revoked_at
+
+def refresh_revocations(force=False):
+    checked = time.monotonic()
+    if not force and _revocations["version"] is not None and checked - _revocations["checked"] < settings.API_TOKEN_REVOCATION_POLL:
+        return
+
+    version = TokenRevocation.objects.order_by("-pk").values_list("pk", flat=True).first() or 0
+    if version != _revocations["version"]:
+        cutoff = timezone.now() - datetime.timedelta(seconds=settings.API_TOKEN_MAX_AGE)
+        users = {}
+        for user_id, creation_date in TokenRevocation.objects.filter(creation_date__gte=cutoff).values_list("user_id", "creation_date"):
+            users[user_id] = max(users.get(user_id, 0), int(creation_date.timestamp() * 1000))
+        _revocations["users"] = users
+        _revocations["version"] = version
+
+    _revocations["checked"] = checked
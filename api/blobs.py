@@ -0,0 +1,90 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import tempfile
+from django.conf import settings
+from django.urls import reverse
+from PIL import Image, UnidentifiedImageError
+from .models import Blob
+
+def blob_path(sha256):
+    return os.path.join(settings.BLOB_ROOT, sha256[:2], sha256)
+
+def blob_url(blob, size=None):
+    url = reverse("blob-view-get", args=[blob.sha256])
+    return f"{url}?size={size}" if size else url
+
+def protect_blob(response):
+    """
+    Blobs are served from the API origin, so browsers must neither sniff them nor render them as documents
+    """
+    response["X-Content-Type-Options"] = "nosniff"
+    response["Content-Security-Policy"] = "sandbox"
+    return response
+
+def decode_image(text):
+    """
+    Decoding a base64 upload, with or without a data: URL header, returns the bytes
+    """
+    # The declared type is the client's word, the stored one comes from the bytes
+    if text.startswith("data:"):
+        text = text.partition(",")[2]
+
+    try:
+        return base64.b64decode(text)
+    except (binascii.Error, ValueError):
+        raise ValueError("Image is not valid base64")
+
+def write_file(path, data):
+    # Write to a temporary file first so readers never see a partial blob
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(descriptor, "wb") as file:
+            file.write(data)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+def store_blob(data):
+    """
+    Storing an image once under its SHA-256, returns the existing Blob when the content is already stored
+
+    Raises ValueError when the bytes are not an image Pillow can identify, blobs are served from the API origin
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    path = blob_path(sha256)
+
+    blob = Blob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        if not os.path.exists(path):
+            write_file(path, data)
+        return blob
+
+    # Read the real format and dimensions
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            content_type = Image.MIME.get(image.format)
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Image format is not recognized")
+    if content_type is None or not content_type.startswith("image/"):
+        raise ValueError("Image format is not recognized")
+
+    write_file(path, data)
+    blob, created = Blob.objects.get_or_create(sha256=sha256, defaults={"content_type": content_type, "size": len(data), "width": width, "height": height})
+    return blob
+
+def store_image(text):
+    """
+    Storing a base64 image upload, returns None when no image was given and raises ValueError when it is not an image
+    """
+    if not text:
+        return None
+    data = decode_image(text)
+    if not data:
+        return None
+    return store_blob(data)
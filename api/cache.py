@@ -0,0 +1,59 @@
+import time
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Organization
+
+# Per-process cache of serialized organizations: pk -> {"version", "checked", "data"}
+_organizations = {}
+
+def get_organization_data(pk):
+    """
+    Retrieving the serialized organization, only checking its version once per poll interval
+    """
+    entry = _organizations.get(pk)
+    checked = time.monotonic()
+
+    if entry is not None:
+        if checked - entry["checked"] < settings.ORGANIZATION_CACHE_POLL:
+            return entry["data"]
+
+        # Cheap single column lookup before paying for a full reload
+        version = Organization.objects.filter(pk=pk).values_list("version", flat=True).first()
+        if version == entry["version"]:
+            entry["checked"] = checked
+            return entry["data"]
+
+    from .serializers import OrganizationSerializer
+
+    try:
+        organization = Organization.objects.get(pk=pk)
+    except Organization.DoesNotExist:
+        _organizations.pop(pk, None)
+        return None
+
+    data = OrganizationSerializer(organization).data
+    _organizations[pk] = {"version": organization.version, "checked": checked, "data": data}
+    return data
+
+def invalidate_organization(pk):
+    """
+    Bumping the organization version so every process reloads it
+    """
+    Organization.objects.filter(pk=pk).update(version=F("version") + 1)
+    _organizations.pop(pk, None)
+
+@receiver(post_save, sender=Organization)
+def organization_saved(sender, instance, created, **kwargs):
+    # Saves from anywhere, the admin included, reach every process and the dashboard snapshot
+    if not created:
+        from .snapshots import mark_dirty
+
+        invalidate_organization(instance.pk)
+        mark_dirty(instance.pk, "organization")
+
+@receiver(post_delete, sender=Organization)
+def organization_deleted(sender, instance, **kwargs):
+    # Other processes find the row gone on their next version check
+    _organizations.pop(instance.pk, None)
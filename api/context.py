@@ -0,0 +1,134 @@
+import json
+import threading
+from collections import OrderedDict
+from django.db.models import Count, Max, Prefetch, Q
+from django.utils import timezone
+from .models import Organization, Tag, Partner, Resource, Event
+
+# Descriptions are cut to this many characters
+DESCRIPTION_LIMIT = 200
+
+# Default and maximum size of a context in characters
+CONTEXT_BUDGET = 16000
+CONTEXT_BUDGET_MAX = 400000
+
+# Lines per streamed chunk
+CONTEXT_CHUNK_LINES = 100
+
+# Short field names of the context lines, sent first so the model can read them
+LEGEND = {
+    "k": "kind, p = partner and e = event", "id": "id", "n": "name", "d": "description", "t": "partner type", "m": "email",
+    "c": "contact", "tg": "tags", "r": "resources as [type, name, amount]", "dt": "date", "s": "start", "en": "end", "p": "partner ids",
+}
+
+# Contexts kept per process, the least recently used one is dropped past this
+CONTEXT_CACHE_SIZE = 32
+
+# Per-process cache of built contexts, least recently used first: pk -> {"version", "lines"}
+_contexts = OrderedDict()
+_contexts_lock = threading.Lock()
+
+def data_version(organization_id):
+    """
+    Version of everything a context is built from, in one query: the event and organization versions and the last partner change
+    """
+    row = Organization.objects.filter(pk=organization_id).annotate(partners_changed=Max("partner__updated_at")).values_list("event_version", "version", "partners_changed").first()
+    if row is None:
+        return None
+    event_version, version, partners_changed = row
+    return (event_version, version, partners_changed.isoformat() if partners_changed else None, timezone.localdate().isoformat())
+
+def truncate(text):
+    text = " ".join(text.split())
+    return text if len(text) <= DESCRIPTION_LIMIT else text[:DESCRIPTION_LIMIT - 1] + "…"
+
+def compact(record):
+    """
+    Dropping empty fields and encoding a record as one JSON line
+    """
+    return json.dumps({key: value for key, value in record.items() if value not in ("", None, [])}, separators=(",", ":"), ensure_ascii=False)
+
+def partner_line(partner):
+    individual = partner.individual
+    return compact({
+        "k": "p", "id": partner.pk, "n": partner.name, "d": truncate(partner.description), "t": partner.type, "m": partner.email,
+        "c": f"{individual.first_name} {individual.last_name}".strip(),
+        "tg": [tag.name for tag in partner.tags.all()],
+        "r": [[resource.type, resource.name, resource.amount] for resource in partner.resources.all()],
+    })
+
+def event_line(event):
+    return compact({
+        "k": "e", "id": event.pk, "n": event.name, "d": truncate(event.description), "dt": event.date.isoformat(),
+        "s": event.start_time.isoformat("minutes"), "en": event.end_time.isoformat("minutes"),
+        "p": [partner.pk for partner in event.partners.all()],
+    })
+
+def build_context(organization_id):
+    """
+    Ranking the partners and events of an organization into compact lines, best first
+
+    Upcoming events come first, soonest first, then past ones, latest first. Partners come by number of upcoming events, then resources.
+    Both lists are interleaved so any prefix of the context keeps a share of each.
+    """
+    today = timezone.localdate()
+    organization = Organization.objects.only("name", "message").get(pk=organization_id)
+
+    events = list(Event.objects.filter(organization_id=organization_id).only("pk", "name", "description", "date", "start_time", "end_time").prefetch_related(
+        Prefetch("partners", queryset=Partner.objects.only("pk")),
+    ))
+    upcoming = sorted([event for event in events if event.date >= today], key=lambda event: (event.date, event.start_time, event.pk))
+    past = sorted([event for event in events if event.date < today], key=lambda event: (event.date, event.start_time, event.pk), reverse=True)
+
+    partners = Partner.objects.filter(organization_id=organization_id).select_related("individual").prefetch_related(
+        Prefetch("tags", queryset=Tag.objects.only("pk", "name")),
+        Prefetch("resources", queryset=Resource.objects.only("pk", "type", "name", "amount", "partner_id")),
+    ).annotate(upcoming=Count("event", filter=Q(event__date__gte=today), distinct=True), resource_count=Count("resources", distinct=True)).order_by("-upcoming", "-resource_count", "name", "pk")
+
+    lines = [compact({"k": "h", "n": organization.name, "d": truncate(organization.message or ""), "dt": today.isoformat(), "legend": LEGEND})]
+    event_lines = [event_line(event) for event in upcoming + past]
+    partner_lines = [partner_line(partner) for partner in partners]
+    for index in range(max(len(event_lines), len(partner_lines))):
+        lines.extend(event_lines[index:index + 1])
+        lines.extend(partner_lines[index:index + 1])
+    return lines
+
+def get_context(organization_id):
+    """
+    Retrieving the built context lines, rebuilt only when the organization's data version moved
+    """
+    version = data_version(organization_id)
+    with _contexts_lock:
+        if version is None:
+            _contexts.pop(organization_id, None)
+            return None
+
+        entry = _contexts.get(organization_id)
+        if entry is not None and entry["version"] == version:
+            _contexts.move_to_end(organization_id)
+            return entry["lines"]
+
+    lines = build_context(organization_id)
+    with _contexts_lock:
+        _contexts[organization_id] = {"version": version, "lines": lines}
+        _contexts.move_to_end(organization_id)
+        while len(_contexts) > CONTEXT_CACHE_SIZE:
+            _contexts.popitem(last=False)
+    return lines
+
+def stream_context(lines, budget):
+    """
+    Streaming the lines as NDJSON chunks up to budget characters, lines that don't fit are skipped
+    """
+    remaining = budget
+    chunk = []
+    for line in lines:
+        if len(line) + 1 > remaining:
+            continue
+        remaining -= len(line) + 1
+        chunk.append(line)
+        if len(chunk) == CONTEXT_CHUNK_LINES:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
@@ -0,0 +1,75 @@
+import datetime
+from django.conf import settings
+from django.core import signing
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from .models import Resource, Event, Tombstone
+
+CURSOR_SALT = "api.ai-data"
+
+TOMBSTONE_PARTNER = 0
+TOMBSTONE_EVENT = 1
+
+# Changes committed while a sync was reading may carry an earlier updated_at, so cursors start a little early
+CURSOR_OVERLAP = datetime.timedelta(seconds=5)
+
+class CursorExpired(Exception):
+    pass
+
+def issue_cursor(organization_id, started):
+    """
+    Signing the point in time the next delta sync of an organization starts from
+    """
+    return signing.dumps({"o": organization_id, "t": (started - CURSOR_OVERLAP).isoformat()}, salt=CURSOR_SALT)
+
+def read_cursor(cursor, organization_id):
+    """
+    Reading a cursor back, raises ValueError if it was tampered with or is another organization's and CursorExpired once tombstones may be gone
+    """
+    try:
+        payload = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise ValueError(cursor)
+
+    if payload["o"] != organization_id:
+        raise ValueError(cursor)
+
+    since = datetime.datetime.fromisoformat(payload["t"])
+    if timezone.now() - since > datetime.timedelta(seconds=settings.AI_SYNC_MAX_AGE):
+        raise CursorExpired()
+    return since
+
+def bury(organization_id, kind, object_ids):
+    """
+    Recording deleted partners or events, called in the same transaction as the deletion
+    """
+    tombstones = Tombstone.objects.bulk_create([Tombstone(organization_id=organization_id, kind=kind, object_id=object_id) for object_id in object_ids])
+
+    # Tombstones older than the cursor lifetime can no longer be asked for
+    if tombstones:
+        Tombstone.objects.filter(deletion_date__lt=tombstones[0].deletion_date - datetime.timedelta(seconds=settings.AI_SYNC_MAX_AGE)).delete()
+
+def touch_partner_events(partner_id):
+    """
+    Marking the events of a partner as changed, they embed its name and feeds its email
+    """
+    Event.objects.filter(partners=partner_id).update(updated_at=timezone.now())
+
+def changed_partners(queryset, since):
+    """
+    Partners changed after since, including through their individual or resources
+    """
+    resources = Resource.objects.filter(partner_id=OuterRef("pk"), updated_at__gt=since)
+    return queryset.filter(Q(updated_at__gt=since) | Q(individual__updated_at__gt=since) | Exists(resources))
+
+def changed_events(queryset, since):
+    return queryset.filter(updated_at__gt=since)
+
+def deleted_since(organization_id, since):
+    """
+    Ids of the partners and events deleted after since
+    """
+    deleted = {"partners": [], "events": []}
+    for kind, object_id in Tombstone.objects.filter(organization_id=organization_id, deletion_date__gt=since).values_list("kind", "object_id").order_by("pk"):
+        deleted["partners" if kind == TOMBSTONE_PARTNER else "events"].append(object_id)
+    return deleted
@@ -0,0 +1,71 @@
+from django.db.models import CharField, Count, Exists, OuterRef, Value
+from django.db.models.functions import Cast
+from .models import Partner, Resource
+
+PARTNER_FACETS = ["type", "tags", "resource_type"]
+
+def split_ints(value):
+    return [int(x) for x in value.split(",") if x.strip()]
+
+def parse_partner_filters(request):
+    """
+    Reading the partner filters from the query params, raises ValueError if one is malformed
+    """
+    params = request.query_params
+    filters = {}
+    if params.get("type"):
+        filters["type"] = split_ints(params["type"])
+    if params.get("tags"):
+        filters["tags"] = [x.strip() for x in params["tags"].split(",") if x.strip()]
+    if params.get("resource_type"):
+        filters["resource_type"] = split_ints(params["resource_type"])
+    if params.get("min_amount"):
+        filters["min_amount"] = int(params["min_amount"])
+    return filters
+
+def filter_partners(queryset, filters, skip=None):
+    """
+    Narrowing partners down, values of one filter are alternatives and different filters all have to match
+
+    skip leaves one facet's own filter out, so its counts show what choosing another value would give.
+    """
+    if "type" in filters and skip != "type":
+        queryset = queryset.filter(type__in=filters["type"])
+
+    if "tags" in filters and skip != "tags":
+        # Exists keeps each partner once however many of its tags match
+        tags = Partner.tags.through.objects.filter(partner_id=OuterRef("pk"), tag__name__in=filters["tags"])
+        queryset = queryset.filter(Exists(tags))
+
+    # Type and amount apply to the same resource, a partner needs one resource matching both
+    resource_filter = {}
+    if "resource_type" in filters and skip != "resource_type":
+        resource_filter["type__in"] = filters["resource_type"]
+    if "min_amount" in filters:
+        resource_filter["amount__gte"] = filters["min_amount"]
+    if resource_filter:
+        queryset = queryset.filter(Exists(Resource.objects.filter(partner_id=OuterRef("pk"), **resource_filter)))
+
+    return queryset
+
+def partner_facets(organization_id, filters):
+    """
+    Counting partners per type, tag and resource type in one UNION ALL query
+    """
+    def partners(skip):
+        return filter_partners(Partner.objects.filter(organization_id=organization_id), filters, skip).values("pk")
+
+    types = partners("type").values("type").annotate(facet=Value("type"), key=Cast("type", CharField()), count=Count("pk")).values_list("facet", "key", "count")
+
+    PartnerTags = Partner.tags.through
+    tags = PartnerTags.objects.filter(partner_id__in=partners("tags")).values("tag__name").annotate(facet=Value("tags"), key=Cast("tag__name", CharField()), count=Count("partner_id")).values_list("facet", "key", "count")
+
+    resources = Resource.objects.filter(partner_id__in=partners("resource_type"))
+    if "min_amount" in filters:
+        resources = resources.filter(amount__gte=filters["min_amount"])
+    resource_types = resources.values("type").annotate(facet=Value("resource_type"), key=Cast("type", CharField()), count=Count("partner_id", distinct=True)).values_list("facet", "key", "count")
+
+    facets = {facet: {} for facet in PARTNER_FACETS}
+    for facet, key, count in types.union(tags, resource_types, all=True):
+        facets[facet][key] = count
+    return facets
@@ -0,0 +1,102 @@
+import datetime
+import hashlib
+import secrets
+from django.db.models import F, Prefetch
+from .models import Organization, Partner, Event, FeedToken
+
+# Events fetched per query while streaming a feed
+FEED_CHUNK_SIZE = 500
+
+# Keeps event UIDs globally unique, calendar apps match updates on them
+FEED_DOMAIN = "ventike"
+
+def touch_events(organization_id):
+    """
+    Bumping the event version of an organization, every change to its events or their partners must call this
+    """
+    Organization.objects.filter(pk=organization_id).update(event_version=F("event_version") + 1)
+
+def token_digest(token):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_feed_token(user):
+    """
+    Issuing a feed token for a user's organization, returns the FeedToken and the token, which is not stored
+    """
+    token = secrets.token_urlsafe(32)
+    feed_token = FeedToken.objects.create(digest=token_digest(token), user_id=user.pk, organization_id=user.organization_id)
+    return feed_token, token
+
+def feed_state(token, partner_id=None):
+    """
+    Organization of a feed token with the ETag of its feed and its name, in one single row lookup
+
+    The ETag comes from the organization's event and organization versions.
+    """
+    state = Organization.objects.filter(feedtoken__digest=token_digest(token)).values_list("pk", "event_version", "version", "name").first()
+    if state is None:
+        return None, None, None
+    organization_id, event_version, version, name = state
+    return organization_id, f'"{organization_id}-{partner_id or "all"}-{event_version}.{version}"', name
+
+def escape(text):
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+def fold(line):
+    """
+    Folding a content line into 75 octet parts as RFC 5545 requires, without splitting characters
+    """
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    parts = []
+    part = ""
+    size = 0
+    for character in line:
+        length = len(character.encode())
+        if size + length > (75 if not parts else 74):
+            parts.append(part)
+            part = ""
+            size = 0
+        part += character
+        size += length
+    parts.append(part)
+    return "\r\n ".join(parts) + "\r\n"
+
+def event_lines(event):
+    start = datetime.datetime.combine(event.date, event.start_time)
+    end = datetime.datetime.combine(event.date, event.end_time)
+
+    # Calendar apps matching on UID only apply an update when its stamp moved
+    modified = event.updated_at.astimezone(datetime.timezone.utc)
+
+    yield "BEGIN:VEVENT"
+    yield f"UID:event-{event.pk}@{FEED_DOMAIN}"
+    yield f"DTSTAMP:{modified:%Y%m%dT%H%M%SZ}"
+    yield f"LAST-MODIFIED:{modified:%Y%m%dT%H%M%SZ}"
+    yield f"DTSTART:{start:%Y%m%dT%H%M%S}"
+    yield f"DTEND:{end:%Y%m%dT%H%M%S}"
+    yield f"SUMMARY:{escape(event.name)}"
+    yield f"DESCRIPTION:{escape(event.description)}"
+    for partner in event.partners.all():
+        yield f"ATTENDEE;CN=\"{partner.name.replace(chr(34), '')}\":mailto:{partner.email}"
+    yield "END:VEVENT"
+
+def generate_feed(organization_id, name, partner_id=None):
+    """
+    Streaming the iCalendar feed of an organization or one of its partners, a chunk of events at a time
+    """
+    events = Event.objects.filter(organization_id=organization_id).only("pk", "updated_at", "name", "description", "date", "start_time", "end_time").prefetch_related(
+        Prefetch("partners", queryset=Partner.objects.only("pk", "name", "email")),
+    ).order_by("date", "start_time", "pk")
+    if partner_id is not None:
+        events = events.filter(partners=partner_id)
+
+    header = ["BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//Ventike//Events//EN", "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{escape(name)}"]
+    yield "".join(fold(line) for line in header).encode()
+
+    for event in events.iterator(chunk_size=FEED_CHUNK_SIZE):
+        yield "".join(fold(line) for line in event_lines(event)).encode()
+
+    yield fold("END:VCALENDAR").encode()
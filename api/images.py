@@ -0,0 +1,82 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+from .blobs import blob_path, write_file
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each variant
+VARIANT_SIZES = {"thumbnail": 96, "small": 320, "medium": 960}
+
+# Variant format -> (Pillow format, content type)
+VARIANT_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image-variants")
+    return _executor
+
+def variant_path(sha256, size, format):
+    return os.path.join(settings.BLOB_ROOT, "variants", sha256[:2], f"{sha256}-{size}.{format}")
+
+def generate_variants(sha256):
+    """
+    Writing every size and format variant of a stored image, skipping the ones that already exist
+    """
+    missing = [(size, format) for size in VARIANT_SIZES for format in VARIANT_FORMATS if not os.path.exists(variant_path(sha256, size, format))]
+    if not missing:
+        return
+
+    with Image.open(blob_path(sha256)) as original:
+        original.load()
+        # JPEG has no alpha channel, flatten transparent images onto white
+        if original.mode in ("RGBA", "LA", "P"):
+            flattened = Image.new("RGB", original.size, (255, 255, 255))
+            flattened.paste(original.convert("RGBA"), mask=original.convert("RGBA").getchannel("A"))
+            original = flattened
+        elif original.mode != "RGB":
+            original = original.convert("RGB")
+
+        for size, format in missing:
+            image = original.copy()
+            image.thumbnail((VARIANT_SIZES[size], VARIANT_SIZES[size]))
+            buffer = _encode(image, VARIANT_FORMATS[format][0])
+            write_file(variant_path(sha256, size, format), buffer)
+
+def _encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format, quality=80)
+    return buffer.getvalue()
+
+def _generate(sha256):
+    try:
+        generate_variants(sha256)
+    except Exception:
+        logger.exception("Could not generate image variants for %s", sha256)
+
+def schedule_variants(blob):
+    """
+    Generating the variants of an uploaded image on the background pool once the upload is committed
+    """
+    if blob is None or blob.width is None:
+        return
+    transaction.on_commit(lambda: get_executor().submit(_generate, blob.sha256))
+
+def wait_for_variants():
+    # Lets management commands finish their queued work before the process exits
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
@@ -0,0 +1,265 @@
+import codecs
+import csv
+import itertools
+import json
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date, parse_time
+from .models import Individual, Partner, Resource, Event
+from .provisioning import chunks
+from .rollups import resource_rows, update_rollups
+from .search import index_events, index_partners
+from .feeds import touch_events
+from .snapshots import mark_dirty
+from .tags import forget_tags, resolve_tags, split_tags
+from .utils import is_valid_email, normalize_phone_numbers
+
+PARTNER_COLUMNS = ["name", "description", "type", "email", "phone", "individual_first_name", "individual_last_name", "individual_email", "individual_phone"]
+EVENT_COLUMNS = ["name", "description", "date", "start_time", "end_time"]
+ERROR_COLUMNS = ["row", "name", "error"]
+
+# Rows validated and inserted per transaction
+IMPORT_CHUNK_SIZE = 500
+
+def read_rows(stream):
+    """
+    Streaming (row number, row) pairs out of a CSV or JSON lines file without loading it whole
+    """
+    lines = iter(stream)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+
+    # Uploaded and binary files yield bytes
+    if isinstance(first, bytes):
+        lines = codecs.iterdecode(lines, "utf-8-sig")
+
+    # Leading blank lines are skipped, the first line tells JSON lines from CSV
+    lines = itertools.dropwhile(lambda line: not line.strip(), lines)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+
+    if first.lstrip().startswith("{"):
+        for index, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield index, row
+    else:
+        for index, row in enumerate(csv.DictReader(lines), start=1):
+            yield index, row
+
+def read_through(rows, errors):
+    """
+    Passing rows on until the file can no longer be decoded or parsed, which is recorded as an error on the next row
+    """
+    index = 0
+    try:
+        for index, row in rows:
+            yield index, row
+    except (UnicodeDecodeError, csv.Error):
+        errors.append({"row": index + 1, "name": "", "error": "unreadable_file"})
+
+def split_list(value):
+    """
+    Reading a list given either as a JSON list or as comma separated text
+    """
+    if isinstance(value, list):
+        return [str(x).strip() for x in value if str(x).strip()]
+    return [x.strip() for x in str(value or "").split(",") if x.strip()]
+
+def parse_resources(row):
+    """
+    Reading resources either as a JSON list of objects or as the resource_types, resource_names and resource_amounts columns
+    """
+    if isinstance(row.get("resources"), list):
+        resources = row["resources"]
+        if not all(isinstance(resource, dict) for resource in resources):
+            raise ValueError
+        types = [resource.get("type") for resource in resources]
+        names = [resource.get("name") for resource in resources]
+        amounts = [resource.get("amount") for resource in resources]
+    else:
+        types = split_list(row.get("resource_types"))
+        names = split_list(row.get("resource_names"))
+        amounts = split_list(row.get("resource_amounts"))
+        if not (len(types) == len(names) == len(amounts)):
+            raise ValueError
+
+    return [{"type": int(types[i]), "name": str(names[i]), "amount": int(amounts[i])} for i in range(len(names))]
+
+def validate_partner(row, phones):
+    """
+    Validating a partner row against the chunk's normalized phones, returns the cleaned row or an error code
+    """
+    values = {column: str(row.get(column) or "").strip() for column in PARTNER_COLUMNS}
+
+    if not all(values.values()):
+        return None, "missing_fields"
+    if values["type"] not in ["0", "1", "2", "3"]:
+        return None, "invalid_type"
+    if not is_valid_email(values["email"]) or not is_valid_email(values["individual_email"]):
+        return None, "invalid_email"
+
+    phone = phones[values["phone"]]
+    individual_phone = phones[values["individual_phone"]]
+    if not (phone.valid and individual_phone.valid):
+        return None, "invalid_phone"
+    values["phone"] = phone.international
+    values["individual_phone"] = individual_phone.international
+
+    try:
+        values["resources"] = parse_resources(row)
+    except (TypeError, ValueError):
+        return None, "invalid_resources"
+
+    values["type"] = int(values["type"])
+    values["tags"] = split_tags(",".join(split_list(row.get("tags"))))
+    return values, None
+
+def validate_event(row, phones):
+    """
+    Validating an event row, returns the cleaned row or an error code
+    """
+    values = {column: str(row.get(column) or "").strip() for column in EVENT_COLUMNS}
+
+    if not all(values.values()):
+        return None, "missing_fields"
+
+    try:
+        values["date"] = parse_date(values["date"])
+        values["start_time"] = parse_time(values["start_time"])
+        values["end_time"] = parse_time(values["end_time"])
+    except ValueError:
+        return None, "invalid_date"
+    if values["date"] is None or values["start_time"] is None or values["end_time"] is None:
+        return None, "invalid_date"
+
+    values["partners"] = split_list(row.get("partners"))
+    return values, None
+
+def insert_partners(organization_id, chunk):
+    # Every tag of the chunk is resolved at once
+    tag_names = list(dict.fromkeys(name for index, row in chunk for name in row["tags"]))
+    tag_ids = dict(zip(tag_names, resolve_tags(organization_id, tag_names)))
+
+    with transaction.atomic():
+        individuals = Individual.objects.bulk_create([Individual(first_name=row["individual_first_name"], last_name=row["individual_last_name"], email=row["individual_email"], phone=row["individual_phone"]) for index, row in chunk])
+        partners = Partner.objects.bulk_create([Partner(name=row["name"], description=row["description"], type=row["type"], email=row["email"], phone=row["phone"], individual=individual, organization_id=organization_id) for (index, row), individual in zip(chunk, individuals)])
+
+        Resource.objects.bulk_create([Resource(partner=partner, **resource) for (index, row), partner in zip(chunk, partners) for resource in row["resources"]])
+        update_rollups(organization_id, [], [row for (index, values), partner in zip(chunk, partners) for row in resource_rows(partner.type, values["resources"])])
+
+        PartnerTags = Partner.tags.through
+        PartnerTags.objects.bulk_create([PartnerTags(partner_id=partner.pk, tag_id=tag_ids[name]) for (index, row), partner in zip(chunk, partners) for name in row["tags"]])
+
+        index_partners([partner.pk for partner in partners])
+        mark_dirty(organization_id, "partners")
+
+    return len(partners)
+
+def import_partners(organization_id, chunk, errors):
+    """
+    Inserting one chunk of validated partners with their individuals, resources and tags
+    """
+    try:
+        return insert_partners(organization_id, chunk)
+    except IntegrityError:
+        # A tag deleted by another process within TAG_REGISTRY_MAX_AGE may still be in the registry, the chunk was rolled back
+        forget_tags(organization_id)
+        return insert_partners(organization_id, chunk)
+
+def import_events(organization_id, chunk, errors):
+    """
+    Inserting one chunk of validated events and linking them to partners found by name
+    """
+    # Event names are unique across every organization
+    names = [row["name"] for index, row in chunk]
+    taken = set(Event.objects.filter(name__in=names).values_list("name", flat=True))
+
+    partner_names = {name for index, row in chunk for name in row["partners"]}
+    partner_ids = {}
+    # Partner names aren't unique, newest first so the oldest one wins
+    for name, pk in Partner.objects.filter(organization_id=organization_id, name__in=partner_names).order_by("-pk").values_list("name", "pk"):
+        partner_ids[name] = pk
+
+    valid = []
+    for index, row in chunk:
+        if row["name"] in taken:
+            errors.append({"row": index, "name": row["name"], "error": "name_taken"})
+        elif any(name not in partner_ids for name in row["partners"]):
+            errors.append({"row": index, "name": row["name"], "error": "unknown_partner"})
+        else:
+            valid.append((index, row))
+
+    with transaction.atomic():
+        events = Event.objects.bulk_create([Event(name=row["name"], description=row["description"], date=row["date"], start_time=row["start_time"], end_time=row["end_time"], organization_id=organization_id) for index, row in valid])
+
+        EventPartners = Event.partners.through
+        EventPartners.objects.bulk_create([EventPartners(event_id=event.pk, partner_id=partner_ids[name]) for (index, row), event in zip(valid, events) for name in dict.fromkeys(row["partners"])])
+
+        # Chunks where every row was refused change nothing feeds or the dashboard show
+        if events:
+            index_events([event.pk for event in events])
+            touch_events(organization_id)
+            mark_dirty(organization_id, "events")
+
+    return len(events)
+
+# Kind -> (row validator, chunk inserter, phone columns normalized per chunk)
+IMPORTERS = {
+    "partners": (validate_partner, import_partners, ["phone", "individual_phone"]),
+    "events": (validate_event, import_events, []),
+}
+
+def import_rows(kind, organization_id, rows, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Importing partners or events from (row number, row) pairs chunk by chunk, returns the created count and a list of per-row errors
+    """
+    validate, insert, phone_columns = IMPORTERS[kind]
+    created = 0
+    processed = 0
+    errors = []
+    seen = set()
+
+    # Chunks read before a broken part of the file stay imported
+    for chunk in chunks(read_through(rows, errors), chunk_size):
+        phones = normalize_phone_numbers(str(row.get(column) or "").strip() for index, row in chunk if isinstance(row, dict) for column in phone_columns)
+
+        valid = []
+        for index, row in chunk:
+            if not isinstance(row, dict):
+                errors.append({"row": index, "name": "", "error": "invalid_row"})
+                continue
+
+            values, error = validate(row, phones)
+            if error:
+                errors.append({"row": index, "name": str(row.get("name") or ""), "error": error})
+            elif kind == "events" and values["name"] in seen:
+                errors.append({"row": index, "name": values["name"], "error": "duplicate_name"})
+            else:
+                seen.add(values["name"])
+                valid.append((index, values))
+
+        if valid:
+            created += insert(organization_id, valid, errors)
+        processed += len(chunk)
+
+        if progress is not None:
+            progress(processed, created, len(errors))
+
+    errors.sort(key=lambda error: error["row"])
+    return created, errors
+
+def write_errors(errors, file):
+    """
+    Writing per-row import errors as CSV
+    """
+    writer = csv.DictWriter(file, fieldnames=ERROR_COLUMNS)
+    writer.writeheader()
+    writer.writerows(errors)
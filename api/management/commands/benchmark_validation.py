@@ -0,0 +1,66 @@
+import random
+import re
+import time
+import phonenumbers
+from django.core.management.base import BaseCommand
+from api.utils import is_valid_email, normalize_phone_number, normalize_phone_numbers
+
+def legacy_is_valid_email(email):
+    # The previous implementation, compiling the pattern through re.match on every call
+    return bool(re.match(r'^[a-z0-9]+[\._]?[a-z0-9]+[@]\w+[.]\w+$', email))
+
+def legacy_contact(email, phone):
+    # The previous request path, parsing the phone once to validate it and again to format it
+    if not legacy_is_valid_email(email) or not phonenumbers.is_valid_number(phonenumbers.parse(phone, "CA")):
+        return None
+    return phonenumbers.format_number(phonenumbers.parse(phone, "CA"), phonenumbers.PhoneNumberFormat.INTERNATIONAL)
+
+def normalized_contact(email, phone):
+    number = normalize_phone_number(phone)
+    if not is_valid_email(email) or not number.valid:
+        return None
+    return number.international
+
+class Command(BaseCommand):
+    help = "Measures the per-row cost of validating and formatting contacts before and after normalization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=20000, help="Contacts validated per run")
+        parser.add_argument("--distinct", type=int, default=2000, help="Distinct phone numbers among the rows")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the fastest is reported")
+
+    def handle(self, *args, **options):
+        generator = random.Random(0)
+        numbers = [f"613-555-{i:04d}" for i in range(options["distinct"])]
+        rows = [(f"contact{i}@example.com", generator.choice(numbers)) for i in range(options["rows"])]
+
+        def legacy():
+            for email, phone in rows:
+                legacy_contact(email, phone)
+
+        def cold():
+            normalize_phone_number.cache_clear()
+            for email, phone in rows:
+                normalized_contact(email, phone)
+
+        def warm():
+            for email, phone in rows:
+                normalized_contact(email, phone)
+
+        def batch():
+            normalize_phone_number.cache_clear()
+            phones = normalize_phone_numbers(phone for email, phone in rows)
+            for email, phone in rows:
+                is_valid_email(email) and phones[phone].valid
+
+        baseline = None
+        for name, case in [("before (parse twice, regex per call)", legacy), ("after, cold cache", cold), ("after, warm cache", warm), ("after, batch", batch)]:
+            best = min(self.time(case) for i in range(options["repeat"]))
+            per_row = best / len(rows) * 1000000
+            baseline = baseline or per_row
+            self.stdout.write(f"{name:<40} {per_row:8.2f} us/row {baseline / per_row:6.1f}x")
+
+    def time(self, case):
+        start = time.perf_counter()
+        case()
+        return time.perf_counter() - start
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.models import Organization
+from api.provisioning import parse_users, provision_users
+
+class Command(BaseCommand):
+    help = "Creates the users listed in a JSON or CSV file for an organization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSON list or CSV file with username, password, email, first_name, last_name and role")
+        parser.add_argument("--organization", type=int, required=True, help="Primary key of the organization")
+
+    def handle(self, *args, **options):
+        if not Organization.objects.filter(pk=options["organization"]).exists():
+            raise CommandError(f"Organization {options['organization']} does not exist")
+
+        try:
+            with open(options["path"], "rb") as file:
+                rows = parse_users(file)
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Could not read {options['path']}: {error}")
+
+        created, errors = provision_users(options["organization"], rows)
+
+        for error in errors:
+            self.stderr.write(f"Row {error['row']} ({error['username']}): {error['error']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Created {len(created)} users, {len(errors)} rows failed"))
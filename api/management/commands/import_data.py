@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from api.importers import IMPORTERS, IMPORT_CHUNK_SIZE, import_rows, read_rows, write_errors
+from api.models import Organization
+
+class Command(BaseCommand):
+    help = "Imports partners or events from a CSV or JSON lines file into an organization"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(IMPORTERS), help="What the file contains")
+        parser.add_argument("path", help="CSV file with a header row, or one JSON object per line")
+        parser.add_argument("--organization", type=int, required=True, help="Primary key of the organization")
+        parser.add_argument("--errors", help="Where to write the rows that failed, as CSV")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Rows validated and inserted per transaction")
+
+    def handle(self, *args, **options):
+        if not Organization.objects.filter(pk=options["organization"]).exists():
+            raise CommandError(f"Organization {options['organization']} does not exist")
+
+        def progress(processed, created, failed):
+            self.stdout.write(f"{processed} rows read, {created} created, {failed} failed")
+
+        try:
+            with open(options["path"], "rb") as file:
+                created, errors = import_rows(options["kind"], options["organization"], read_rows(file), options["chunk_size"], progress)
+        except OSError as error:
+            raise CommandError(f"Could not read {options['path']}: {error}")
+
+        if errors and options["errors"]:
+            with open(options["errors"], "w", newline="") as file:
+                write_errors(errors, file)
+        else:
+            for error in errors:
+                self.stderr.write(f"Row {error['row']} ({error['name']}): {error['error']}")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} {options['kind']}, {len(errors)} rows failed"))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from api.blobs import store_image
+from api.images import schedule_variants, wait_for_variants
+from api.models import User, Partner
+
+class Command(BaseCommand):
+    help = "Moves base64 partner images and profile pictures out of the database into the blob store"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100, help="Rows loaded and updated per transaction")
+
+    def handle(self, *args, **options):
+        for model, text_field, blob_field in [(Partner, "image", "image_blob"), (User, "profile_picture", "profile_picture_blob")]:
+            moved = failed = 0
+            last_pk = 0
+
+            while True:
+                # Walk by primary key so each batch only loads the rows it moves
+                batch = list(model.objects.filter(pk__gt=last_pk, **{f"{text_field}__isnull": False}).order_by("pk").only("pk", text_field)[:options["batch_size"]])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+
+                updated = []
+                for instance in batch:
+                    try:
+                        blob = store_image(getattr(instance, text_field))
+                    except ValueError:
+                        failed += 1
+                        self.stderr.write(f"{model.__name__} {instance.pk}: image is not a valid base64 image, left in place")
+                        continue
+
+                    schedule_variants(blob)
+                    setattr(instance, blob_field, blob)
+                    setattr(instance, text_field, None)
+                    updated.append(instance)
+
+                with transaction.atomic():
+                    model.objects.bulk_update(updated, [blob_field, text_field])
+                moved += len(updated)
+
+            self.stdout.write(self.style.SUCCESS(f"{model.__name__}: moved {moved} images, {failed} failed"))
+
+        self.stdout.write("Waiting for image variants")
+        wait_for_variants()
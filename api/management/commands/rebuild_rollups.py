@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api.models import ResourceRollup
+from api.rollups import compute_rollups, stored_rollups
+
+class Command(BaseCommand):
+    help = "Verifies the resource rollups against the raw resources and rewrites the buckets that drifted"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--organization", type=int, help="Only this organization, every organization by default")
+        parser.add_argument("--check", action="store_true", help="Only report differences, failing if there are any")
+
+    def handle(self, *args, **options):
+        organization_id = options["organization"]
+
+        with transaction.atomic():
+            expected = compute_rollups(organization_id)
+            stored = stored_rollups(organization_id)
+
+            drifted = sorted(key for key in expected.keys() | stored.keys() if expected.get(key, (0, 0)) != stored.get(key, (0, 0)))
+            for organization, resource_type, partner_type in drifted:
+                amount, count = stored.get((organization, resource_type, partner_type), (0, 0))
+                expected_amount, expected_count = expected.get((organization, resource_type, partner_type), (0, 0))
+                self.stdout.write(f"Organization {organization}, resource type {resource_type}, partner type {partner_type}: stored {amount} over {count} resources, expected {expected_amount} over {expected_count}")
+
+            if options["check"]:
+                if drifted:
+                    raise CommandError(f"{len(drifted)} rollups differ from the resources")
+                self.stdout.write(self.style.SUCCESS(f"All {len(expected)} rollups match the resources"))
+                return
+
+            for organization, resource_type, partner_type in drifted:
+                amount, count = expected.get((organization, resource_type, partner_type), (0, 0))
+                ResourceRollup.objects.update_or_create(organization_id=organization, resource_type=resource_type, partner_type=partner_type, defaults={"amount": amount, "resources": count})
+
+        self.stdout.write(self.style.SUCCESS(f"Rewrote {len(drifted)} of {len(expected)} rollups"))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    # Concurrent partner writes could create the same tag twice, keep the oldest and move partners onto it
+    Tag = apps.get_model('api', 'Tag')
+    PartnerTags = apps.get_model('api', 'Partner').tags.through
+
+    kept = {}
+    duplicates = {}
+    for pk, organization_id, name in Tag.objects.order_by('pk').values_list('pk', 'organization_id', 'name'):
+        key = (organization_id, name)
+        if key in kept:
+            duplicates[pk] = kept[key]
+        else:
+            kept[key] = pk
+
+    for duplicate, original in duplicates.items():
+        partners = PartnerTags.objects.filter(tag_id=duplicate).values_list('partner_id', flat=True)
+        existing = set(PartnerTags.objects.filter(tag_id=original, partner_id__in=partners).values_list('partner_id', flat=True))
+        PartnerTags.objects.bulk_create([PartnerTags(tag_id=original, partner_id=partner) for partner in partners if partner not in existing])
+
+    PartnerTags.objects.filter(tag_id__in=duplicates).delete()
+    Tag.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_blob_store'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('organization', 'name'), name='tag_org_name_unique'),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+SQLITE_INDEX = [
+    # External content table, the rows live in api_searchentry and triggers keep the index in step
+    """CREATE VIRTUAL TABLE api_searchentry_fts USING fts5(
+        title, text, organization_id,
+        content='api_searchentry', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER api_searchentry_ai AFTER INSERT ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(rowid, title, text, organization_id) VALUES (new.id, new.title, new.text, new.organization_id);
+    END""",
+    """CREATE TRIGGER api_searchentry_ad AFTER DELETE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title, text, organization_id) VALUES ('delete', old.id, old.title, old.text, old.organization_id);
+    END""",
+    """CREATE TRIGGER api_searchentry_au AFTER UPDATE ON api_searchentry BEGIN
+        INSERT INTO api_searchentry_fts(api_searchentry_fts, rowid, title, text, organization_id) VALUES ('delete', old.id, old.title, old.text, old.organization_id);
+        INSERT INTO api_searchentry_fts(rowid, title, text, organization_id) VALUES (new.id, new.title, new.text, new.organization_id);
+    END""",
+]
+
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS api_searchentry_au",
+    "DROP TRIGGER IF EXISTS api_searchentry_ad",
+    "DROP TRIGGER IF EXISTS api_searchentry_ai",
+    "DROP TABLE IF EXISTS api_searchentry_fts",
+]
+
+# Same expression as api.search.POSTGRES_DOCUMENT
+POSTGRES_INDEX = [
+    """CREATE INDEX api_searchentry_document_idx ON api_searchentry USING GIN (
+        (setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', text), 'B'))
+    )""",
+]
+
+POSTGRES_DROP = ["DROP INDEX IF EXISTS api_searchentry_document_idx"]
+
+
+def create_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_INDEX, "postgresql": POSTGRES_INDEX}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    statements = {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def index_existing(apps, schema_editor):
+    # Same documents as api.search.index_partners and index_events
+    Partner = apps.get_model('api', 'Partner')
+    Event = apps.get_model('api', 'Event')
+    SearchEntry = apps.get_model('api', 'SearchEntry')
+
+    partners = Partner.objects.select_related('individual').prefetch_related('tags', 'resources').iterator(chunk_size=500)
+    entries = []
+    for partner in partners:
+        individual = partner.individual
+        parts = [partner.description, partner.email, individual.first_name, individual.last_name, individual.email]
+        parts.extend(tag.name for tag in partner.tags.all())
+        parts.extend(resource.name for resource in partner.resources.all())
+        entries.append(SearchEntry(organization_id=partner.organization_id, partner_id=partner.pk, title=partner.name, text="\n".join(parts)))
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+    SearchEntry.objects.bulk_create([SearchEntry(organization_id=event.organization_id, event_id=event.pk, title=event.name, text=event.description) for event in Event.objects.iterator(chunk_size=500)], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_tag_org_name_unique'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=64)),
+                ('text', models.TextField(blank=True)),
+                ('event', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='api.event')),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.organization')),
+                ('partner', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='api.partner')),
+            ],
+        ),
+        migrations.RunPython(create_index, drop_index),
+        migrations.RunPython(index_existing, migrations.RunPython.noop),
+    ]
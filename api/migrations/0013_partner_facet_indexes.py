@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='partner',
+            index=models.Index(fields=['organization', 'type'], name='partner_org_type_idx'),
+        ),
+        # The auto-created tags through-table has no model to declare it on, partners by tag for filters and facet counts
+        migrations.RunSQL(
+            'CREATE INDEX partner_tags_tag_partner_idx ON api_partner_tags (tag_id, partner_id)',
+            'DROP INDEX partner_tags_tag_partner_idx',
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def build_rollups(apps, schema_editor):
+    # Same aggregation as api.rollups.compute_rollups
+    Resource = apps.get_model('api', 'Resource')
+    ResourceRollup = apps.get_model('api', 'ResourceRollup')
+
+    rows = Resource.objects.values_list('partner__organization_id', 'type', 'partner__type').annotate(amount=Sum('amount'), resources=Count('pk')).order_by()
+    ResourceRollup.objects.bulk_create([ResourceRollup(organization_id=organization, resource_type=resource_type, partner_type=partner_type, amount=amount, resources=count) for organization, resource_type, partner_type, amount, count in rows], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_partner_facet_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resource_type', models.IntegerField()),
+                ('partner_type', models.IntegerField()),
+                ('amount', models.BigIntegerField(default=0)),
+                ('resources', models.IntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.organization')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('organization', 'resource_type', 'partner_type'), name='rollup_org_types_unique')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
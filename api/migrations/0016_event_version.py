@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_event_date_window_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='organization',
+            name='event_version',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_event_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardSnapshot',
+            fields=[
+                ('organization', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.organization')),
+                ('build_date', models.DateTimeField()),
+                ('data', models.JSONField(default=dict)),
+                ('events_dirty', models.BooleanField(default=True)),
+                ('partners_dirty', models.BooleanField(default=True)),
+                ('organization_dirty', models.BooleanField(default=True)),
+            ],
+        ),
+    ]
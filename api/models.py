@@ -9,10 +9,24 @@ class Organization(models.Model):
     message = models.TextField(null=True, blank=False)
     message_title = models.TextField(null=True, blank=False)
     message_icon = models.IntegerField(null=True, blank=False) # 0 = red/warning
+    version = models.IntegerField(null=False, blank=False, default=0) # bumped on every modification, see api.cache
+    event_version = models.IntegerField(null=False, blank=False, default=0) # bumped on every change to events or their partners, see api.feeds
 
     def __str__(self):
         return f"{self.name}"
 
+class Blob(models.Model):
+    # Content-addressed file stored once on disk under its hash, see api.blobs
+    creation_date = models.DateTimeField(auto_now_add=True)
+    sha256 = models.CharField(null=False, blank=False, unique=True, max_length=64)
+    content_type = models.CharField(null=False, blank=False, max_length=64)
+    size = models.IntegerField(null=False, blank=False)
+    width = models.IntegerField(null=True, blank=False)
+    height = models.IntegerField(null=True, blank=False)
+
+    def __str__(self):
+        return f"{self.sha256} | {self.content_type} | {self.width}x{self.height}"
+
 class User(models.Model):
     def generate_hash():
         # Derived from https://stackoverflow.com/a/67546412
@@ -36,9 +50,15 @@ class User(models.Model):
     last_name = models.CharField(null=False, blank=False, max_length=64)
     role = models.IntegerField(null=False, blank=False, default=2) # 0 = owner, 1 = admin, 2 = user
     # profile_picture = models.ImageField(null=True, blank=True)
-    profile_picture = models.TextField(null=True, blank=False)
+    profile_picture = models.TextField(null=True, blank=False) # legacy base64, moved to profile_picture_blob by migrate_images
+    profile_picture_blob = models.ForeignKey(Blob, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of users, see api.pagination
+            models.Index(fields=["organization", "creation_date", "id"], name="user_org_creation_idx"),
+        ]
 
     def __str__(self):
         return f"{self.username} | {self.first_name} {self.last_name} | {self.organization.name}"
@@ -46,6 +66,7 @@ class User(models.Model):
 class Individual(models.Model):
     is_deleted = models.BooleanField(null=False, blank=False, default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     first_name = models.CharField(null=False, blank=False, max_length=64)
     last_name = models.CharField(null=False, blank=False, max_length=64)
     email = models.CharField(null=False, blank=False, max_length=64)
@@ -57,29 +78,48 @@ class Individual(models.Model):
 class Tag(models.Model):
     is_deleted = models.BooleanField(null=False, blank=False, default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     name = models.CharField(null=False, blank=False, max_length=64)
     color_red = models.IntegerField(null=False, blank=False)
     color_blue = models.IntegerField(null=False, blank=False)
     color_green = models.IntegerField(null=False, blank=False)
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
 
+    class Meta:
+        constraints = [
+            # One tag per name in an organization, see api.tags
+            models.UniqueConstraint(fields=["organization", "name"], name="tag_org_name_unique"),
+        ]
+
     def __str__(self):
         return f"{self.name} | ({self.color_red}, {self.color_green}, {self.color_blue})"
 
 class Partner(models.Model):
     is_deleted = models.BooleanField(null=False, blank=False, default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     name = models.CharField(null=False, blank=False, max_length=64)
     description = models.TextField(null=False, blank=False)
     type = models.IntegerField(null=False, blank=False) # 0 = business, 1 = community, 2 = education, 3 = other
     email = models.CharField(null=False, blank=False, max_length=64)
     phone = models.CharField(null=False, blank=False, max_length=64)
     # image = models.ImageField(null=True, blank=True)
-    image = models.TextField(null=True, blank=False)
+    image = models.TextField(null=True, blank=False) # legacy base64, moved to image_blob by migrate_images
+    image_blob = models.ForeignKey(Blob, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
     individual = models.OneToOneField(Individual, on_delete=models.CASCADE, null=False, blank=False)
     tags = models.ManyToManyField(Tag)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of partners, see api.pagination
+            models.Index(fields=["organization", "creation_date", "id"], name="partner_org_creation_idx"),
+            # Type filter and facet counts, see api.facets
+            models.Index(fields=["organization", "type"], name="partner_org_type_idx"),
+            # Delta sync, see api.deltas
+            models.Index(fields=["organization", "updated_at"], name="partner_org_updated_idx"),
+        ]
+
     def __str__(self):
         tags = ""
 
@@ -94,6 +134,7 @@ class Partner(models.Model):
 class Resource(models.Model):
     is_deleted = models.BooleanField(null=False, blank=False, default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     type = models.IntegerField(null=False, blank=False) # 0 = financial, 1 = human, 2 = physical, 3 = other
     name = models.CharField(null=False, blank=False, max_length=64)
     amount = models.IntegerField(null=False, blank=False)
@@ -105,6 +146,7 @@ class Resource(models.Model):
 class Event(models.Model):
     is_deleted = models.BooleanField(null=False, blank=False, default=False)
     creation_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     name = models.CharField(null=False, blank=False, unique=True, max_length=64)
     description = models.TextField(null=False, blank=False)
     date = models.DateField(null=False, blank=False)
@@ -113,6 +155,16 @@ class Event(models.Model):
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
     partners = models.ManyToManyField(Partner)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of events, see api.pagination
+            models.Index(fields=["organization", "date", "id"], name="event_org_date_idx"),
+            # Date windows and the calendar, see api.windows
+            models.Index(fields=["organization", "date", "start_time"], name="event_org_date_time_idx"),
+            # Delta sync, see api.deltas
+            models.Index(fields=["organization", "updated_at"], name="event_org_updated_idx"),
+        ]
+
     def __str__(self):
         partners = ""
 
@@ -122,4 +174,76 @@ class Event(models.Model):
         if partners:
             partners = partners[:-2]
 
-        return f"{self.name} | {partners if partners else 'No Partners'}"
\ No newline at end of file
+        return f"{self.name} | {partners if partners else 'No Partners'}"
+
+class TokenRevocation(models.Model):
+    # Signed session tokens issued to this user before creation_date are no longer accepted
+    creation_date = models.DateTimeField(auto_now_add=True)
+    user_id = models.BigIntegerField(null=False, blank=False, db_index=True)
+
+    def __str__(self):
+        return f"{self.user_id} | {self.creation_date}"
+
+class SearchEntry(models.Model):
+    # Denormalized search document of one partner or event, indexed by FTS5 on SQLite and GIN on Postgres, see api.search
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
+    partner = models.OneToOneField(Partner, on_delete=models.CASCADE, null=True, blank=True, related_name="search_entry")
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, null=True, blank=True, related_name="search_entry")
+    title = models.CharField(null=False, blank=False, max_length=64)
+    text = models.TextField(null=False, blank=True)
+
+    def __str__(self):
+        return f"{self.title} | {'Partner' if self.partner_id else 'Event'}"
+
+class ResourceRollup(models.Model):
+    # Running totals of resources per organization, resource type and partner type, kept up to date by api.rollups
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
+    resource_type = models.IntegerField(null=False, blank=False)
+    partner_type = models.IntegerField(null=False, blank=False)
+    amount = models.BigIntegerField(null=False, blank=False, default=0)
+    resources = models.IntegerField(null=False, blank=False, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["organization", "resource_type", "partner_type"], name="rollup_org_types_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} | {self.resource_type} | {self.partner_type} | {self.amount}"
+
+class DashboardSnapshot(models.Model):
+    # Materialized dashboard of an organization, sections flagged dirty by writes are rebuilt on the next read, see api.snapshots
+    organization = models.OneToOneField(Organization, on_delete=models.CASCADE, primary_key=True)
+    build_date = models.DateTimeField(null=False, blank=False)
+    data = models.JSONField(null=False, blank=False, default=dict)
+    events_dirty = models.BooleanField(null=False, blank=False, default=True)
+    partners_dirty = models.BooleanField(null=False, blank=False, default=True)
+    organization_dirty = models.BooleanField(null=False, blank=False, default=True)
+
+    def __str__(self):
+        return f"{self.organization_id} | {self.build_date}"
+
+class FeedToken(models.Model):
+    # Read-only access to the iCalendar feed, meant to be stored by calendar services instead of a session credential, see api.feeds
+    creation_date = models.DateTimeField(auto_now_add=True)
+    digest = models.CharField(null=False, blank=False, unique=True, max_length=64) # SHA-256 of the token, the token itself is only shown once
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=False, blank=False)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
+
+    def __str__(self):
+        return f"{self.organization_id} | {self.user_id} | {self.creation_date}"
+
+class Tombstone(models.Model):
+    # Left behind by a deleted partner or event so delta syncs can report it, pruned once no sync cursor can predate it
+    deletion_date = models.DateTimeField(auto_now_add=True)
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, null=False, blank=False)
+    kind = models.IntegerField(null=False, blank=False) # 0 = partner, 1 = event
+    object_id = models.BigIntegerField(null=False, blank=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["organization", "deletion_date"], name="tombstone_org_deletion_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.organization_id} | {'Partner' if self.kind == 0 else 'Event'} {self.object_id} | {self.deletion_date}"
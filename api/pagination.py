@@ -0,0 +1,91 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+# Keyset orderings, the last key is always unique so every row has a distinct position
+CREATION_ORDER = ("creation_date", "pk")
+EVENT_ORDER = ("date", "pk")
+
+class InvalidPage(Exception):
+    pass
+
+def wants_page(request):
+    return "limit" in request.query_params or "cursor" in request.query_params
+
+def encode_cursor(values):
+    values = [value.isoformat() if hasattr(value, "isoformat") else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode("utf-8")).decode("ascii").rstrip("=")
+
+def load_cursor(cursor, length):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise InvalidPage()
+
+    if not isinstance(values, list) or len(values) != length:
+        raise InvalidPage()
+    return values
+
+def decode_cursor(cursor, model, keys):
+    values = load_cursor(cursor, len(keys))
+
+    try:
+        return [(model._meta.pk if key == "pk" else model._meta.get_field(key)).to_python(value) for key, value in zip(keys, values)]
+    except ValidationError:
+        raise InvalidPage()
+
+def after(keys, values):
+    """
+    Building the filter for rows strictly after a position, (a, b) > (x, y) = a > x or (a = x and b > y)
+    """
+    condition = Q()
+    for i, key in enumerate(keys):
+        condition |= Q(**{key: value for key, value in zip(keys[:i], values[:i])}, **{f"{key}__gt": values[i]})
+    return condition
+
+def page_limit(request):
+    try:
+        limit = int(request.query_params.get("limit") or settings.API_PAGE_SIZE)
+    except ValueError:
+        raise InvalidPage()
+    return max(1, min(limit, settings.API_PAGE_SIZE_MAX))
+
+def page_offset(request):
+    """
+    Reading the offset of a page of ranked results, which have no keys to continue from
+    """
+    cursor = request.query_params.get("cursor", "")
+    if not cursor:
+        return 0
+
+    offset = load_cursor(cursor, 1)[0]
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidPage()
+    return offset
+
+def paginate(request, queryset, keys):
+    """
+    Returning one page of a queryset ordered by keys and the cursor of the next page
+    """
+    limit = page_limit(request)
+
+    queryset = queryset.order_by(*keys)
+
+    # Sparse fieldsets load only some columns, the cursor still needs the ordering keys
+    loaded, deferred = queryset.query.deferred_loading
+    if loaded and not deferred:
+        queryset = queryset.only(*loaded, *[key for key in keys if key != "pk"])
+
+    cursor = request.query_params.get("cursor", "")
+    if cursor:
+        queryset = queryset.filter(after(keys, decode_cursor(cursor, queryset.model, keys)))
+
+    # One extra row tells whether there is a next page
+    rows = list(queryset[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], key) for key in keys])
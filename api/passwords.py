@@ -0,0 +1,57 @@
+import itertools
+import threading
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+
+# bcrypt releases the GIL while it works, so threads run hashes in parallel on separate cores.
+# The small request pool bounds how many cores logins can take at once, callers still wait for their own hash.
+# Bulk provisioning gets a pool of its own sized to the machine, so logins never queue behind a batch.
+_executors = {}
+_executor_lock = threading.Lock()
+
+def get_executor(pool="PASSWORD_HASH_WORKERS"):
+    executor = _executors.get(pool)
+    if executor is None:
+        with _executor_lock:
+            executor = _executors.get(pool)
+            if executor is None:
+                executor = _executors[pool] = ThreadPoolExecutor(max_workers=getattr(settings, pool), thread_name_prefix=pool.lower())
+    return executor
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(bytes(password, "utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+def _check(password, hashed):
+    try:
+        return bcrypt.checkpw(bytes(password, "utf-8"), bytes(hashed, "utf-8"))
+    except ValueError:
+        # Malformed stored hash or a password bcrypt refuses to handle
+        return False
+
+def hash_password(password):
+    """
+    Hashing a password on the worker pool with the configured cost
+    """
+    return get_executor().submit(_hash, password, settings.PASSWORD_HASH_ROUNDS).result()
+
+def hash_passwords(passwords):
+    """
+    Hashing many passwords in parallel on the provisioning pool, keeping their order
+    """
+    return list(get_executor("PASSWORD_PROVISION_WORKERS").map(_hash, passwords, itertools.repeat(settings.PASSWORD_HASH_ROUNDS)))
+
+def check_password(password, hashed):
+    """
+    Verifying a password against a stored hash on the worker pool
+    """
+    return get_executor().submit(_check, password, hashed).result()
+
+def needs_rehash(hashed):
+    """
+    Checking whether a stored hash was made with a different cost than the configured one
+    """
+    try:
+        return int(hashed.split("$")[2]) != settings.PASSWORD_HASH_ROUNDS
+    except (IndexError, ValueError):
+        return False
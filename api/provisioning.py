@@ -0,0 +1,106 @@
+import csv
+import io
+import itertools
+import json
+from django.db import transaction
+from .models import User
+from .passwords import hash_passwords
+from .utils import generate_random_string, is_valid_email
+
+USER_FIELDS = ["username", "password", "email", "first_name", "last_name", "role"]
+
+# Keeps IN (...) lists well under the parameter limits of SQLite and Postgres
+LOOKUP_CHUNK_SIZE = 500
+
+def parse_users(data):
+    """
+    Parsing a list of users given as parsed JSON, a JSON string, CSV text or an uploaded file
+    """
+    if hasattr(data, "read"):
+        data = data.read()
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    if isinstance(data, str):
+        stripped = data.strip()
+        if stripped.startswith("["):
+            data = json.loads(stripped)
+        else:
+            data = list(csv.DictReader(io.StringIO(stripped)))
+    if not isinstance(data, list):
+        raise ValueError("Expected a list of users")
+    return data
+
+def chunks(values, size=LOOKUP_CHUNK_SIZE):
+    # Works on any iterable, including generators that are never loaded whole
+    values = iter(values)
+    while chunk := list(itertools.islice(values, size)):
+        yield chunk
+
+def generate_user_hashes(count):
+    """
+    Generating unique user hashes, checking each batch of candidates with one query
+    """
+    hashes = set()
+    while len(hashes) < count:
+        candidates = {generate_random_string(64) for i in range(count - len(hashes))} - hashes
+        taken = set()
+        for chunk in chunks(candidates):
+            taken.update(User.objects.filter(user_hash__in=chunk).values_list("user_hash", flat=True))
+        hashes |= candidates - taken
+    return list(hashes)
+
+def provision_users(organization_id, rows):
+    """
+    Creating many users at once, returns the created users and a list of per-row errors
+    """
+    errors = []
+    valid = []
+    seen = set()
+
+    # Validate every row in memory first
+    for index, row in enumerate(rows, start=1):
+        if not isinstance(row, dict):
+            errors.append({"row": index, "username": "", "error": "invalid_row"})
+            continue
+
+        row = {field: str(row.get(field) or "").strip() for field in USER_FIELDS}
+        username = row["username"]
+
+        if not all(row.values()):
+            errors.append({"row": index, "username": username, "error": "missing_fields"})
+        elif not is_valid_email(row["email"]):
+            errors.append({"row": index, "username": username, "error": "invalid_email"})
+        elif row["role"] not in ["0", "1", "2"]:
+            errors.append({"row": index, "username": username, "error": "invalid_role"})
+        elif username in seen:
+            errors.append({"row": index, "username": username, "error": "duplicate_username"})
+        else:
+            seen.add(username)
+            valid.append((index, row))
+
+    # Check every username against the database
+    taken = set()
+    for chunk in chunks(seen):
+        taken.update(User.objects.filter(username__in=chunk).values_list("username", flat=True))
+
+    if taken:
+        errors.extend({"row": index, "username": row["username"], "error": "username_taken"} for index, row in valid if row["username"] in taken)
+        valid = [(index, row) for index, row in valid if row["username"] not in taken]
+
+    errors.sort(key=lambda error: error["row"])
+
+    if not valid:
+        return [], errors
+
+    # Hash passwords in parallel and generate hashes without a query per row
+    passwords = hash_passwords([row["password"] for index, row in valid])
+    user_hashes = generate_user_hashes(len(valid))
+
+    new_users = []
+    for (index, row), password, user_hash in zip(valid, passwords, user_hashes):
+        new_users.append(User(user_hash=user_hash, username=row["username"], password=password, email=row["email"], first_name=row["first_name"], last_name=row["last_name"], role=int(row["role"]), organization_id=organization_id))
+
+    with transaction.atomic():
+        created = User.objects.bulk_create(new_users)
+
+    return created, errors
@@ -0,0 +1,218 @@
+import datetime
+import threading
+from collections import OrderedDict
+import numpy
+from django.conf import settings
+from django.db.models import Prefetch
+from django.utils import timezone
+from .deltas import CURSOR_OVERLAP, TOMBSTONE_PARTNER
+from .models import Tag, Partner, Resource, Tombstone
+from .search import search_terms
+
+# Words too common to tell partners apart
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of", "on", "or", "the", "to", "with"}
+
+# Partner indexes kept per process, the least recently used one is dropped past this
+INDEX_CACHE_SIZE = 32
+
+# Per-process partner indexes, least recently used first: organization pk -> PartnerIndex
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def terms_of(text):
+    return [term for term in search_terms(text) if term not in STOPWORDS and len(term) > 1]
+
+def partner_terms(partner):
+    """
+    Terms a partner is matched on: its description, tags and resources
+    """
+    parts = [partner.description]
+    parts.extend(tag.name for tag in partner.tags.all())
+    parts.extend(resource.name for resource in partner.resources.all())
+    return terms_of(" ".join(parts))
+
+def event_terms(event):
+    return terms_of(f"{event.name} {event.description}")
+
+class PartnerIndex:
+    """
+    Term counts of an organization's partners as (row, term, count) arrays, scored as TF-IDF cosine similarity
+
+    A changed partner gets a new row and its old one is dropped, rows are compacted once half of them are dead.
+    Weights and norms are prepared once after a change, a query then only reads the entries of its own terms.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.synced = None
+        self.vocabulary = {}
+        self.rows = numpy.zeros(0, dtype=numpy.int32)
+        self.terms = numpy.zeros(0, dtype=numpy.int32)
+        self.counts = numpy.zeros(0, dtype=numpy.float32)
+        self.live = numpy.zeros(0, dtype=bool)
+        self.partner_ids = []
+        self.names = []
+        self.row_of = {}
+        self.prepared = None
+
+    def remove(self, partner_ids):
+        for partner_id in partner_ids:
+            row = self.row_of.pop(partner_id, None)
+            if row is not None:
+                self.live[row] = False
+                self.prepared = None
+
+    def add(self, partners):
+        """
+        Indexing partners as new rows, replacing the rows they already had
+        """
+        partners = list(partners)
+        if not partners:
+            return
+        self.remove(partner.pk for partner in partners)
+        self.prepared = None
+
+        rows, terms, counts = [], [], []
+        first = len(self.partner_ids)
+        for offset, partner in enumerate(partners):
+            row = first + offset
+            self.partner_ids.append(partner.pk)
+            self.names.append(partner.name)
+            self.row_of[partner.pk] = row
+
+            frequencies = {}
+            for term in partner_terms(partner):
+                term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+                frequencies[term_id] = frequencies.get(term_id, 0) + 1
+            rows.extend([row] * len(frequencies))
+            terms.extend(frequencies)
+            counts.extend(frequencies.values())
+
+        self.rows = numpy.concatenate([self.rows, numpy.array(rows, dtype=numpy.int32)])
+        self.terms = numpy.concatenate([self.terms, numpy.array(terms, dtype=numpy.int32)])
+        self.counts = numpy.concatenate([self.counts, numpy.array(counts, dtype=numpy.float32)])
+        self.live = numpy.concatenate([self.live, numpy.ones(len(partners), dtype=bool)])
+
+        if len(self.row_of) * 2 < len(self.partner_ids):
+            self.compact()
+
+    def compact(self):
+        """
+        Dropping dead rows and renumbering the live ones
+        """
+        kept = numpy.flatnonzero(self.live)
+        renumber = numpy.full(len(self.live), -1, dtype=numpy.int32)
+        renumber[kept] = numpy.arange(len(kept), dtype=numpy.int32)
+
+        entries = self.live[self.rows]
+        self.rows = renumber[self.rows[entries]]
+        self.terms = self.terms[entries]
+        self.counts = self.counts[entries]
+        self.live = numpy.ones(len(kept), dtype=bool)
+        self.partner_ids = [self.partner_ids[row] for row in kept]
+        self.names = [self.names[row] for row in kept]
+        self.row_of = {partner_id: row for row, partner_id in enumerate(self.partner_ids)}
+
+    def prepare(self):
+        """
+        TF-IDF weights of the live entries grouped by term, with the norm of every row
+        """
+        entries = self.live[self.rows]
+        rows, term_ids, counts = self.rows[entries], self.terms[entries], self.counts[entries]
+
+        # Smoothed inverse document frequency over the live partners
+        documents = numpy.bincount(term_ids, minlength=len(self.vocabulary))
+        idf = numpy.log((1 + len(self.row_of)) / (1 + documents)) + 1
+
+        weights = counts * idf[term_ids]
+        norms = numpy.sqrt(numpy.bincount(rows, weights=weights * weights, minlength=len(self.live)))
+
+        order = numpy.argsort(term_ids, kind="stable")
+        offsets = numpy.searchsorted(term_ids[order], numpy.arange(len(self.vocabulary) + 1))
+        self.prepared = (idf, norms, rows[order], weights[order], offsets)
+
+    def score(self, terms, limit):
+        """
+        Ranking the live partners against the terms, returns [(partner pk, name, score)] best first without zero scores
+        """
+        query = {}
+        for term in terms:
+            if term in self.vocabulary:
+                query[self.vocabulary[term]] = query.get(self.vocabulary[term], 0) + 1
+        if not query or not self.row_of:
+            return []
+
+        if self.prepared is None:
+            self.prepare()
+        idf, norms, rows, weights, offsets = self.prepared
+
+        # Only the entries of the query's terms contribute to the dot products
+        matched_rows = []
+        matched_weights = []
+        query_norm = 0.0
+        for term_id, count in query.items():
+            query_weight = count * idf[term_id]
+            query_norm += query_weight * query_weight
+            matched_rows.append(rows[offsets[term_id]:offsets[term_id + 1]])
+            matched_weights.append(weights[offsets[term_id]:offsets[term_id + 1]] * query_weight)
+
+        matched_rows = numpy.concatenate(matched_rows)
+        if not len(matched_rows):
+            return []
+        dots = numpy.bincount(matched_rows, weights=numpy.concatenate(matched_weights), minlength=len(self.live))
+
+        candidates = numpy.unique(matched_rows)
+        scores = dots[candidates] / (norms[candidates] * numpy.sqrt(query_norm))
+        if len(candidates) > limit:
+            best = numpy.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[best], scores[best]
+
+        ranked = sorted(zip(candidates.tolist(), scores.tolist()), key=lambda item: (-item[1], self.partner_ids[item[0]]))
+        return [(self.partner_ids[row], self.names[row], round(score, 4)) for row, score in ranked]
+
+def load_partners(queryset):
+    return queryset.only("pk", "name", "description").prefetch_related(
+        Prefetch("tags", queryset=Tag.objects.only("pk", "name")),
+        Prefetch("resources", queryset=Resource.objects.only("pk", "name", "partner_id")),
+    )
+
+def get_index(organization_id):
+    """
+    Retrieving the partner index of an organization, catching up on the partners changed or deleted since its last sync
+
+    Every partner write updates updated_at and every deletion leaves a tombstone, so a sync only reads what changed.
+    A full rebuild only happens on first use or once tombstones since the last sync may have been pruned.
+    """
+    with _indexes_lock:
+        index = _indexes.get(organization_id)
+        if index is None:
+            index = _indexes[organization_id] = PartnerIndex()
+        _indexes.move_to_end(organization_id)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+
+    with index.lock:
+        started = timezone.now()
+        partners = Partner.objects.filter(organization_id=organization_id)
+
+        if index.synced is None or started - index.synced > datetime.timedelta(seconds=settings.AI_SYNC_MAX_AGE):
+            index.reset()
+            index.add(load_partners(partners))
+        else:
+            # Writes committing during the last sync may carry an earlier updated_at
+            since = index.synced - CURSOR_OVERLAP
+            index.remove(Tombstone.objects.filter(organization_id=organization_id, kind=TOMBSTONE_PARTNER, deletion_date__gt=since).values_list("object_id", flat=True))
+            index.add(load_partners(partners.filter(updated_at__gt=since)))
+
+        index.synced = started
+        return index
+
+def recommend_partners(organization_id, event, limit):
+    """
+    Ranking an organization's partners for an event by the TF-IDF similarity of their texts
+    """
+    index = get_index(organization_id)
+    with index.lock:
+        return index.score(event_terms(event), limit)
@@ -0,0 +1,83 @@
+from django.db.models import BigIntegerField, Case, Count, F, IntegerField, Q, Sum, Value, When
+from .models import Resource, ResourceRollup
+
+def resource_rows(partner_type, resources):
+    """
+    Describing resources as (partner type, resource type, amount) rows, from model instances or dicts
+    """
+    rows = []
+    for resource in resources:
+        if isinstance(resource, dict):
+            rows.append((partner_type, resource["type"], resource["amount"]))
+        else:
+            rows.append((partner_type, resource.type, resource.amount))
+    return rows
+
+def update_rollups(organization_id, before, after):
+    """
+    Moving the rollups of an organization from the before rows to the after rows, only touching the buckets that changed
+
+    Must run in the same transaction as the resource writes it accounts for.
+    """
+    deltas = {}
+    for rows, sign in [(before, -1), (after, 1)]:
+        for partner_type, resource_type, amount in rows:
+            amount_delta, count_delta = deltas.get((resource_type, partner_type), (0, 0))
+            deltas[(resource_type, partner_type)] = (amount_delta + sign * amount, count_delta + sign)
+
+    deltas = {key: delta for key, delta in deltas.items() if delta != (0, 0)}
+    if not deltas:
+        return
+
+    # Create missing buckets first so every change is a relative update, which concurrent writers can't lose
+    ResourceRollup.objects.bulk_create([ResourceRollup(organization_id=organization_id, resource_type=resource_type, partner_type=partner_type) for resource_type, partner_type in deltas], ignore_conflicts=True)
+
+    # Every bucket in a single UPDATE
+    buckets = Q()
+    amounts = []
+    counts = []
+    for (resource_type, partner_type), (amount_delta, count_delta) in deltas.items():
+        bucket = Q(resource_type=resource_type, partner_type=partner_type)
+        buckets |= bucket
+        amounts.append(When(bucket, then=Value(amount_delta)))
+        counts.append(When(bucket, then=Value(count_delta)))
+
+    ResourceRollup.objects.filter(buckets, organization_id=organization_id).update(
+        amount=F("amount") + Case(*amounts, default=Value(0), output_field=BigIntegerField()),
+        resources=F("resources") + Case(*counts, default=Value(0), output_field=IntegerField()),
+    )
+
+def compute_rollups(organization_id=None):
+    """
+    Aggregating the rollups from the raw resources, (organization, resource type, partner type) -> (amount, resources)
+    """
+    resources = Resource.objects.all()
+    if organization_id is not None:
+        resources = resources.filter(partner__organization_id=organization_id)
+
+    rows = resources.values_list("partner__organization_id", "type", "partner__type").annotate(amount=Sum("amount"), resources=Count("pk")).order_by()
+    return {(organization, resource_type, partner_type): (amount, count) for organization, resource_type, partner_type, amount, count in rows}
+
+def stored_rollups(organization_id=None):
+    """
+    Reading the maintained rollups, leaving out empty buckets
+    """
+    rollups = ResourceRollup.objects.exclude(amount=0, resources=0)
+    if organization_id is not None:
+        rollups = rollups.filter(organization_id=organization_id)
+
+    rows = rollups.values_list("organization_id", "resource_type", "partner_type", "amount", "resources")
+    return {(organization, resource_type, partner_type): (amount, count) for organization, resource_type, partner_type, amount, count in rows}
+
+def summarize_rollups(organization_id):
+    """
+    Rollups of an organization per resource and partner type, with totals per resource type
+    """
+    rows = []
+    totals = {}
+    for (organization, resource_type, partner_type), (amount, count) in sorted(stored_rollups(organization_id).items()):
+        rows.append({"resource_type": resource_type, "partner_type": partner_type, "amount": amount, "resources": count})
+        total = totals.setdefault(str(resource_type), {"amount": 0, "resources": 0})
+        total["amount"] += amount
+        total["resources"] += count
+    return {"rollups": rows, "resource_types": totals}
@@ -0,0 +1,84 @@
+import datetime
+from .models import Event
+
+# Longest range the free slot finder sweeps, in days
+MAX_SLOT_DAYS = 92
+
+DAY_MINUTES = 24 * 60
+
+# Event fields whose change can make partners double booked
+SCHEDULE_FIELDS = ["date", "start_time", "end_time", "partners"]
+
+def to_minutes(time):
+    return time.hour * 60 + time.minute
+
+def from_minutes(minutes):
+    """
+    Formatting minutes since midnight as HH:MM, the end of the day being 24:00
+    """
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def find_conflicts(organization_id, date, start_time, end_time, partner_ids, exclude=None):
+    """
+    Finding the events booking any of the partners in an overlapping interval, partner -> [event]
+
+    One range scan over event_org_date_time_idx, whatever the number of events in the organization.
+    """
+    if not partner_ids:
+        return {}
+
+    EventPartners = Event.partners.through
+    bookings = EventPartners.objects.filter(
+        partner_id__in=partner_ids,
+        event__organization_id=organization_id,
+        event__date=date,
+        event__start_time__lt=end_time,
+        event__end_time__gt=start_time,
+    )
+    if exclude is not None:
+        bookings = bookings.exclude(event_id=exclude)
+
+    conflicts = {}
+    for partner_id, pk, name, start, end in bookings.values_list("partner_id", "event_id", "event__name", "event__start_time", "event__end_time").order_by("partner_id", "event__start_time", "event_id"):
+        conflicts.setdefault(partner_id, []).append({"pk": pk, "name": name, "date": date.isoformat(), "start_time": start.isoformat("minutes"), "end_time": end.isoformat("minutes")})
+    return conflicts
+
+def busy_intervals(organization_id, partner_ids, start_date, end_date):
+    """
+    Intervals in which any of the partners is booked, sorted by date and start by the database
+    """
+    EventPartners = Event.partners.through
+    bookings = EventPartners.objects.filter(partner_id__in=partner_ids, event__organization_id=organization_id, event__date__gte=start_date, event__date__lte=end_date)
+    return bookings.values_list("event__date", "event__start_time", "event__end_time").order_by("event__date", "event__start_time").distinct()
+
+def free_slots(organization_id, partner_ids, start_date, end_date, day_start, day_end, duration):
+    """
+    Sweeping the sorted busy intervals once, returning the gaps of at least duration minutes within each day's hours
+    """
+    slots = []
+
+    def add_slot(date, start, end):
+        if end - start >= max(duration, 1):
+            slots.append({"date": date.isoformat(), "start_time": from_minutes(start), "end_time": from_minutes(end)})
+
+    date = start_date
+    cursor = day_start
+    for busy_date, busy_start, busy_end in busy_intervals(organization_id, partner_ids, start_date, end_date):
+        # Close the days before this interval
+        while date < busy_date:
+            add_slot(date, cursor, day_end)
+            date += datetime.timedelta(days=1)
+            cursor = day_start
+
+        start = max(to_minutes(busy_start), day_start)
+        end = min(to_minutes(busy_end), day_end)
+        if start > cursor:
+            add_slot(date, cursor, min(start, day_end))
+        cursor = max(cursor, end)
+
+    while date <= end_date:
+        add_slot(date, cursor, day_end)
+        date += datetime.timedelta(days=1)
+        cursor = day_start
+
+    return slots
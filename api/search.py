@@ -0,0 +1,93 @@
+import re
+from django.db import connection
+from django.db.models import Prefetch, Q
+from .models import Partner, Event, Tag, Resource, SearchEntry
+
+# Must match the expression of the GIN index created by migration 0012 for Postgres to use it
+POSTGRES_DOCUMENT = "setweight(to_tsvector('simple', e.title), 'A') || setweight(to_tsvector('simple', e.text), 'B')"
+
+# Names weigh more than the rest of the document, the organization column only scopes the match
+FTS_WEIGHTS = "10.0, 1.0, 0.0"
+
+SEARCH_KINDS = ["partners", "events"]
+
+def partner_document(partner):
+    """
+    Text a partner can be found by besides its name
+    """
+    individual = partner.individual
+    parts = [partner.description, partner.email, individual.first_name, individual.last_name, individual.email]
+    parts.extend(tag.name for tag in partner.tags.all())
+    parts.extend(resource.name for resource in partner.resources.all())
+    return "\n".join(parts)
+
+def index_partners(pks):
+    """
+    Writing the search entries of partners, in a fixed number of queries however many there are
+    """
+    partners = Partner.objects.filter(pk__in=pks).select_related("individual").prefetch_related(
+        Prefetch("tags", queryset=Tag.objects.only("pk", "name")),
+        Prefetch("resources", queryset=Resource.objects.only("pk", "name", "partner_id")),
+    )
+    entries = [SearchEntry(organization_id=partner.organization_id, partner=partner, title=partner.name, text=partner_document(partner)) for partner in partners]
+    SearchEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=["partner"], update_fields=["title", "text"])
+
+def index_events(pks):
+    """
+    Writing the search entries of events
+    """
+    events = Event.objects.filter(pk__in=pks).only("pk", "name", "description", "organization_id")
+    entries = [SearchEntry(organization_id=event.organization_id, event=event, title=event.name, text=event.description) for event in events]
+    SearchEntry.objects.bulk_create(entries, update_conflicts=True, unique_fields=["event"], update_fields=["title", "text"])
+
+def search_terms(query):
+    return re.findall(r"\w+", query.lower())
+
+def search(organization_id, query, kinds, limit, offset):
+    """
+    Returning ranked (kind, pk, name) matches for the query, every term matched as a prefix
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    kind_filter = ""
+    if kinds == ["partners"]:
+        kind_filter = "AND e.partner_id IS NOT NULL"
+    elif kinds == ["events"]:
+        kind_filter = "AND e.event_id IS NOT NULL"
+
+    if connection.vendor == "sqlite":
+        match = f"organization_id : {int(organization_id)} AND " + " AND ".join(f'"{term}"*' for term in terms)
+        sql = f"""
+            SELECT e.partner_id, e.event_id, e.title FROM api_searchentry_fts
+            JOIN api_searchentry e ON e.id = api_searchentry_fts.rowid
+            WHERE api_searchentry_fts MATCH %s {kind_filter}
+            ORDER BY bm25(api_searchentry_fts, {FTS_WEIGHTS}), e.id LIMIT %s OFFSET %s
+        """
+        params = [match, limit, offset]
+    elif connection.vendor == "postgresql":
+        sql = f"""
+            SELECT e.partner_id, e.event_id, e.title FROM api_searchentry e, to_tsquery('simple', %s) query
+            WHERE e.organization_id = %s AND ({POSTGRES_DOCUMENT}) @@ query {kind_filter}
+            ORDER BY ts_rank({POSTGRES_DOCUMENT}, query) DESC, e.id LIMIT %s OFFSET %s
+        """
+        params = [" & ".join(f"{term}:*" for term in terms), organization_id, limit, offset]
+    else:
+        # No full-text index on other databases, every term has to appear somewhere
+        entries = SearchEntry.objects.filter(organization_id=organization_id)
+        for term in terms:
+            entries = entries.filter(Q(title__icontains=term) | Q(text__icontains=term))
+        if kind_filter:
+            entries = entries.filter(**{"partner__isnull" if kinds == ["partners"] else "event__isnull": False})
+        rows = entries.order_by("pk").values_list("partner_id", "event_id", "title")[offset:offset + limit]
+        return [search_result(*row) for row in rows]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [search_result(*row) for row in cursor.fetchall()]
+
+def search_result(partner_id, event_id, title):
+    if partner_id is not None:
+        return {"kind": "partner", "pk": partner_id, "name": title}
+    return {"kind": "event", "pk": event_id, "name": title}
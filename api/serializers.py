@@ -1,32 +1,147 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from .models import Organization, User, Individual, Tag, Partner, Resource, Event
+from .cache import get_organization_data
+from .blobs import blob_url
+from .images import VARIANT_SIZES
+
+def get_sparse_fields(request):
+    """
+    Reading the comma separated fields= and exclude= query parameters
+    """
+    sparse = {}
+    for key in ["fields", "exclude"]:
+        names = [name.strip() for name in request.query_params.get(key, "").split(",") if name.strip()]
+        if names:
+            sparse[key] = names
+    return sparse
+
+class QueryPlanMixin:
+    """
+    Lets a serializer declare how its nested fields are loaded, so lists cost a fixed number of queries,
+    and accept fields/exclude so narrow requests only load the columns and relations they return
+    """
+    # Field name -> function adding the select_related/prefetch_related that field needs
+    query_plan = {}
+
+    def __init__(self, *args, fields=None, exclude=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or (exclude is not None and name in exclude):
+                self.fields.pop(name)
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, exclude=None):
+        if fields is None and exclude is None:
+            for plan in cls.query_plan.values():
+                queryset = plan(queryset)
+            return queryset
+
+        kept = cls(fields=fields, exclude=exclude).fields
+        for name, plan in cls.query_plan.items():
+            if name in kept:
+                queryset = plan(queryset)
+
+        # Load only the columns behind the remaining fields, many-valued relations come from their prefetch
+        columns = []
+        for field in kept.values():
+            if hasattr(field, "columns"):
+                columns.extend(field.columns)
+            elif not isinstance(field, serializers.ListSerializer) and field.source not in ["*", "pk"]:
+                columns.append(field.source)
+        return queryset.only(*columns or ["pk"])
+
+def prefetch_tags(queryset):
+    return queryset.prefetch_related(Prefetch("tags", queryset=Tag.objects.only("pk", "name", "color_red", "color_blue", "color_green")))
+
+def prefetch_resources(queryset):
+    return queryset.prefetch_related(Prefetch("resources", queryset=Resource.objects.only("pk", "type", "name", "amount", "partner_id")))
+
+def select_individual(queryset):
+    return queryset.select_related("individual")
+
+def prefetch_partners(queryset):
+    return queryset.prefetch_related(Prefetch("partners", queryset=Partner.objects.only("pk", "name")))
+
+def select_image(queryset):
+    return queryset.select_related("image_blob")
+
+def select_profile_picture(queryset):
+    return queryset.select_related("profile_picture_blob")
+
+######################################################################################################
 
 class OrganizationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Organization
         fields = ["name", "message", "message_title", "message_icon"]
 
+class CachedOrganizationField(serializers.Field):
+    """
+    Nested organization read from the per-process organization cache instead of the database
+    """
+    def __init__(self, **kwargs):
+        kwargs["source"] = "organization_id"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+        self.columns = ["organization_id"]
+
+    def to_representation(self, value):
+        # Rows of one response nearly always share an organization, so only look it up once
+        organizations = self.__dict__.setdefault("_organizations", {})
+        if value not in organizations:
+            organizations[value] = get_organization_data(value)
+        return organizations[value]
+
+class BlobImageField(serializers.Field):
+    """
+    Image served from the blob store as its URL, dimensions and resized variants,
+    rows not yet moved by migrate_images keep their base64
+    """
+    def __init__(self, blob_field, legacy_field, **kwargs):
+        self.blob_field = blob_field
+        self.legacy_field = legacy_field
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+        self.columns = [blob_field, legacy_field]
+
+    def to_representation(self, instance):
+        blob = getattr(instance, self.blob_field)
+        if blob is None:
+            return getattr(instance, self.legacy_field) or None
+        data = {"url": blob_url(blob), "width": blob.width, "height": blob.height}
+        if blob.width is not None:
+            data["variants"] = {size: blob_url(blob, size) for size in VARIANT_SIZES}
+        return data
+
 ######################################################################################################
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(QueryPlanMixin, serializers.ModelSerializer):
     # profile_picture = serializers.ImageField(required=False)
-    organization = OrganizationSerializer(read_only=True)
+    profile_picture = BlobImageField("profile_picture_blob", "profile_picture")
+    organization = CachedOrganizationField()
 
     class Meta:
         model = User
         fields = ["user_hash", "username", "email", "first_name", "last_name", "role", "creation_date", "profile_picture", "organization"]
 
-class UserAdminSerializer(serializers.ModelSerializer):
+    query_plan = {"profile_picture": select_profile_picture}
+
+class UserAdminSerializer(QueryPlanMixin, serializers.ModelSerializer):
     # profile_picture = serializers.ImageField(required=False)
+    profile_picture = BlobImageField("profile_picture_blob", "profile_picture")
 
     class Meta:
         model = User
         fields = ["pk", "username", "email", "first_name", "last_name", "role", "creation_date", "profile_picture"]
 
+    query_plan = {"profile_picture": select_profile_picture}
+
 ######################################################################################################
 
 class TagSerializer(serializers.ModelSerializer):
-    organization = OrganizationSerializer(read_only=True)
+    organization = CachedOrganizationField()
 
     class Meta:
         model = Tag
@@ -52,7 +167,7 @@ class ResourcePartnerSerializer(serializers.ModelSerializer):
 ######################################################################################################
 
 class IndividualSerializer(serializers.ModelSerializer):
-    organization = OrganizationSerializer(read_only=True)
+    organization = CachedOrganizationField()
 
     class Meta:
         model = Individual
@@ -65,9 +180,10 @@ class IndividualPartnerSerializer(serializers.ModelSerializer):
 
 ######################################################################################################
 
-class PartnerSerializer(serializers.ModelSerializer):
+class PartnerSerializer(QueryPlanMixin, serializers.ModelSerializer):
     # image = serializers.ImageField(required=False)
-    organization = OrganizationSerializer(read_only=True)
+    image = BlobImageField("image_blob", "image")
+    organization = CachedOrganizationField()
     tags = TagPartnerSerializer(read_only=True, many=True)
     resources = ResourcePartnerSerializer(read_only=True, many=True)
     individual = IndividualPartnerSerializer(read_only=True)
@@ -76,6 +192,8 @@ class PartnerSerializer(serializers.ModelSerializer):
         model = Partner
         fields = ["pk", "name", "description", "type", "email", "phone", "image", "organization", "individual", "tags", "resources"]
 
+    query_plan = {"image": select_image, "individual": select_individual, "tags": prefetch_tags, "resources": prefetch_resources}
+
 class PartnerEventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Partner
@@ -86,35 +204,43 @@ class PartnerIDSerializer(serializers.ModelSerializer):
         model = Partner
         fields = ["pk", "name"]
 
-class PartnerAISerializer(serializers.ModelSerializer):
+class PartnerAISerializer(QueryPlanMixin, serializers.ModelSerializer):
     tags = TagPartnerSerializer(read_only=True, many=True)
     resources = ResourcePartnerSerializer(read_only=True, many=True)
     individual = IndividualPartnerSerializer(read_only=True)
 
     class Meta:
         model = Partner
-        fields = ["name", "description", "type", "email", "phone", "individual", "tags", "resources"]
+        fields = ["pk", "name", "description", "type", "email", "phone", "individual", "tags", "resources"]
+
+    query_plan = {"individual": select_individual, "tags": prefetch_tags, "resources": prefetch_resources}
 
 ######################################################################################################
 
-class EventSerializer(serializers.ModelSerializer):
-    organization = OrganizationSerializer(read_only=True)
+class EventSerializer(QueryPlanMixin, serializers.ModelSerializer):
+    organization = CachedOrganizationField()
     partners = PartnerEventSerializer(read_only=True, many=True)
 
     class Meta:
         model = Event
         fields = ["pk", "name", "description", "date", "start_time", "end_time", "organization", "partners"]
 
-class EventDashboardSerializer(serializers.ModelSerializer):
+    query_plan = {"partners": prefetch_partners}
+
+class EventDashboardSerializer(QueryPlanMixin, serializers.ModelSerializer):
     partners = PartnerEventSerializer(read_only=True, many=True)
 
     class Meta:
         model = Event
         fields = ["pk", "name", "description", "date", "start_time", "end_time", "partners"]
 
-class EventAISerializer(serializers.ModelSerializer):
+    query_plan = {"partners": prefetch_partners}
+
+class EventAISerializer(QueryPlanMixin, serializers.ModelSerializer):
     partners = PartnerEventSerializer(read_only=True, many=True)
 
     class Meta:
         model = Event
-        fields = ["name", "description", "date", "start_time", "end_time", "partners"]
\ No newline at end of file
+        fields = ["pk", "name", "description", "date", "start_time", "end_time", "partners"]
+
+    query_plan = {"partners": prefetch_partners}
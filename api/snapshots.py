@@ -0,0 +1,72 @@
+import datetime
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+from .models import Organization, Partner, Event, DashboardSnapshot
+from .rollups import summarize_rollups
+
+# Upcoming events kept in a snapshot
+SNAPSHOT_EVENTS = 20
+
+SNAPSHOT_SECTIONS = ["events", "partners", "organization"]
+
+def mark_dirty(organization_id, *sections):
+    """
+    Flagging sections of an organization's snapshot for a rebuild, writes to its events, partners or itself must call this
+    """
+    DashboardSnapshot.objects.filter(organization_id=organization_id).update(**{f"{section}_dirty": True for section in sections})
+
+def build_events(organization_id, today):
+    from .serializers import EventDashboardSerializer
+
+    events = EventDashboardSerializer.setup_eager_loading(Event.objects.filter(organization_id=organization_id, date__gte=today)).order_by("date", "start_time", "pk")[:SNAPSHOT_EVENTS]
+    return {"date": today.isoformat(), "events": EventDashboardSerializer(events, many=True).data}
+
+def build_partners(organization_id, today):
+    rows = Partner.objects.filter(organization_id=organization_id).values_list("type").annotate(count=Count("pk")).order_by("type")
+    return {"partner_types": {str(partner_type): count for partner_type, count in rows}, "resource_types": summarize_rollups(organization_id)["resource_types"]}
+
+def build_organization(organization_id, today):
+    from .serializers import OrganizationSerializer
+
+    return {"organization": OrganizationSerializer(Organization.objects.get(pk=organization_id)).data}
+
+BUILDERS = {"events": build_events, "partners": build_partners, "organization": build_organization}
+
+def flatten(data):
+    return {key: value for section in SNAPSHOT_SECTIONS for key, value in data[section].items()}
+
+def get_snapshot(organization_id):
+    """
+    Reading the dashboard snapshot in one query, rebuilding only its dirty sections once it is older than the staleness bound
+    """
+    now = timezone.now()
+    today = timezone.localdate()
+
+    snapshot = DashboardSnapshot.objects.filter(organization_id=organization_id).first()
+    if snapshot is None:
+        snapshot, created = DashboardSnapshot.objects.get_or_create(organization_id=organization_id, defaults={"build_date": now})
+
+    # Sections never built, or upcoming events from another day, are rebuilt right away
+    outdated = [section for section in SNAPSHOT_SECTIONS if section not in snapshot.data]
+    if "events" in snapshot.data and snapshot.data["events"]["date"] != today.isoformat():
+        outdated.append("events")
+
+    # Sections flagged by writes may be served until the snapshot is older than the staleness bound
+    dirty = []
+    if now - snapshot.build_date >= datetime.timedelta(seconds=settings.DASHBOARD_SNAPSHOT_MAX_AGE):
+        dirty = [section for section in SNAPSHOT_SECTIONS if getattr(snapshot, f"{section}_dirty")]
+
+    rebuild = [section for section in SNAPSHOT_SECTIONS if section in outdated or section in dirty]
+    if not rebuild:
+        return flatten(snapshot.data)
+
+    # Clear the flags before reading, so writes landing during the rebuild flag their section again
+    DashboardSnapshot.objects.filter(organization_id=organization_id).update(**{f"{section}_dirty": False for section in rebuild})
+
+    data = dict(snapshot.data)
+    for section in rebuild:
+        data[section] = BUILDERS[section](organization_id, today)
+
+    DashboardSnapshot.objects.filter(organization_id=organization_id).update(data=data, build_date=now)
+    return flatten(data)
@@ -0,0 +1,87 @@
+def sync_children(existing, wanted, key, fields, build):
+    """
+    Synchronizing child rows with the wanted rows, only writing the ones that changed
+
+    existing is an iterable of model instances, wanted a list of dicts matched to them on the key fields.
+    Matching rows have their fields updated, unmatched wanted rows are built and inserted and unmatched existing rows are deleted.
+    """
+    existing = list(existing)
+    model = type(existing[0]) if existing else None
+
+    # Group existing rows by key, duplicate keys are matched in order
+    by_key = {}
+    for instance in existing:
+        by_key.setdefault(tuple(getattr(instance, name) for name in key), []).append(instance)
+
+    inserts = []
+    updates = []
+    for row in wanted:
+        matches = by_key.get(tuple(row[name] for name in key))
+        if not matches:
+            inserts.append(build(row))
+            continue
+
+        instance = matches.pop(0)
+        changed = False
+        for name in fields:
+            if getattr(instance, name) != row[name]:
+                setattr(instance, name, row[name])
+                changed = True
+        if changed:
+            updates.append(instance)
+
+    deletes = [instance.pk for matches in by_key.values() for instance in matches]
+
+    if inserts:
+        type(inserts[0]).objects.bulk_create(inserts)
+    if updates:
+        # bulk_update skips auto_now fields unless they are set and listed
+        stamps = [field for field in model._meta.concrete_fields if getattr(field, "auto_now", False)]
+        for instance in updates:
+            for field in stamps:
+                field.pre_save(instance, add=False)
+        model.objects.bulk_update(updates, fields + [field.name for field in stamps])
+    if deletes:
+        model.objects.filter(pk__in=deletes).delete()
+
+    return len(inserts), len(updates), len(deletes)
+
+def sync_relation(instance, name, ids):
+    """
+    Synchronizing a many to many relation with the wanted ids, only adding and removing the differences
+    """
+    manager = getattr(instance, name)
+
+    # Reuse prefetched rows when the view already loaded them
+    prefetched = getattr(instance, "_prefetched_objects_cache", {})
+    if manager.prefetch_cache_name in prefetched:
+        current = {related.pk for related in prefetched[manager.prefetch_cache_name]}
+    else:
+        current = set(manager.values_list("pk", flat=True))
+
+    wanted = set(ids)
+    added = wanted - current
+    removed = current - wanted
+
+    if removed:
+        manager.remove(*removed)
+    if added:
+        manager.add(*added)
+
+    return len(added), len(removed)
+
+def apply_changes(instance, values):
+    """
+    Setting the given field values on an instance, returns the names of the fields that actually changed for save(update_fields=...)
+
+    auto_now fields are added when anything changed, save only touches them when they are listed.
+    """
+    changed = []
+    for name, value in values.items():
+        if getattr(instance, name) != value:
+            setattr(instance, name, value)
+            changed.append(name)
+
+    if changed:
+        changed.extend(field.name for field in instance._meta.concrete_fields if getattr(field, "auto_now", False))
+    return changed
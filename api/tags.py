@@ -0,0 +1,113 @@
+import functools
+import random
+import threading
+import time
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Tag
+
+colours = [(241, 91, 181), (254, 228, 64), (17, 138, 178), (6, 214, 160), (155, 93, 229), (0, 187, 249), (231, 29, 54), (255, 159, 28)]
+
+# Per-process registry of every tag in an organization: organization id -> {"checked", "tags": {name: pk}}
+# Tags may also be renamed or deleted outside the API (the admin), so a registry is reloaded once it is TAG_REGISTRY_MAX_AGE old
+_registries = {}
+_lock = threading.Lock()
+
+def split_tags(text):
+    """
+    Splitting the comma separated tags parameter into unique, non-empty names
+    """
+    names = []
+    for name in text.split(","):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+def pick_colour(index):
+    """
+    Picking the colour for the index-th tag of an organization
+    """
+    if index < len(colours):
+        return colours[index]
+    return (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+
+def load_registry(organization_id, entry=None, names=None):
+    """
+    Loading tag names and ids of an organization in a single query, either all of them or only the given names
+    """
+    tags = Tag.objects.filter(organization_id=organization_id)
+    if names is None:
+        entry = {"checked": time.monotonic(), "tags": {}}
+    else:
+        # Only the given names are checked, the entry keeps the age of the others
+        entry = {"checked": entry["checked"], "tags": dict(entry["tags"])}
+        tags = tags.filter(name__in=names)
+    entry["tags"].update(tags.values_list("name", "pk"))
+
+    # Rows created by a transaction that later rolls back must not be remembered
+    def remember():
+        with _lock:
+            _registries[organization_id] = entry
+    transaction.on_commit(remember)
+
+    return entry
+
+def resolve_tags(organization_id, names):
+    """
+    Resolving tag names to ids, creating the missing ones
+    """
+    if not names:
+        return []
+
+    entry = _registries.get(organization_id)
+    if entry is None or time.monotonic() - entry["checked"] >= settings.TAG_REGISTRY_MAX_AGE or any(name not in entry["tags"] for name in names):
+        # Another process may have created, renamed or deleted them since we last looked
+        entry = load_registry(organization_id)
+
+    registry = entry["tags"]
+    missing = [name for name in names if name not in registry]
+    if missing:
+        # The (organization, name) constraint turns concurrent creations of the same tag into no-ops
+        new_tags = []
+        for index, name in enumerate(missing, start=len(registry)):
+            colour = pick_colour(index)
+            new_tags.append(Tag(name=name, color_red=colour[0], color_green=colour[1], color_blue=colour[2], organization_id=organization_id))
+        Tag.objects.bulk_create(new_tags, ignore_conflicts=True)
+
+        registry = load_registry(organization_id, entry, missing)["tags"]
+
+    return [registry[name] for name in names]
+
+def forget_tags(organization_id=None):
+    """
+    Dropping the registry of one or every organization
+    """
+    with _lock:
+        if organization_id is None:
+            _registries.clear()
+        else:
+            _registries.pop(organization_id, None)
+
+@receiver([post_save, post_delete], sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    # Tags saved or deleted one by one come from outside the tag registry (the admin), bulk creations send no signals
+    forget_tags(instance.organization_id)
+
+def retry_stale_tags(method):
+    """
+    Running a view method once more with fresh registries when its writes failed a constraint
+
+    A tag deleted by another process within TAG_REGISTRY_MAX_AGE is still in this process' registry until then,
+    linking it fails when the transaction commits.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        try:
+            return method(view, request, *args, **kwargs)
+        except IntegrityError:
+            forget_tags()
+            return method(view, request, *args, **kwargs)
+    return wrapper
@@ -1,3 +1,963 @@
-from django.test import TestCase
+import base64
+import csv
+import datetime
+import io
+import json
+import tempfile
+import time
+from contextlib import contextmanager
+from unittest import mock
+from urllib.parse import urlencode
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from . import auth, cache, context, recommendations, tags, urls, utils
+from .auth import issue_token
+from .blobs import store_image
+from .deltas import CURSOR_OVERLAP, issue_cursor
+from .feeds import issue_feed_token
+from .images import generate_variants
+from .models import Organization, User, Individual, Tag, Partner, Resource, Event, ResourceRollup
+from .passwords import hash_password
+from .rollups import compute_rollups, resource_rows, stored_rollups, update_rollups
+from .search import index_events, index_partners
+import phonenumbers
+from PIL import Image
 
-# Create your tests here.
+class RowCountingCursor:
+    """
+    Database cursor proxy counting every row fetched through it
+    """
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.counter[0] += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self.cursor.fetchmany(*args, **kwargs)
+        self.counter[0] += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.counter[0] += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self.cursor:
+            self.counter[0] += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+@contextmanager
+def count_rows():
+    counter = [0]
+    create_cursor = connection.create_cursor
+
+    def counting_cursor(*args, **kwargs):
+        return RowCountingCursor(create_cursor(*args, **kwargs), counter)
+
+    with mock.patch.object(connection, "create_cursor", counting_cursor):
+        yield counter
+
+def reset_caches():
+    # Process-level caches outlive the rolled back transactions between endpoint calls
+    cache._organizations.clear()
+    auth._revocations.update(version=None, checked=0.0, users={})
+    tags.forget_tags()
+    context._contexts.clear()
+    recommendations._indexes.clear()
+
+def image_upload(colour):
+    buffer = io.BytesIO()
+    Image.new("RGB", (40, 20), colour).save(buffer, "PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def seed_organization(name, size):
+    """
+    Creating an organization with size partners and events, each linked to tags, resources and partners
+    """
+    organization = Organization.objects.create(name=name, message="Welcome", message_title="Hello", message_icon=0)
+    owner = User.objects.create(username=f"{name}-owner", password=hash_password("password"), email="owner@example.com", first_name="Owner", last_name=name, role=0, organization=organization)
+    member = User.objects.create(username=f"{name}-member", password=hash_password("password"), email="member@example.com", first_name="Member", last_name=name, role=2, organization=organization)
+
+    tags = [Tag.objects.create(name=f"Tag {i}", color_red=0, color_green=0, color_blue=0, organization=organization) for i in range(3)]
+
+    partners = []
+    for i in range(size):
+        individual = Individual.objects.create(first_name="Contact", last_name=str(i), email="contact@example.com", phone="+1 613-555-0100")
+        partner = Partner.objects.create(name=f"Partner {i}", description="A partner", type=i % 4, email="partner@example.com", phone="+1 613-555-0100", image_blob=store_image(image_upload((i % 2, 0, 0))), organization=organization, individual=individual)
+        partner.tags.set(tags[:2])
+        resources = Resource.objects.bulk_create([Resource(type=0, name="Funding", amount=100, partner=partner), Resource(type=1, name="Volunteers", amount=5, partner=partner)])
+        update_rollups(organization.pk, [], resource_rows(partner.type, resources))
+        partners.append(partner)
+
+    events = []
+    for i in range(size):
+        event = Event.objects.create(name=f"{name} Event {i}", description="An event", date=datetime.date(2030, 1, 1) + datetime.timedelta(days=i), start_time="10:00", end_time="12:00", organization=organization)
+        event.partners.set(partners[i:i + 2])
+        events.append(event)
+
+    index_partners([partner.pk for partner in partners])
+    index_events([event.pk for event in events])
+
+    feed_token, feed_secret = issue_feed_token(owner)
+    return {"organization": organization, "owner": owner, "member": member, "partners": partners, "events": events, "token": issue_token(owner), "blob": partners[0].image_blob, "feed_token": feed_token, "feed_secret": feed_secret}
+
+def partner_params(tenant):
+    return {
+        "name": "New Partner", "description": "Created in a test", "type": "1", "email": "new@example.com", "phone": "+1 613-555-0101",
+        "individual_first_name": "New", "individual_last_name": "Contact", "individual_email": "contact@example.com", "individual_phone": "+1 613-555-0102",
+        "tags": "Tag 0, Tag 9", "resource_types": "0, 2", "resource_names": "Money, Room", "resource_amounts": "10, 1",
+    }
+
+def event_params(tenant):
+    return {"name": f"{tenant['organization'].name} New Event", "description": "Created in a test", "date": "2031-01-01", "start_time": "09:00", "end_time": "10:00", "partners": ", ".join(str(partner.pk) for partner in tenant["partners"][:2])}
+
+def import_file(tenant, count=5):
+    lines = [json.dumps(dict(partner_params(tenant), name=f"Imported {i}", tags=["Tag 0", "Imported"])) for i in range(count)]
+    return {"file": SimpleUploadedFile("partners.jsonl", "\n".join(lines).encode())}
+
+def new_user_row(name, i):
+    return {"username": f"{name}-bulk-{i}", "password": "password", "email": "bulk@example.com", "first_name": "Bulk", "last_name": str(i), "role": 2}
+
+# Route -> request parameters, expected status and budgets. Queries must stay under a fixed bound for every
+# organization size, rows fetched under base + per_row * size.
+ENDPOINTS = {
+    "private/user/": {"queries": 4, "rows": (2, 0)},
+    "private/users/": {"queries": 4, "rows": (3, 0)},
+    "private/login/": {"auth": False, "params": lambda tenant: {"username": tenant["owner"].username, "password": "password"}, "queries": 2, "rows": (2, 0)},
+    "private/create-account/": {"params": lambda tenant: {"username": "created", "password": "password", "email": "new@example.com", "first_name": "New", "last_name": "User", "role": "2"}, "queries": 5, "rows": (1, 0)},
+    "private/create-accounts/": {"data": lambda tenant: {"users": [new_user_row(tenant["organization"].name, i) for i in range(3)]}, "queries": 7, "rows": (3, 0)},
+    "private/modify-user/": {"params": lambda tenant: {"user_id": tenant["member"].pk, "username": "renamed", "email": "renamed@example.com", "first_name": "Re", "last_name": "Named", "role": "1"}, "queries": 6, "rows": (2, 0)},
+    "private/change-password/": {"params": lambda tenant: {"old_password": "password", "new_password": "changed"}, "queries": 6, "rows": (2, 0)},
+    "private/delete-user/": {"params": lambda tenant: {"user_id": tenant["member"].pk}, "queries": 7, "rows": (2, 0)},
+    "private/partners/": {"queries": 6, "rows": (1, 5)},
+    "FACETS private/partners/": {"method": "post", "path": lambda tenant: "private/partners/", "params": lambda tenant: {"tags": "Tag 0", "min_amount": 10, "facets": 1, "limit": 5}, "queries": 7, "rows": (38, 0)},
+    "private/create-partner/": {"params": partner_params, "data": lambda tenant: {"image": ""}, "queries": 25, "rows": (21, 0)},
+    "private/modify-partner/": {"params": lambda tenant: dict(partner_params(tenant), partner_id=tenant["partners"][0].pk), "data": lambda tenant: {"image": ""}, "queries": 32, "rows": (26, 0)},
+    "private/delete-partner/": {"params": lambda tenant: {"partner_id": tenant["partners"][0].pk}, "queries": 23, "rows": (9, 0)},
+    "private/events/": {"queries": 5, "rows": (0, 3)},
+    "WINDOW private/events/": {"method": "post", "path": lambda tenant: "private/events/", "params": lambda tenant: {"from": "2030-01-02", "to": "2030-01-03"}, "queries": 5, "rows": (7, 0)},
+    "private/create-event/": {"params": event_params, "queries": 14, "rows": (8, 0)},
+    "private/modify-event/": {"params": lambda tenant: dict(event_params(tenant), event_id=tenant["events"][0].pk), "queries": 12, "rows": (8, 0)},
+    "private/delete-event/": {"params": lambda tenant: {"event_id": tenant["events"][0].pk}, "queries": 13, "rows": (4, 0)},
+    "private/modify-organization/": {"params": lambda tenant: {"name": f"{tenant['organization'].name} Renamed", "message": "Changed", "message_title": "Title", "message_icon": "1"}, "queries": 6, "rows": (1, 0)},
+    "private/search/": {"params": lambda tenant: {"q": "part", "limit": 5}, "queries": 3, "rows": (6, 0)},
+    "private/resources-summary/": {"queries": 3, "rows": (8, 0)},
+    "private/calendar/": {"params": lambda tenant: {"view": "month", "date": "2030-01-15"}, "queries": 6, "rows": (0, 4)},
+    "private/recommend-partners/": {"params": lambda tenant: {"event_id": tenant["events"][0].pk, "limit": 5}, "queries": 6, "rows": (1, 5)},
+    "private/free-slots/": {"params": lambda tenant: {"partners": ", ".join(str(partner.pk) for partner in tenant["partners"]), "from": "2030-01-01", "to": "2030-01-31", "day_start": "09:00", "day_end": "17:00"}, "queries": 3, "rows": (0, 1)},
+    "private/import/": {"params": lambda tenant: {"kind": "partners"}, "data": import_file, "multipart": True, "queries": 18, "rows": (64, 0)},
+    "private/dashboard/": {"queries": 5, "rows": (0, 3)},
+    "private/dashboard-snapshot/": {"queries": 14, "rows": (13, 3)},
+    "private/admin/": {"queries": 4, "rows": (3, 0)},
+    "private/openai-key/": {"queries": 2, "rows": (0, 0)},
+    "private/ai-data/": {"queries": 7, "rows": (0, 8)},
+    "private/ai-context/": {"queries": 9, "rows": (1, 8)},
+    "SINCE private/ai-data/": {"method": "post", "path": lambda tenant: "private/ai-data/", "params": lambda tenant: {"since": issue_cursor(tenant["organization"].pk, timezone.now() + CURSOR_OVERLAP)}, "queries": 5, "rows": (0, 0)},
+    "PATCH private/modify-user/": {"method": "patch", "data": lambda tenant: {}, "path": lambda tenant: "private/modify-user/", "params": lambda tenant: {"user_id": tenant["member"].pk, "role": "1"}, "queries": 6, "rows": (2, 0)},
+    "PATCH private/modify-partner/": {"method": "patch", "data": lambda tenant: {}, "path": lambda tenant: "private/modify-partner/", "params": lambda tenant: {"partner_id": tenant["partners"][0].pk, "phone": "+1 613-555-0199", "tags": "Tag 0, Tag 9"}, "queries": 21, "rows": (20, 0)},
+    "PATCH private/modify-event/": {"method": "patch", "data": lambda tenant: {}, "path": lambda tenant: "private/modify-event/", "params": lambda tenant: {"event_id": tenant["events"][0].pk, "start_time": "11:00"}, "queries": 11, "rows": (7, 0)},
+    "PATCH private/modify-organization/": {"method": "patch", "data": lambda tenant: {}, "path": lambda tenant: "private/modify-organization/", "params": lambda tenant: {"message": ""}, "queries": 6, "rows": (1, 0)},
+    "private/create-feed-token/": {"queries": 3, "rows": (1, 0)},
+    "private/delete-feed-token/": {"params": lambda tenant: {"feed_token_id": tenant["feed_token"].pk}, "queries": 3, "rows": (0, 0)},
+    "feeds/events.ics": {"method": "get", "auth": False, "params": lambda tenant: {"token": tenant["feed_secret"]}, "queries": 3, "rows": (0, 3)},
+    "blobs/<str:sha256>/": {"method": "get", "auth": False, "path": lambda tenant: f"blobs/{tenant['blob'].sha256}/", "queries": 1, "rows": (1, 0)},
+}
+
+@override_settings(BLOB_ROOT=tempfile.mkdtemp(), PASSWORD_HASH_ROUNDS=4, API_TOKEN_REVOCATION_POLL=0, ORGANIZATION_CACHE_POLL=0)
+class QueryBudgetTests(TestCase):
+    """
+    Every API route has to stay within a fixed query budget however large the organization is
+    """
+    sizes = [2, 10, 25]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tenants = {size: seed_organization(f"Org{size}", size) for size in cls.sizes}
+        # Data of another organization that no endpoint should ever read
+        seed_organization("Noise", 30)
+
+    def setUp(self):
+        reset_caches()
+
+    def call(self, route, tenant):
+        endpoint = ENDPOINTS[route]
+        params = endpoint["params"](tenant) if "params" in endpoint else {}
+        if endpoint.get("auth", True):
+            params["user_hash"] = tenant["token"]
+        data = endpoint["data"](tenant) if "data" in endpoint else None
+
+        path = endpoint["path"](tenant) if "path" in endpoint else route
+        method = getattr(self.client, endpoint.get("method", "post"))
+
+        with count_rows() as rows, CaptureQueriesContext(connection) as queries:
+            if endpoint.get("multipart"):
+                response = method(f"/api/{path}?{urlencode(params)}", data)
+            else:
+                response = method(f"/api/{path}?{urlencode(params)}", data, content_type="application/json")
+
+            # Streamed bodies only query the database as they are read
+            if response.streaming:
+                response.streamed = b"".join(response.streaming_content)
+
+        return response, queries, rows[0]
+
+    def assertWithinBudget(self, route, size, response, queries, rows):
+        endpoint = ENDPOINTS[route]
+        statements = "\n".join(f"  {query['sql']}" for query in queries.captured_queries)
+
+        self.assertEqual(response.status_code, 200, f"{route} with {size} partners returned {response.status_code}")
+        self.assertLessEqual(len(queries), endpoint["queries"], f"{route} with {size} partners ran {len(queries)} queries, budget is {endpoint['queries']}:\n{statements}")
+
+        base, per_row = endpoint["rows"]
+        self.assertLessEqual(rows, base + per_row * size, f"{route} with {size} partners fetched {rows} rows, budget is {base + per_row * size}:\n{statements}")
+
+    def test_every_route_has_a_budget(self):
+        routes = {str(pattern.pattern) for pattern in urls.urlpatterns}
+        self.assertEqual(routes - set(ENDPOINTS), set())
+
+    def test_endpoint_budgets(self):
+        for route in ENDPOINTS:
+            for size in self.sizes:
+                with self.subTest(route=route, size=size):
+                    # Each call runs in its own rolled back transaction so writes don't leak between calls
+                    with transaction.atomic():
+                        reset_caches()
+                        response, queries, rows = self.call(route, self.tenants[size])
+                        transaction.set_rollback(True)
+
+                    self.assertWithinBudget(route, size, response, queries, rows)
+
+    def test_legacy_user_hash_costs_one_query(self):
+        tenant = self.tenants[self.sizes[0]]
+        self.client.post(f"/api/private/partners/?{urlencode({'user_hash': tenant['token']})}")
+
+        # With polling disabled a token costs one revocation version check, a legacy hash one user lookup
+        with CaptureQueriesContext(connection) as token_queries:
+            self.client.post(f"/api/private/partners/?{urlencode({'user_hash': tenant['token']})}")
+        with CaptureQueriesContext(connection) as hash_queries:
+            self.client.post(f"/api/private/partners/?user_hash={tenant['owner'].user_hash}")
+
+        self.assertEqual(len(hash_queries), len(token_queries))
+
+    def test_bulk_provisioning_is_capped(self):
+        tenant = self.tenants[self.sizes[0]]
+        url = f"/api/private/create-accounts/?{urlencode({'user_hash': tenant['token']})}"
+
+        with override_settings(API_BULK_USERS_MAX=2):
+            response = self.client.post(url, {"users": [new_user_row("capped", i) for i in range(3)]}, content_type="application/json")
+            self.assertEqual(response.status_code, 413)
+            self.assertFalse(User.objects.filter(username__startswith="capped-").exists())
+
+            response = self.client.post(url, {"users": [new_user_row("capped", i) for i in range(2)]}, content_type="application/json")
+            self.assertEqual(len(response.json()["created"]), 2)
+
+    def test_paginated_lists_fetch_one_page(self):
+        routes = {"private/users/": None, "private/partners/": None, "private/events/": None, "private/dashboard/": 0, "private/admin/": 0}
+
+        for route, index in routes.items():
+            for size in self.sizes:
+                with self.subTest(route=route, size=size):
+                    tenant = self.tenants[size]
+                    seen = []
+                    cursor = ""
+
+                    # Walk every page, each one has to fetch a bounded number of rows
+                    while True:
+                        params = {"user_hash": tenant["token"], "limit": 3, "cursor": cursor}
+                        with count_rows() as rows:
+                            response = self.client.post(f"/api/{route}?{urlencode(params)}")
+                        self.assertEqual(response.status_code, 200)
+                        self.assertLessEqual(rows[0], 30, f"{route} fetched {rows[0]} rows for a page of 3")
+
+                        page = response.json() if index is None else response.json()[index]
+                        seen.extend(row.get("pk", row.get("username")) for row in page["results"])
+                        cursor = page["next"]
+                        if not cursor:
+                            break
+
+                    self.assertEqual(len(seen), len(set(seen)))
+                    self.assertEqual(len(seen), size if route in ["private/partners/", "private/events/", "private/dashboard/"] else 2)
+
+    def test_blobs_are_deduplicated_and_cached(self):
+        tenant = self.tenants[self.sizes[-1]]
+        blob = tenant["blob"]
+
+        # Partners with identical images share one blob
+        self.assertEqual(len({partner.image_blob_id for partner in tenant["partners"]}), 2)
+
+        response = self.client.post(f"/api/private/partners/?{urlencode({'user_hash': tenant['token']})}")
+        self.assertEqual(response.json()[0]["image"]["url"], f"/api/blobs/{blob.sha256}/")
+        self.assertEqual((response.json()[0]["image"]["width"], response.json()[0]["image"]["height"]), (40, 20))
+
+        response = self.client.get(f"/api/blobs/{blob.sha256}/")
+        self.assertEqual(response["ETag"], f'"{blob.sha256}"')
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertEqual(b"".join(response.streaming_content)[:4], b"\x89PNG")
+        self.assertEqual(response["X-Content-Type-Options"], "nosniff")
+        self.assertEqual(response["Content-Security-Policy"], "sandbox")
+
+        # Uploads that aren't images are refused whatever type they declare
+        script = "data:text/html;base64," + base64.b64encode(b"<script>alert(1)</script>").decode("ascii")
+        with self.assertRaises(ValueError):
+            store_image(script)
+        response = self.client.post(f"/api/private/create-partner/?{urlencode(dict(partner_params(tenant), user_hash=tenant['token']))}", {"image": script}, content_type="application/json")
+        self.assertEqual(response.status_code, 415)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/blobs/{blob.sha256}/", HTTP_IF_NONE_MATCH=f'"{blob.sha256}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+    def test_image_variants(self):
+        blob = self.tenants[self.sizes[0]]["blob"]
+        url = f"/api/blobs/{blob.sha256}/?size=thumbnail"
+
+        # Until the variant exists the original is served, but only briefly cached
+        response = self.client.get(url, HTTP_ACCEPT="image/webp")
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertNotIn("immutable", response["Cache-Control"])
+
+        generate_variants(blob.sha256)
+
+        response = self.client.get(url, HTTP_ACCEPT="image/webp")
+        self.assertEqual(response["Content-Type"], "image/webp")
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as image:
+            self.assertLessEqual(max(image.size), 96)
+
+        response = self.client.get(url + "&image_format=jpeg")
+        self.assertEqual(response["Content-Type"], "image/jpeg")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+
+    def test_sparse_fieldsets_skip_columns_and_relations(self):
+        tenant = self.tenants[self.sizes[-1]]
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f"/api/private/partners/?{urlencode({'user_hash': tenant['token'], 'fields': 'pk,name'})}")
+        self.assertEqual(response.json()[0], {"pk": tenant["partners"][0].pk, "name": "Partner 0"})
+
+        # One partner query with no prefetches and no description or image columns
+        partner_queries = [query["sql"] for query in queries.captured_queries if 'FROM "api_partner"' in query["sql"]]
+        self.assertEqual(len(partner_queries), 1)
+        self.assertNotIn("description", partner_queries[0])
+        self.assertNotIn("image", partner_queries[0])
+
+        response = self.client.post(f"/api/private/events/?{urlencode({'user_hash': tenant['token'], 'exclude': 'partners,organization,description', 'limit': 2})}")
+        self.assertEqual(set(response.json()["results"][0]), {"pk", "name", "date", "start_time", "end_time"})
+        self.assertTrue(response.json()["next"])
+
+    def test_tag_registry(self):
+        organization = self.tenants[self.sizes[0]]["organization"]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = tags.resolve_tags(organization.pk, tags.split_tags("Tag 0, Fresh, ,Fresh"))
+        self.assertEqual(len(first), 2)
+        self.assertEqual(Tag.objects.filter(organization=organization, name="Fresh").count(), 1)
+
+        # Known names resolve without touching the database
+        with self.assertNumQueries(0):
+            self.assertEqual(tags.resolve_tags(organization.pk, ["Fresh", "Tag 0"]), first[::-1])
+
+        # A stale registry creating a tag another process already added ends up with the same row
+        tags.forget_tags()
+        tags._registries[organization.pk] = {"checked": time.monotonic(), "tags": {}}
+        self.assertEqual(tags.resolve_tags(organization.pk, ["Fresh"]), first[1:])
+
+        # Tags deleted outside the API are forgotten right away in this process, and after the registry's age elsewhere
+        with self.captureOnCommitCallbacks(execute=True):
+            tags.resolve_tags(organization.pk, ["Tag 0"])
+        Tag.objects.filter(pk=first[0]).delete()
+        self.assertNotIn(organization.pk, tags._registries)
+
+        tags._registries[organization.pk] = {"checked": time.monotonic() - 60, "tags": {"Tag 0": first[0], "Fresh": first[1]}}
+        with self.captureOnCommitCallbacks(execute=True):
+            recreated = tags.resolve_tags(organization.pk, ["Tag 0"])
+        self.assertNotEqual(recreated, first[:1])
+        self.assertTrue(Tag.objects.filter(pk=recreated[0], name="Tag 0").exists())
+
+        # A write that still linked a deleted tag runs once more with fresh registries
+        calls = []
+        def write(view, request):
+            calls.append(dict(tags._registries))
+            if len(calls) == 1:
+                raise IntegrityError("FOREIGN KEY constraint failed")
+            return "written"
+        self.assertEqual(tags.retry_stale_tags(write)(None, None), "written")
+        self.assertEqual(calls[1], {})
+
+        # Colours follow the organization's own tag count, not every tenant's
+        fresh = Tag.objects.get(pk=first[1])
+        self.assertEqual((fresh.color_red, fresh.color_green, fresh.color_blue), tags.colours[3])
+
+    def test_modifications_only_write_changes(self):
+        tenant = self.tenants[self.sizes[0]]
+        partner = tenant["partners"][0]
+        resource_ids = set(partner.resources.values_list("pk", flat=True))
+        params = dict(partner_params(tenant), partner_id=partner.pk, tags="Tag 0, Tag 1", resource_types="0, 1", resource_names="Funding, Volunteers", resource_amounts="100, 6")
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f"/api/private/modify-partner/?{urlencode(dict(params, user_hash=tenant['token']))}", {"image": ""}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        # The changed amount is updated in place, nothing is deleted or re-linked
+        writes = [query["sql"] for query in queries.captured_queries if query["sql"].startswith(("INSERT", "DELETE"))]
+        self.assertFalse([sql for sql in writes if '"api_resource"' in sql or '"api_partner_tags"' in sql])
+        self.assertEqual(set(partner.resources.values_list("pk", flat=True)), resource_ids)
+        self.assertEqual(partner.resources.get(name="Volunteers").amount, 6)
+
+        event = tenant["events"][0]
+        params = dict(event_params(tenant), event_id=event.pk, partners=", ".join(str(pk) for pk in event.partners.values_list("pk", flat=True)))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f"/api/private/modify-event/?{urlencode(dict(params, user_hash=tenant['token']))}")
+        self.assertFalse([query for query in queries.captured_queries if "api_event_partners" in query["sql"] and not query["sql"].startswith("SELECT")])
+
+        # An organization edit doesn't write back version counters bumped since its row was read
+        organization = Organization.objects.get(pk=tenant["organization"].pk)
+        Organization.objects.filter(pk=organization.pk).update(event_version=F("event_version") + 1)
+        with mock.patch.object(auth.SessionUser, "organization", organization):
+            self.client.post(f"/api/private/modify-organization/?{urlencode({'user_hash': tenant['token'], 'name': organization.name, 'message': 'Edited', 'message_icon': '1'})}")
+        self.assertEqual(Organization.objects.get(pk=organization.pk).event_version, organization.event_version + 1)
+
+        # Saves outside the API, like the admin's, still reach the cached organization
+        with override_settings(ORGANIZATION_CACHE_POLL=3600):
+            cache.get_organization_data(organization.pk)
+            organization = Organization.objects.get(pk=organization.pk)
+            organization.message = "From the admin"
+            organization.save()
+            self.assertEqual(cache.get_organization_data(organization.pk)["message"], "From the admin")
+
+    def test_partial_modifications(self):
+        tenant = self.tenants[self.sizes[0]]
+        partner = tenant["partners"][0]
+        url = f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partner.pk, 'phone': '+1 613-555-0199'})}"
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(url, {}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+        # Only the phone column and the change time are written and the image is kept when it isn't re-sent
+        updates = [query["sql"] for query in queries.captured_queries if query["sql"].startswith("UPDATE")]
+        self.assertEqual(len(updates), 1)
+        self.assertRegex(updates[0], r'^UPDATE "api_partner" SET "updated_at" = [^,]+, "phone" = [^,]+ WHERE')
+        partner.refresh_from_db()
+        self.assertEqual(partner.image_blob, tenant["blob"])
+        self.assertEqual(response.json()["phone"], "+1 613-555-0199")
+        self.assertEqual(response.json()["image"]["url"], f"/api/blobs/{tenant['blob'].sha256}/")
+
+        # Blanking a required field or sending uneven resources is rejected before anything is written
+        self.assertEqual(self.client.patch(url.replace("phone=", "name=&phone="), {}, content_type="application/json").status_code, 422)
+        self.assertEqual(self.client.patch(url + "&resource_types=0&resource_names=A%2C+B&resource_amounts=1", {}, content_type="application/json").status_code, 422)
+        self.assertEqual(self.client.patch(url.replace(f"partner_id={partner.pk}", "partner_id=abc"), {}, content_type="application/json").status_code, 422)
+        self.assertEqual(self.client.patch(f"/api/private/modify-event/?{urlencode({'user_hash': tenant['token'], 'event_id': 'abc', 'name': 'Nope'})}", {}, content_type="application/json").status_code, 422)
+
+        # Repeating an event edit writes nothing
+        event = tenant["events"][0]
+        url = f"/api/private/modify-event/?{urlencode({'user_hash': tenant['token'], 'event_id': event.pk, 'name': event.name})}"
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.patch(url, {}, content_type="application/json").status_code, 200)
+        self.assertFalse([query for query in queries.captured_queries if not query["sql"].startswith("SELECT")])
+
+    def test_import_partners_and_events(self):
+        tenant = self.tenants[self.sizes[0]]
+        organization = tenant["organization"]
+        directory = tempfile.mkdtemp()
+
+        partners = (
+            "name,description,type,email,phone,individual_first_name,individual_last_name,individual_email,individual_phone,tags,resource_types,resource_names,resource_amounts\n"
+            'Library,Books,2,library@example.com,613-555-0110,Ann,Lee,ann@example.com,613-555-0111,"Tag 0, Reading",0,Money,50\n'
+            "Bad Phone,Nope,1,bad@example.com,123,Bo,Li,bo@example.com,613-555-0112,,,,\n"
+            'Museum,Art,3,museum@example.com,613-555-0113,Cy,Ng,cy@example.com,613-555-0114,Reading,"0, 1",Money,5\n'
+        )
+        response = self.client.post(f"/api/private/import/?{urlencode({'user_hash': tenant['token'], 'kind': 'partners'})}", {"file": SimpleUploadedFile("partners.csv", partners.encode("utf-8-sig"))})
+        self.assertEqual(response.json(), {"created": 1, "errors": [{"row": 2, "name": "Bad Phone", "error": "invalid_phone"}, {"row": 3, "name": "Museum", "error": "invalid_resources"}]})
+
+        # Files that can't be decoded or parsed are refused, rows read before the broken part stay imported
+        url = f"/api/private/import/?{urlencode({'user_hash': tenant['token'], 'kind': 'partners'})}"
+        response = self.client.post(url, {"file": SimpleUploadedFile("partners.csv", "\ufeffname\n".encode("utf-16"))})
+        self.assertEqual((response.status_code, response.json()), (400, {"created": 0, "errors": [{"row": 1, "name": "", "error": "unreadable_file"}]}))
+        response = self.client.post(url, {"file": SimpleUploadedFile("partners.csv", b"name\n" + b"x" * (csv.field_size_limit() + 1))})
+        self.assertEqual(response.status_code, 400)
+
+        library = Partner.objects.get(organization=organization, name="Library")
+        self.assertEqual(library.phone, "+1 613-555-0110")
+        self.assertEqual(sorted(library.tags.values_list("name", flat=True)), ["Reading", "Tag 0"])
+        self.assertEqual(list(library.resources.values_list("name", "amount")), [("Money", 50)])
+
+        events = "\n".join([
+            json.dumps({"name": "Imported Fair", "description": "Fair", "date": "2031-05-01", "start_time": "09:00", "end_time": "17:00", "partners": ["Library", "Partner 0"]}),
+            json.dumps({"name": "Imported Fair", "description": "Again", "date": "2031-05-02", "start_time": "09:00", "end_time": "17:00"}),
+            "not json",
+            json.dumps({"name": "Ghost Walk", "description": "Spooky", "date": "2031-10-31", "start_time": "20:00", "end_time": "22:00", "partners": "Nobody"}),
+            json.dumps({"name": tenant["events"][0].name, "description": "Taken", "date": "2031-05-03", "start_time": "09:00", "end_time": "17:00"}),
+        ])
+        with open(f"{directory}/events.jsonl", "w") as file:
+            file.write(events)
+
+        output = io.StringIO()
+        call_command("import_data", "events", f"{directory}/events.jsonl", organization=organization.pk, errors=f"{directory}/errors.csv", chunk_size=2, stdout=output)
+        self.assertIn("5 rows read, 1 created, 4 failed", output.getvalue())
+
+        fair = Event.objects.get(name="Imported Fair")
+        self.assertEqual(sorted(fair.partners.values_list("name", flat=True)), ["Library", "Partner 0"])
+        with open(f"{directory}/errors.csv") as file:
+            self.assertEqual(list(csv.reader(file)), [["row", "name", "error"], ["2", "Imported Fair", "duplicate_name"], ["3", "", "invalid_row"], ["4", "Ghost Walk", "unknown_partner"], ["5", tenant["events"][0].name, "name_taken"]])
+
+        # A chunk where every row is refused leaves the feeds and the dashboard alone
+        version = Organization.objects.get(pk=organization.pk).event_version
+        taken = json.dumps({"name": tenant["events"][0].name, "description": "Taken", "date": "2031-05-03", "start_time": "09:00", "end_time": "17:00"})
+        response = self.client.post(f"/api/private/import/?{urlencode({'user_hash': tenant['token'], 'kind': 'events'})}", {"file": SimpleUploadedFile("events.jsonl", taken.encode())})
+        self.assertEqual(response.json()["created"], 0)
+        self.assertEqual(Organization.objects.get(pk=organization.pk).event_version, version)
+
+    def test_phone_numbers_are_parsed_once(self):
+        utils.normalize_phone_number.cache_clear()
+
+        with mock.patch("phonenumbers.parse", wraps=phonenumbers.parse) as parse:
+            self.assertTrue(utils.is_valid_phone_number("613-555-0100"))
+            self.assertEqual(utils.format_phone_number("613-555-0100"), "+1 613-555-0100")
+            self.assertEqual(utils.normalize_phone_number("613-555-0100").e164, "+16135550100")
+            self.assertEqual(parse.call_count, 1)
+
+            phones = utils.normalize_phone_numbers(["613-555-0101", "613-555-0101", "not a phone", "123"])
+            self.assertEqual(parse.call_count, 4)
+
+        self.assertEqual(list(phones), ["613-555-0101", "not a phone", "123"])
+        self.assertEqual(phones["not a phone"], utils.PhoneNumber(False, None, None))
+        self.assertFalse(phones["123"].valid)
+        self.assertFalse(utils.is_valid_email("Not An Email"))
+
+    def test_search(self):
+        tenant = self.tenants[self.sizes[1]]
+
+        def search(**params):
+            response = self.client.post(f"/api/private/search/?{urlencode(dict(params, user_hash=tenant['token']))}")
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        # Prefix matches on names, tags, resources and contacts, only within the organization
+        self.assertEqual(len(search(q="partn", kinds="partners", limit=50)["results"]), self.sizes[1])
+        self.assertEqual(len(search(q="volunt", kinds="partners", limit=50)["results"]), self.sizes[1])
+        self.assertEqual(search(q="Partner 3", kinds="partners")["results"][0], {"kind": "partner", "pk": tenant["partners"][3].pk, "name": "Partner 3"})
+        self.assertEqual({result["kind"] for result in search(q="event", limit=50)["results"]}, {"event"})
+
+        # Pages follow each other without overlap
+        first = search(q="tag", limit=4)
+        second = search(q="tag", limit=4, cursor=first["next"])
+        self.assertEqual(len(first["results"]), 4)
+        self.assertFalse({result["pk"] for result in first["results"]} & {result["pk"] for result in second["results"]})
+
+        # Names rank above descriptions
+        partner = tenant["partners"][0]
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partner.pk, 'name': 'Zebra Crossing'})}", {}, content_type="application/json")
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': tenant['partners'][1].pk, 'description': 'Zebras welcome'})}", {}, content_type="application/json")
+        self.assertEqual([result["pk"] for result in search(q="zebra")["results"]], [partner.pk, tenant["partners"][1].pk])
+
+        # Deleting removes the entry
+        self.client.post(f"/api/private/delete-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partner.pk})}")
+        self.assertEqual([result["pk"] for result in search(q="zebra")["results"]], [tenant["partners"][1].pk])
+
+        self.assertEqual(self.client.post(f"/api/private/search/?{urlencode({'user_hash': tenant['token'], 'q': 'x', 'kinds': 'users'})}").status_code, 422)
+
+    def test_partner_filters_and_facets(self):
+        tenant = self.tenants[self.sizes[1]]
+        partners = tenant["partners"]
+        partners[1].tags.add(Tag.objects.create(name="Rare", color_red=0, color_green=0, color_blue=0, organization=tenant["organization"]))
+        Resource.objects.create(type=2, name="Hall", amount=500, partner=partners[2])
+
+        def list_partners(**params):
+            response = self.client.post(f"/api/private/partners/?{urlencode(dict(params, user_hash=tenant['token'], fields='pk'))}")
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        self.assertEqual(len(list_partners(type="1,2")), len([partner for partner in partners if partner.type in (1, 2)]))
+        self.assertEqual(list_partners(tags="Rare, Missing"), [{"pk": partners[1].pk}])
+        self.assertEqual(list_partners(resource_type="2", min_amount=100), [{"pk": partners[2].pk}])
+        self.assertEqual(list_partners(resource_type="1", min_amount=100), [])
+
+        # Each facet counts what picking one of its values would give, under every other filter
+        with CaptureQueriesContext(connection) as queries:
+            response = list_partners(type="1", facets=1)
+        facets = response["facets"]
+        self.assertEqual(len(response["results"]), facets["type"]["1"])
+        self.assertEqual(facets["type"], {str(t): len([partner for partner in partners if partner.type == t]) for t in range(4)})
+        self.assertEqual(facets["tags"], {"Tag 0": facets["type"]["1"], "Tag 1": facets["type"]["1"], "Rare": 1})
+        self.assertEqual(facets["resource_type"], {"0": facets["type"]["1"], "1": facets["type"]["1"]})
+        self.assertEqual(len([query for query in queries.captured_queries if "UNION ALL" in query["sql"]]), 1)
+
+        self.assertEqual(self.client.post(f"/api/private/partners/?{urlencode({'user_hash': tenant['token'], 'type': 'x'})}").status_code, 400)
+
+    def test_resource_rollups(self):
+        tenant = self.tenants[self.sizes[0]]
+        organization = tenant["organization"]
+        partner = tenant["partners"][1]
+
+        def summary():
+            return self.client.post(f"/api/private/resources-summary/?{urlencode({'user_hash': tenant['token']})}").json()
+
+        self.assertEqual(summary()["resource_types"], {"0": {"amount": 100 * self.sizes[0], "resources": self.sizes[0]}, "1": {"amount": 5 * self.sizes[0], "resources": self.sizes[0]}})
+
+        # Every write path keeps the rollups equal to the raw resources
+        self.client.post(f"/api/private/create-partner/?{urlencode(dict(partner_params(tenant), user_hash=tenant['token']))}", {"image": ""}, content_type="application/json")
+        self.client.post(f"/api/private/modify-partner/?{urlencode(dict(partner_params(tenant), user_hash=tenant['token'], partner_id=tenant['partners'][0].pk, resource_amounts='25, 3'))}", {"image": ""}, content_type="application/json")
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partner.pk, 'type': '3'})}", {}, content_type="application/json")
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partner.pk, 'resource_types': '0', 'resource_names': 'Funding', 'resource_amounts': '40'})}", {}, content_type="application/json")
+        self.client.post(f"/api/private/delete-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': tenant['partners'][0].pk})}")
+        self.client.post(f"/api/private/import/?{urlencode({'user_hash': tenant['token'], 'kind': 'partners'})}", import_file(tenant, 3))
+        self.assertEqual(stored_rollups(organization.pk), compute_rollups(organization.pk))
+
+        rows = {(row["resource_type"], row["partner_type"]): row["amount"] for row in summary()["rollups"]}
+        self.assertEqual(rows[(0, 3)], 40)
+        self.assertNotIn((1, 3), rows)
+
+        # An edit racing another one moves the rollups from the resources as they are once it holds the partner
+        racer = tenant["partners"][1]
+        def concurrent_edit(image):
+            self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': racer.pk, 'resource_types': '0', 'resource_names': 'Funding', 'resource_amounts': '7'})}", {}, content_type="application/json")
+        with mock.patch("api.views.store_image", side_effect=concurrent_edit):
+            self.client.post(f"/api/private/modify-partner/?{urlencode(dict(partner_params(tenant), user_hash=tenant['token'], partner_id=racer.pk))}", {"image": ""}, content_type="application/json")
+        self.assertEqual(stored_rollups(organization.pk), compute_rollups(organization.pk))
+
+        # The rebuild command finds and repairs drift
+        ResourceRollup.objects.filter(organization=organization, resource_type=2).update(amount=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", organization=organization.pk, check=True, stdout=io.StringIO())
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        self.assertEqual(stored_rollups(organization.pk), compute_rollups(organization.pk))
+        call_command("rebuild_rollups", check=True, stdout=io.StringIO())
+
+    def test_event_windows_and_calendar(self):
+        tenant = self.tenants[self.sizes[1]]
+        events = tenant["events"]
+        second = Event.objects.create(name="Second Event", description="An event", date=events[7].date, start_time="08:00", end_time="09:00", organization=tenant["organization"])
+
+        def list_events(path="events", **params):
+            response = self.client.post(f"/api/private/{path}/?{urlencode(dict(params, user_hash=tenant['token'], fields='pk'))}")
+            self.assertEqual(response.status_code, 200)
+            return response.json()
+
+        self.assertEqual(list_events(**{"from": "2030-01-09"}), [{"pk": event.pk} for event in events[8:]])
+        self.assertEqual(list_events(**{"from": "2030-01-02", "to": "2030-01-03"}), [{"pk": events[1].pk}, {"pk": events[2].pk}])
+        self.assertEqual(len(list_events(upcoming=1)), len(events) + 1)
+        self.assertEqual(list_events(past=1), [])
+        self.assertEqual(list_events("dashboard", **{"to": "2030-01-01"})[0], [{"pk": events[0].pk}])
+        self.assertEqual(self.client.post(f"/api/private/events/?{urlencode({'user_hash': tenant['token'], 'from': '2030-13-01'})}").status_code, 400)
+        self.assertEqual(self.client.post(f"/api/private/events/?{urlencode({'user_hash': tenant['token'], 'upcoming': 1, 'past': 1})}").status_code, 400)
+
+        # 2030-01-08 is a Tuesday, its week runs from the 7th to the 13th
+        calendar = list_events("calendar", view="week", date="2030-01-08")
+        self.assertEqual((calendar["from"], calendar["to"]), ("2030-01-07", "2030-01-13"))
+        self.assertEqual(calendar["days"], {"2030-01-07": 1, "2030-01-08": 2, "2030-01-09": 1, "2030-01-10": 1})
+        self.assertEqual([event["pk"] for event in calendar["events"]], [events[6].pk, second.pk, events[7].pk, events[8].pk, events[9].pk])
+
+        month = list_events("calendar", date="2030-01-31")
+        self.assertEqual((month["from"], month["to"]), ("2030-01-01", "2030-01-31"))
+        self.assertEqual(sum(month["days"].values()), len(events) + 1)
+        self.assertEqual(self.client.post(f"/api/private/calendar/?{urlencode({'user_hash': tenant['token'], 'view': 'year'})}").status_code, 422)
+
+    def test_scheduling_conflicts_and_free_slots(self):
+        tenant = self.tenants[self.sizes[1]]
+        partners = tenant["partners"]
+        events = tenant["events"]
+
+        def create_event(**params):
+            params = dict(event_params(tenant), **dict({"date": "2030-01-03", "start_time": "11:00", "end_time": "13:00"}, **params))
+            return self.client.post(f"/api/private/create-event/?{urlencode(dict(params, user_hash=tenant['token']))}")
+
+        # Event 2 books partners 2 and 3 from 10:00 to 12:00 on the 3rd
+        response = create_event(name="Clash", partners=f"{partners[1].pk}, {partners[3].pk}")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(response.json()["conflicts"]), [str(partners[3].pk)])
+        self.assertEqual(response.json()["conflicts"][str(partners[3].pk)][0]["pk"], events[2].pk)
+        self.assertFalse(Event.objects.filter(name="Clash").exists())
+
+        self.assertEqual(create_event(name="Back To Back", start_time="12:00", partners=str(partners[3].pk)).status_code, 200)
+        self.assertEqual(create_event(name="Clash", partners=str(partners[3].pk), allow_conflicts=1).status_code, 200)
+
+        # Moving an event onto a booked interval is refused, its own interval never conflicts
+        def patch_event(event, **params):
+            return self.client.patch(f"/api/private/modify-event/?{urlencode(dict(params, user_hash=tenant['token'], event_id=event.pk))}", {}, content_type="application/json")
+
+        self.assertEqual(patch_event(events[2], start_time="09:00").status_code, 409)
+        self.assertEqual(patch_event(events[6], start_time="09:00").status_code, 200)
+        self.assertEqual(patch_event(events[5], date="2030-01-03").status_code, 200)
+        self.assertEqual(patch_event(events[4], date="2030-01-03").status_code, 409)
+        self.assertEqual(Event.objects.get(pk=events[4].pk).date, events[4].date)
+        modify = dict(event_params(tenant), event_id=events[4].pk, date="2030-01-03", end_time="10:30", partners=str(partners[2].pk), user_hash=tenant["token"])
+        self.assertEqual(self.client.post(f"/api/private/modify-event/?{urlencode(modify)}").status_code, 409)
+
+        # Free slots are the gaps between the partners' merged bookings within the day's hours
+        def slots(**params):
+            params = dict({"from": "2030-01-01", "to": "2030-01-02", "day_start": "09:00", "day_end": "17:00"}, **params)
+            response = self.client.post(f"/api/private/free-slots/?{urlencode(dict(params, user_hash=tenant['token']))}")
+            self.assertEqual(response.status_code, 200)
+            return response.json()["slots"]
+
+        Event.objects.filter(pk=events[1].pk).update(start_time="11:00", end_time="14:00")
+        self.assertEqual(slots(partners=f"{partners[0].pk}, {partners[1].pk}"), [
+            {"date": "2030-01-01", "start_time": "09:00", "end_time": "10:00"},
+            {"date": "2030-01-01", "start_time": "12:00", "end_time": "17:00"},
+            {"date": "2030-01-02", "start_time": "09:00", "end_time": "11:00"},
+            {"date": "2030-01-02", "start_time": "14:00", "end_time": "17:00"},
+        ])
+        self.assertEqual(slots(partners=str(partners[0].pk), duration=120), [
+            {"date": "2030-01-01", "start_time": "12:00", "end_time": "17:00"},
+            {"date": "2030-01-02", "start_time": "09:00", "end_time": "17:00"},
+        ])
+        self.assertEqual(slots(partners=str(partners[8].pk), day_start="00:00", day_end=""), [
+            {"date": "2030-01-01", "start_time": "00:00", "end_time": "24:00"},
+            {"date": "2030-01-02", "start_time": "00:00", "end_time": "24:00"},
+        ])
+        for params in [{"partners": "x"}, {"partners": "1", "to": "2029-12-01"}, {"partners": "1", "to": "2031-01-01"}, {"partners": "1", "day_end": "08:00"}]:
+            response = self.client.post(f"/api/private/free-slots/?{urlencode(dict({'from': '2030-01-01', 'to': '2030-01-02', 'day_start': '09:00'}, **params, user_hash=tenant['token']))}")
+            self.assertEqual(response.status_code, 400)
+
+    def test_event_feed(self):
+        tenant = self.tenants[self.sizes[0]]
+        events = tenant["events"]
+        Event.objects.filter(pk=events[0].pk).update(description="Bring chairs, tables; and a very long list of things that will not fit on one line of the feed")
+
+        def feed(**params):
+            headers = {"HTTP_IF_NONE_MATCH": params.pop("etag")} if "etag" in params else {}
+            response = self.client.get(f"/api/feeds/events.ics?{urlencode(dict(params, token=params.pop('token', tenant['feed_secret'])))}", **headers)
+            body = b"".join(response.streaming_content).decode() if response.streaming else ""
+            return response, body
+
+        response, body = feed()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/calendar"))
+        self.assertTrue(body.startswith("BEGIN:VCALENDAR\r\n") and body.endswith("END:VCALENDAR\r\n"))
+        self.assertEqual(body.count("BEGIN:VEVENT"), len(events))
+        self.assertTrue(all(len(line.encode()) <= 75 for line in body.split("\r\n")))
+        self.assertIn("DESCRIPTION:Bring chairs\\, tables\\; and", body)
+        self.assertIn(f"DTSTART:20300101T100000\r\nDTEND:20300101T120000\r\nSUMMARY:{events[0].name}", body)
+        self.assertIn(f'ATTENDEE;CN="{tenant["partners"][1].name}":mailto:', body)
+
+        # Polls that change nothing get a 304 from one version lookup
+        etag = response["ETag"]
+        with CaptureQueriesContext(connection) as queries:
+            response, body = feed(etag=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+        # Any change to the events or their partners moves the ETag
+        self.client.patch(f"/api/private/modify-event/?{urlencode({'user_hash': tenant['token'], 'event_id': events[1].pk, 'name': 'Renamed'})}", {}, content_type="application/json")
+        response, body = feed(etag=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("SUMMARY:Renamed", body)
+        etag = response["ETag"]
+
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': tenant['partners'][1].pk, 'phone': '+1 613-555-0150'})}", {}, content_type="application/json")
+        self.assertEqual(feed(etag=etag)[0].status_code, 304)
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': tenant['partners'][1].pk, 'name': 'Renamed Partner'})}", {}, content_type="application/json")
+        response, body = feed(etag=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # Edited events carry their change time so subscribed calendars apply them
+        renamed = Event.objects.get(pk=events[1].pk)
+        self.assertIn(f"LAST-MODIFIED:{renamed.updated_at.astimezone(datetime.timezone.utc):%Y%m%dT%H%M%SZ}", body)
+
+        # A partner's feed only has the events it takes part in
+        response, body = feed(partner=tenant["partners"][0].pk)
+        self.assertEqual(body.count("BEGIN:VEVENT"), 1)
+        self.assertNotEqual(response["ETag"], feed()[0]["ETag"])
+        self.assertEqual(feed(partner="x")[0].status_code, 422)
+
+        # Feeds only open with a feed token, which can be revoked without touching the session
+        self.assertEqual(feed(token=tenant["token"])[0].status_code, 422)
+        response = self.client.post(f"/api/private/create-feed-token/?{urlencode({'user_hash': tenant['token']})}")
+        self.assertIn("/api/feeds/events.ics?token=", response.json()["url"])
+        secret = response.json()["token"]
+        self.assertEqual(feed(token=secret)[0].status_code, 200)
+
+        member = {"user_hash": issue_token(tenant["member"]), "feed_token_id": response.json()["pk"]}
+        self.assertEqual(self.client.post(f"/api/private/delete-feed-token/?{urlencode(member)}").status_code, 422)
+        self.client.post(f"/api/private/delete-feed-token/?{urlencode({'user_hash': tenant['token'], 'feed_token_id': response.json()['pk']})}")
+        self.assertEqual(feed(token=secret)[0].status_code, 422)
+
+    def test_dashboard_snapshot(self):
+        tenant = self.tenants[self.sizes[1]]
+
+        def snapshot():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(f"/api/private/dashboard-snapshot/?{urlencode({'user_hash': tenant['token']})}")
+            self.assertEqual(response.status_code, 200)
+            return response.json(), [query["sql"] for query in queries.captured_queries if "api_tokenrevocation" not in query["sql"]]
+
+        data, queries = snapshot()
+        self.assertEqual([event["pk"] for event in data["events"]], [event.pk for event in tenant["events"]])
+        self.assertEqual(data["partner_types"], {str(t): len([partner for partner in tenant["partners"] if partner.type == t]) for t in range(4)})
+        self.assertEqual(data["resource_types"]["0"], {"amount": 100 * self.sizes[1], "resources": self.sizes[1]})
+        self.assertEqual(data["organization"]["message"], "Welcome")
+
+        # Served from the snapshot row alone while nothing changed
+        self.assertEqual(snapshot()[1], [queries[0]])
+
+        # Writes are served stale within the bound, then only their sections are rebuilt
+        self.client.post(f"/api/private/delete-event/?{urlencode({'user_hash': tenant['token'], 'event_id': tenant['events'][0].pk})}")
+        with override_settings(DASHBOARD_SNAPSHOT_MAX_AGE=3600):
+            self.assertEqual(len(snapshot()[0]["events"]), self.sizes[1])
+
+        with override_settings(DASHBOARD_SNAPSHOT_MAX_AGE=0):
+            data, queries = snapshot()
+            self.assertEqual(len(data["events"]), self.sizes[1] - 1)
+            self.assertFalse(any('FROM "api_organization"' in query or '"api_resourcerollup"' in query for query in queries))
+
+            self.client.patch(f"/api/private/modify-organization/?{urlencode({'user_hash': tenant['token'], 'message': 'Changed'})}", {}, content_type="application/json")
+            self.client.post(f"/api/private/create-partner/?{urlencode(dict(partner_params(tenant), user_hash=tenant['token']))}", {"image": ""}, content_type="application/json")
+            data = snapshot()[0]
+            self.assertEqual(data["organization"]["message"], "Changed")
+            self.assertEqual(data["partner_types"]["1"], len([partner for partner in tenant["partners"] if partner.type == 1]) + 1)
+
+            # Upcoming events move on with the day
+            with mock.patch("api.snapshots.timezone.localdate", return_value=datetime.date(2030, 1, 6)):
+                self.assertEqual(len(snapshot()[0]["events"]), self.sizes[1] - 5)
+
+    def test_ai_data_delta_sync(self):
+        tenant = self.tenants[self.sizes[1]]
+        partners = tenant["partners"]
+        events = tenant["events"]
+
+        # Everything seeded predates the first sync
+        past = timezone.now() - datetime.timedelta(hours=1)
+        for model in [Partner, Individual, Resource, Tag, Event]:
+            model.objects.update(updated_at=past)
+
+        def sync(since=None):
+            params = {"user_hash": tenant["token"]}
+            if since:
+                params["since"] = since
+            response = self.client.post(f"/api/private/ai-data/?{urlencode(params)}")
+            self.assertEqual(response.status_code, 200)
+            meta, partner_data, event_data = response.json()
+            return meta, {partner["pk"] for partner in partner_data}, {event["pk"] for event in event_data}
+
+        meta, partner_ids, event_ids = sync()
+        self.assertTrue(meta["full"])
+        self.assertEqual(len(partner_ids), len(partners))
+        self.assertEqual(sync(meta["cursor"])[1:], (set(), set()))
+
+        # Tag and resource changes count as partner changes, a rename reaches the events embedding the partner
+        def patch_partner(partner, **params):
+            self.client.patch(f"/api/private/modify-partner/?{urlencode(dict(params, user_hash=tenant['token'], partner_id=partner.pk))}", {}, content_type="application/json")
+
+        patch_partner(partners[0], tags="Tag 0")
+        patch_partner(partners[1], resource_types="0", resource_names="Funding", resource_amounts="7")
+        patch_partner(partners[2], name="Renamed")
+        self.client.patch(f"/api/private/modify-event/?{urlencode({'user_hash': tenant['token'], 'event_id': events[5].pk, 'partners': str(partners[9].pk)})}", {}, content_type="application/json")
+        self.client.post(f"/api/private/delete-event/?{urlencode({'user_hash': tenant['token'], 'event_id': events[6].pk})}")
+        self.client.post(f"/api/private/delete-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partners[8].pk})}")
+
+        meta, partner_ids, event_ids = sync(meta["cursor"])
+        self.assertFalse(meta["full"])
+        self.assertEqual(partner_ids, {partners[0].pk, partners[1].pk, partners[2].pk})
+        # Events 1 and 2 list partner 2, events 7 and 8 listed the deleted partner 8
+        self.assertEqual(event_ids, {events[1].pk, events[2].pk, events[5].pk, events[7].pk, events[8].pk})
+        self.assertEqual(meta["deleted"], {"partners": [partners[8].pk], "events": [events[6].pk]})
+
+        # Cursors from another organization or tampered with are refused, expired ones resync everything
+        other = self.tenants[self.sizes[0]]
+        response = self.client.post(f"/api/private/ai-data/?{urlencode({'user_hash': tenant['token'], 'since': issue_cursor(other['organization'].pk, timezone.now())})}")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(f"/api/private/ai-data/?{urlencode({'user_hash': tenant['token'], 'since': meta['cursor'] + 'x'})}").status_code, 400)
+        with override_settings(AI_SYNC_MAX_AGE=0):
+            meta, partner_ids, event_ids = sync(meta["cursor"])
+        self.assertTrue(meta["full"])
+        self.assertEqual(len(event_ids), len(events) - 1)
+
+    def test_ai_context(self):
+        tenant = self.tenants[self.sizes[2]]
+        Event.objects.filter(pk=tenant["events"][0].pk).update(description="Long " * 100)
+        Partner.objects.filter(pk=tenant["partners"][0].pk).update(description="")
+
+        def build(budget=None):
+            params = {"user_hash": tenant["token"]}
+            if budget:
+                params["budget"] = budget
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(f"/api/private/ai-context/?{urlencode(params)}")
+                body = b"".join(response.streaming_content).decode()
+            self.assertEqual(response["Content-Type"], "application/x-ndjson")
+            return [json.loads(line) for line in body.splitlines()], [query["sql"] for query in queries.captured_queries if "api_tokenrevocation" not in query["sql"]]
+
+        lines, queries = build(400000)
+        self.assertEqual(lines[0]["k"], "h")
+        self.assertEqual([line["k"] for line in lines[1:5]], ["e", "p", "e", "p"])
+        self.assertEqual(len([line for line in lines if line["k"] == "p"]), self.sizes[2])
+
+        # Compact lines drop empty fields and cut long descriptions
+        event = next(line for line in lines if line["k"] == "e" and line["id"] == tenant["events"][0].pk)
+        self.assertEqual(len(event["d"]), context.DESCRIPTION_LIMIT)
+        self.assertEqual(event["p"], [partner.pk for partner in tenant["partners"][:2]])
+        partner = next(line for line in lines if line["k"] == "p" and line["id"] == tenant["partners"][0].pk)
+        self.assertNotIn("d", partner)
+        self.assertEqual(partner["r"], [[0, "Funding", 100], [1, "Volunteers", 5]])
+
+        # Smaller budgets keep the best ranked lines of the same cached build, from one version lookup
+        small, queries = build(2000)
+        self.assertEqual(len(queries), 1)
+        self.assertLessEqual(sum(len(json.dumps(line, separators=(",", ":"), ensure_ascii=False)) + 1 for line in small), 2000)
+        self.assertEqual(small, lines[:len(small)])
+
+        # Any change to partners or events builds it again
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': tenant['partners'][3].pk, 'individual_first_name': 'Changed'})}", {}, content_type="application/json")
+        lines, queries = build(400000)
+        self.assertGreater(len(queries), 1)
+        self.assertIn("Changed 3", [line.get("c") for line in lines])
+
+        self.assertEqual(self.client.post(f"/api/private/ai-context/?{urlencode({'user_hash': tenant['token'], 'budget': '0'})}").status_code, 400)
+
+        # Each process keeps a bounded number of contexts, dropping the least recently used
+        with mock.patch.object(context, "CONTEXT_CACHE_SIZE", 2):
+            for size in self.sizes:
+                context.get_context(self.tenants[size]["organization"].pk)
+            context.get_context(self.tenants[self.sizes[1]]["organization"].pk)
+            context.get_context(self.tenants[self.sizes[0]]["organization"].pk)
+        self.assertEqual(list(context._contexts), [self.tenants[self.sizes[1]]["organization"].pk, self.tenants[self.sizes[0]]["organization"].pk])
+
+    def test_partner_recommendations(self):
+        tenant = self.tenants[self.sizes[1]]
+        partners = tenant["partners"]
+        Partner.objects.filter(pk=partners[3].pk).update(description="Sound systems and stage lighting for music concert tours")
+        Partner.objects.filter(pk=partners[5].pk).update(description="Catering for concert crews and weddings")
+        event = Event.objects.create(name="Summer Music Concert", description="Outdoor concert with a stage", date="2030-06-01", start_time="18:00", end_time="22:00", organization=tenant["organization"])
+
+        def recommend(**params):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(f"/api/private/recommend-partners/?{urlencode(dict(params, user_hash=tenant['token'], event_id=event.pk))}")
+            self.assertEqual(response.status_code, 200)
+            return [result["pk"] for result in response.json()["results"]], [query["sql"] for query in queries.captured_queries if "api_tokenrevocation" not in query["sql"]]
+
+        # Only partners sharing terms with the event are ranked, closest first
+        ranked, queries = recommend()
+        self.assertEqual(ranked, [partners[3].pk, partners[5].pk])
+
+        # Later calls only read the partners changed since, tag and deletion changes included
+        self.client.patch(f"/api/private/modify-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partners[7].pk, 'tags': 'Music, Concert, Stage'})}", {}, content_type="application/json")
+        self.client.post(f"/api/private/delete-partner/?{urlencode({'user_hash': tenant['token'], 'partner_id': partners[5].pk})}")
+        ranked, queries = recommend(limit=1)
+        self.assertEqual(ranked, [partners[7].pk])
+        self.assertEqual(len(queries), 5)
+        self.assertTrue(all("updated_at" in query for query in queries if query.startswith('SELECT "api_partner"')))
+
+        self.assertEqual(recommend()[0], [partners[7].pk, partners[3].pk])
+
+        # Each process keeps a bounded number of indexes, dropping the least recently used
+        organizations = [self.tenants[size]["organization"].pk for size in self.sizes]
+        with mock.patch.object(recommendations, "INDEX_CACHE_SIZE", 2):
+            for organization_id in organizations + organizations[1:2] + organizations[:1]:
+                recommendations.get_index(organization_id)
+        self.assertEqual(list(recommendations._indexes), [organizations[1], organizations[0]])
+        self.assertEqual(self.client.post(f"/api/private/recommend-partners/?{urlencode({'user_hash': tenant['token'], 'event_id': tenant['events'][0].pk + 1000})}").status_code, 422)
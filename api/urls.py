@@ -6,6 +6,7 @@ urlpatterns = [
     path("private/users/", views.UserList.as_view(), name="user-view-list"),
     path("private/login/", views.UserAuthentication.as_view(), name="user-view-login"),
     path("private/create-account/", views.UserCreation.as_view(), name="user-view-create"),
+    path("private/create-accounts/", views.UserBulkCreation.as_view(), name="user-view-create-bulk"),
     path("private/modify-user/", views.UserModification.as_view(), name="user-view-modify"),
     path("private/change-password/", views.UserPasswordModification.as_view(), name="user-view-change-password"),
     path("private/delete-user/", views.UserDeletion.as_view(), name="user-view-delete"),
@@ -18,9 +19,21 @@ urlpatterns = [
     path("private/modify-event/", views.EventModification.as_view(), name="event-view-modify"),
     path("private/delete-event/", views.EventDeletion.as_view(), name="event-view-delete"),
     path("private/modify-organization/", views.OrganizationModification.as_view(), name="organization-view-modify"),
+    path("private/search/", views.Search.as_view(), name="search-view-list"),
+    path("private/resources-summary/", views.ResourceSummary.as_view(), name="resource-view-summary"),
+    path("private/import/", views.DataImport.as_view(), name="import-view-create"),
+    path("private/calendar/", views.Calendar.as_view(), name="event-view-calendar"),
+    path("private/recommend-partners/", views.PartnerRecommendation.as_view(), name="partner-view-recommend"),
+    path("private/free-slots/", views.FreeSlots.as_view(), name="event-view-free-slots"),
     path("private/dashboard/", views.DashboardList.as_view(), name="admin-view-list"),
+    path("private/dashboard-snapshot/", views.DashboardSnapshotData.as_view(), name="dashboard-view-snapshot"),
     path("private/admin/", views.AdminList.as_view(), name="admin-view-list"),
     path("private/openai-key/", views.GPTAIKEY.as_view(), name="openai-key-view-get"),
     path("private/ai-data/", views.AIData.as_view(), name="ai-data-view-get"),
+    path("private/ai-context/", views.AIContext.as_view(), name="ai-context-view-get"),
+    path("private/create-feed-token/", views.FeedTokenCreation.as_view(), name="feed-token-view-create"),
+    path("private/delete-feed-token/", views.FeedTokenDeletion.as_view(), name="feed-token-view-delete"),
+    path("feeds/events.ics", views.EventFeed.as_view(), name="event-view-feed"),
+    path("blobs/<str:sha256>/", views.BlobData.as_view(), name="blob-view-get"),
     # path("usersold/", views.UserListCreate.as_view(), name="user-view-create-account")
 ]
\ No newline at end of file
@@ -1,27 +1,53 @@
+import functools
 import random
 import string
 import re
 import phonenumbers
+from collections import namedtuple
 
 def generate_random_string(length):
     # Derived from https://pynative.com/python-generate-random-string/
     result_str = ''.join(random.choice(string.ascii_letters) for i in range(length))
     return result_str
 
-def is_valid_email(email):
-    # Derived from https://www.zerobounce.net/python-email-verification/
+# Compiled once instead of on every call
+# Derived from https://www.zerobounce.net/python-email-verification/
+EMAIL_REGEX = re.compile(r'^[a-z0-9]+[\._]?[a-z0-9]+[@]\w+[.]\w+$')
+
+# Recent phone numbers kept normalized, plenty for an import chunk and the numbers a process sees repeatedly
+PHONE_CACHE_SIZE = 4096
 
-    # Regular expression for validating an Email
-    regex = r'^[a-z0-9]+[\._]?[a-z0-9]+[@]\w+[.]\w+$'
+# Result of parsing a phone number once: whether it is valid plus both formats, None if it could not be parsed
+PhoneNumber = namedtuple("PhoneNumber", ["valid", "e164", "international"])
 
+def is_valid_email(email):
     # If the string matches the regex, it is a valid email
-    if re.match(regex, email):
-        return True
-    else:
-        return False
+    return EMAIL_REGEX.match(email) is not None
+
+@functools.lru_cache(maxsize=PHONE_CACHE_SIZE)
+def normalize_phone_number(phone):
+    """
+    Parsing a phone number once, returns its validity with its E.164 and international formats
+    """
+    try:
+        number = phonenumbers.parse(phone, "CA")
+    except phonenumbers.NumberParseException:
+        return PhoneNumber(False, None, None)
+
+    return PhoneNumber(
+        phonenumbers.is_valid_number(number),
+        phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164),
+        phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.INTERNATIONAL),
+    )
+
+def normalize_phone_numbers(phones):
+    """
+    Normalizing many phone numbers at once, each distinct number is only parsed once
+    """
+    return {phone: normalize_phone_number(phone) for phone in dict.fromkeys(phones)}
 
 def is_valid_phone_number(phone):
-    return phonenumbers.is_valid_number(phonenumbers.parse(phone, "CA"))
+    return normalize_phone_number(phone).valid
 
 def format_phone_number(phone):
-    return phonenumbers.format_number(phonenumbers.parse(phone, "CA"), phonenumbers.PhoneNumberFormat.INTERNATIONAL)
\ No newline at end of file
+    return normalize_phone_number(phone).international
@@ -1,19 +1,49 @@
 import os
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
+from django.views import View
 from rest_framework import generics, status
 from rest_framework.response import Response
-from .models import Organization, User, Individual, Tag, Partner, Resource, Event
-from .serializers import EventAISerializer, OrganizationSerializer, PartnerAISerializer, UserSerializer, UserAdminSerializer, TagSerializer, TagPartnerSerializer, PartnerSerializer, PartnerEventSerializer, EventSerializer, EventDashboardSerializer
+from .models import Organization, User, Individual, Partner, Resource, Event, Blob, FeedToken
+from .serializers import get_sparse_fields, EventAISerializer, OrganizationSerializer, PartnerAISerializer, UserSerializer, UserAdminSerializer, TagSerializer, TagPartnerSerializer, PartnerSerializer, PartnerEventSerializer, EventSerializer, EventDashboardSerializer
 from rest_framework.views import APIView
-import bcrypt
 from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
 import base64
-import random
 from .utils import is_valid_email, is_valid_phone_number, format_phone_number
+from .auth import get_session_user, issue_token, revoke_tokens
+from .cache import get_organization_data
+from .passwords import hash_password, check_password, needs_rehash
+from .provisioning import parse_users, provision_users
+from .importers import IMPORTERS, import_rows, read_rows
+from .pagination import CREATION_ORDER, EVENT_ORDER, InvalidPage, encode_cursor, page_limit, page_offset, paginate, wants_page
+from .blobs import blob_path, protect_blob, store_image
+from .images import VARIANT_FORMATS, VARIANT_SIZES, schedule_variants, variant_path
+from .tags import resolve_tags, retry_stale_tags, split_tags
+from .sync import apply_changes, sync_children, sync_relation
+from .search import SEARCH_KINDS, index_events, index_partners, search
+from .facets import filter_partners, parse_partner_filters, partner_facets
+from .rollups import resource_rows, summarize_rollups, update_rollups
+from .scheduling import DAY_MINUTES, MAX_SLOT_DAYS, SCHEDULE_FIELDS, find_conflicts, free_slots, to_minutes
+from .feeds import feed_state, generate_feed, issue_feed_token, touch_events
+from .snapshots import get_snapshot, mark_dirty
+from .deltas import TOMBSTONE_EVENT, TOMBSTONE_PARTNER, CursorExpired, bury, changed_events, changed_partners, deleted_since, issue_cursor, read_cursor, touch_partner_events
+from .context import CONTEXT_BUDGET, CONTEXT_BUDGET_MAX, get_context, stream_context
+from .recommendations import recommend_partners
+from .windows import CALENDAR_VIEWS, WINDOW_ORDER, calendar_window, day_counts, filter_window, parse_event_window, read_date
 import datetime
+from urllib.parse import urlencode
 from django.utils.dateparse import parse_date, parse_time
 
-colours = [(241, 91, 181), (254, 228, 64), (17, 138, 178), (6, 214, 160), (155, 93, 229), (0, 187, 249), (231, 29, 54), (255, 159, 28)]
+# Query params accepted by the partial (PATCH) modifications, anything else is ignored
+USER_FIELDS = ["username", "email", "first_name", "last_name", "role"]
+PARTNER_FIELDS = ["name", "description", "type", "email", "phone", "individual_first_name", "individual_last_name", "individual_email", "individual_phone", "tags", "resource_types", "resource_names", "resource_amounts"]
+PARTNER_REQUIRED_FIELDS = ["name", "description", "type", "email", "phone", "individual_first_name", "individual_last_name", "individual_email", "individual_phone"]
+EVENT_FIELDS = ["name", "description", "date", "start_time", "end_time", "partners"]
+ORGANIZATION_FIELDS = ["name", "message", "message_title", "message_icon"]
 
 class UserData(APIView):
     def post(self, request, format=None):
@@ -22,19 +52,19 @@ class UserData(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash, load_user=True)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Return response
-        serializer = UserSerializer(user)
+        serializer = UserSerializer(user.get_user(), **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class UserList(APIView):
@@ -44,15 +74,15 @@ class UserList(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify role
@@ -60,10 +90,19 @@ class UserList(APIView):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
 
         # Retrieve all users
-        users = User.objects.filter(organization=user.organization)
+        users = UserSerializer.setup_eager_loading(User.objects.filter(organization_id=user.organization_id), **sparse)
+
+        # Return one page when asked for
+        if wants_page(request):
+            try:
+                users, next_cursor = paginate(request, users, CREATION_ORDER)
+            except InvalidPage:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            serializer = UserSerializer(users, many=True, **sparse)
+            return Response({"results": serializer.data, "next": next_cursor}, status=status.HTTP_200_OK)
         
         # Return response
-        serializer = UserSerializer(users, many=True)
+        serializer = UserSerializer(users, many=True, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class UserAuthentication(APIView):
@@ -81,17 +120,24 @@ class UserAuthentication(APIView):
         
         # Verify user
         try:
-            user = User.objects.prefetch_related('organization').get(username=username)
+            user = User.objects.select_related('profile_picture_blob').get(username=username)
         except User.DoesNotExist:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         
         # Verify password
-        if not bcrypt.checkpw(bytes(password, "utf-8"), bytes(user.password, "utf-8")):
+        if not check_password(password, user.password):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
+
+        # Upgrade the stored hash if the configured cost changed since it was made
+        if needs_rehash(user.password):
+            user.password = hash_password(password)
+            user.save(update_fields=["password"])
         
-        # Return response
+        # Return response with a signed session token
         serializer = UserSerializer(user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = dict(serializer.data)
+        data["token"] = issue_token(user)
+        return Response(data, status=status.HTTP_200_OK)
 
 class UserCreation(APIView):
     def post(self, request, format=None):
@@ -100,6 +146,7 @@ class UserCreation(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         username = request.query_params.get("username", "")
         password = request.query_params.get("password", "")
         email = request.query_params.get("email", "")
@@ -112,9 +159,8 @@ class UserCreation(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify username
@@ -136,13 +182,51 @@ class UserCreation(APIView):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         
         # Save user
-        salt = bcrypt.gensalt(rounds=15)
-        new_user = User.objects.create(username=username, password=str(bcrypt.hashpw(bytes(password, "utf-8"), salt))[2:-1], email=email, first_name=first_name, last_name=last_name, role=int(role), organization=user.organization)
+        new_user = User.objects.create(username=username, password=hash_password(password), email=email, first_name=first_name, last_name=last_name, role=int(role), organization_id=user.organization_id)
         
         # Return response
-        serializer = UserAdminSerializer(new_user)
+        serializer = UserAdminSerializer(new_user, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+class UserBulkCreation(APIView):
+    def post(self, request, format=None):
+        """
+        Creating Many Users
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        users = request.data.get("users", "")
+
+        # Validate inputs
+        if not (user_hash and users):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify role
+        if user.role != 0 and user.role != 1:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        
+        # Parse users
+        try:
+            rows = parse_users(users)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Every row costs a full bcrypt hash, large lists would outlast the request timeout
+        if len(rows) > settings.API_BULK_USERS_MAX:
+            return Response({"max_rows": settings.API_BULK_USERS_MAX}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        
+        # Save users
+        created, errors = provision_users(user.organization_id, rows)
+        
+        # Return response
+        serializer = UserAdminSerializer(created, many=True)
+        return Response({"created": serializer.data, "errors": errors}, status=status.HTTP_200_OK)
+
 class UserModification(APIView):
     def post(self, request, format=None):
         """
@@ -150,6 +234,7 @@ class UserModification(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         user_id = request.query_params.get("user_id", "")
         username = request.query_params.get("username", "")
         email = request.query_params.get("email", "")
@@ -162,14 +247,13 @@ class UserModification(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify modified user
         try:
-            new_user = User.objects.prefetch_related('organization').get(pk=int(user_id), organization=user.organization)
+            new_user = User.objects.get(pk=int(user_id), organization_id=user.organization_id)
         except User.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
@@ -182,15 +266,73 @@ class UserModification(APIView):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         
         # Modify and save user
+        role_changed = new_user.role != int(role)
         new_user.username=username
         new_user.email=email
         new_user.first_name=first_name
         new_user.last_name=last_name
         new_user.role=int(role)
         new_user.save()
+
+        # Tokens carry the role, so they have to be reissued after a role change
+        if role_changed:
+            revoke_tokens(new_user.pk)
         
         # Return response
-        serializer = UserAdminSerializer(new_user)
+        serializer = UserAdminSerializer(new_user, **sparse)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def patch(self, request, format=None):
+        """
+        Partially Modifying User
+        """
+        # Get all data from request, only the given fields are changed
+        user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
+        user_id = request.query_params.get("user_id", "")
+        given = {key: value for key, value in request.query_params.items() if key in USER_FIELDS}
+
+        # Validate inputs
+        if not (user_hash and user_id.isdigit()) or not all(given.values()):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        if "role" in given and given["role"] not in ["0", "1", "2"]:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify modified user
+        try:
+            new_user = User.objects.get(pk=int(user_id), organization_id=user.organization_id)
+        except User.DoesNotExist:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Validate email
+        if "email" in given and not is_valid_email(given["email"]):
+            return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        
+        # Verify role
+        if user.role not in [0, 1] or user.role > new_user.role:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        
+        # Modify and save only the changed columns
+        user_values = dict(given)
+        if "role" in given:
+            user_values["role"] = int(given["role"])
+        
+        changed = apply_changes(new_user, user_values)
+        if changed:
+            new_user.save(update_fields=changed)
+
+        # Tokens carry the role, so they have to be reissued after a role change
+        if "role" in changed:
+            revoke_tokens(new_user.pk)
+        
+        # Return response
+        serializer = UserAdminSerializer(new_user, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class UserPasswordModification(APIView):
@@ -208,25 +350,29 @@ class UserPasswordModification(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        session = get_session_user(user_hash, load_user=True)
+        if session is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        user = session.get_user()
         
         # Verify old password
-        if not bcrypt.checkpw(bytes(old_password, "utf-8"), bytes(user.password, "utf-8")):
+        if not check_password(old_password, user.password):
             return Response(status=status.HTTP_403_FORBIDDEN)
         
         # Hash password
-        salt = bcrypt.gensalt(rounds=15)
-        user.password = str(bcrypt.hashpw(bytes(new_password, "utf-8"), salt))[2:-1]
+        user.password = hash_password(new_password)
         
         # Save user
-        user.save()
+        user.save(update_fields=["password"])
+
+        # Revoke existing tokens and hand the caller a fresh one
+        revoke_tokens(user.pk)
         
         # Return response
         serializer = UserAdminSerializer(user)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        data = dict(serializer.data)
+        data["token"] = issue_token(user)
+        return Response(data, status=status.HTTP_200_OK)
 
 class UserDeletion(APIView):
     def post(self, request, format=None):
@@ -242,14 +388,13 @@ class UserDeletion(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify deleted user
         try:
-            new_user = User.objects.prefetch_related('organization').get(pk=int(user_id), organization=user.organization)
+            new_user = User.objects.get(pk=int(user_id), organization_id=user.organization_id)
         except User.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
@@ -258,6 +403,7 @@ class UserDeletion(APIView):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         
         # Delete user
+        revoke_tokens(new_user.pk)
         new_user.delete()
 
         # Return response
@@ -272,31 +418,54 @@ class PartnerList(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
+
+        with_facets = request.query_params.get("facets", "") == "1"
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
-        # Verify user
         try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+            filters = parse_partner_filters(request)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Retrieve all partners
-        partners = Partner.objects.filter(organization=user.organization)
+        # Retrieve all matching partners
+        partners = PartnerSerializer.setup_eager_loading(filter_partners(Partner.objects.filter(organization_id=user.organization_id), filters), **sparse)
+
+        # Facet counts come from the database, not from the loaded partners
+        facets = {"facets": partner_facets(user.organization_id, filters)} if with_facets else {}
+
+        # Return one page when asked for
+        if wants_page(request):
+            try:
+                partners, next_cursor = paginate(request, partners, CREATION_ORDER)
+            except InvalidPage:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            serializer = PartnerSerializer(partners, many=True, **sparse)
+            return Response({"results": serializer.data, "next": next_cursor, **facets}, status=status.HTTP_200_OK)
         
         # Return response
-        serializer = PartnerSerializer(partners, many=True)
+        serializer = PartnerSerializer(partners, many=True, **sparse)
+        if with_facets:
+            return Response({"results": serializer.data, **facets}, status=status.HTTP_200_OK)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class PartnerCreation(APIView):
+    @retry_stale_tags
     def post(self, request, format=None):
         """
         Creating Partner
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         name = request.query_params.get("name", "")
         description = request.query_params.get("description", "")
         type = request.query_params.get("type", "")
@@ -317,9 +486,8 @@ class PartnerCreation(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Validate email
@@ -330,66 +498,53 @@ class PartnerCreation(APIView):
         if not is_valid_phone_number(phone) or not is_valid_phone_number(individual_phone):
             return Response(status=status.HTTP_406_NOT_ACCEPTABLE)
 
-        # Check if image given
-        image_data = None
-        if image:
-            image_data = image
+        # Store image if given
+        try:
+            image_blob = store_image(image)
+        except ValueError:
+            return Response(status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        schedule_variants(image_blob)
         
         # Gather all tags
-        tags_data = None
-        tags_split = tags.split(", ")
-        if tags_split:
-            tags_data = Tag.objects.filter(organization=user.organization, name__in=tags_split)
-            if len(tags_data) != len(tags_split):
-                old_tags = list(tags_data.values_list('name', flat=True))
-                new_tags_split = [x for x in tags_split if x not in old_tags]
-
-                count = Tag.objects.count()
-                new_tags = []
-                for tag in new_tags_split:
-                    colour = None
-                    if count > len(colours):
-                        colour = [random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)]
-                    else:
-                        colour = colours[count]
-                    new_tags.append(Tag(name=tag, color_red=colour[0], color_green=colour[1], color_blue=colour[2], organization=user.organization))
-                    count += 1
-                
-                Tag.objects.bulk_create(new_tags)
-                
-                tags_data = Tag.objects.filter(organization=user.organization, name__in=tags_split)
-        
-        # Create partner
-        new_individual = Individual.objects.create(first_name=individual_first_name, last_name=individual_last_name, email=individual_email, phone=format_phone_number(individual_phone))
-        new_partner = Partner.objects.create(name=name, description=description, type=int(type), email=email, phone=format_phone_number(phone), image=image_data, individual=new_individual, organization=user.organization)
-        new_partner.tags.set(tags_data)
-        new_partner.save()
-
-        resources_data = None
-        resource_types_split = resource_types.split(", ")
-        resource_names_split = resource_names.split(", ")
-        resource_amounts_split = resource_amounts.split(", ")
-
-        if (resource_names != "" and resource_types != "" and resource_amounts != ""):
-            if resource_types_split and resource_names_split and resource_amounts_split and len(resource_types_split) == len(resource_names_split) and len(resource_names_split) == len(resource_amounts_split):
-                new_resources = []
-                for i in range(len(resource_amounts_split)):
-                    new_resources.append(Resource(type=int(resource_types_split[i]), name=resource_names_split[i], amount=int(resource_amounts_split[i]), partner=new_partner))
-                Resource.objects.bulk_create(new_resources)
-        
+        tags_data = resolve_tags(user.organization_id, split_tags(tags))
+        
+        # Create partner, its resources and their rollups together
+        with transaction.atomic():
+            new_individual = Individual.objects.create(first_name=individual_first_name, last_name=individual_last_name, email=individual_email, phone=format_phone_number(individual_phone))
+            new_partner = Partner.objects.create(name=name, description=description, type=int(type), email=email, phone=format_phone_number(phone), image_blob=image_blob, individual=new_individual, organization_id=user.organization_id)
+            new_partner.tags.set(tags_data)
+            new_partner.save()
+
+            resources_data = None
+            resource_types_split = resource_types.split(", ")
+            resource_names_split = resource_names.split(", ")
+            resource_amounts_split = resource_amounts.split(", ")
+
+            if (resource_names != "" and resource_types != "" and resource_amounts != ""):
+                if resource_types_split and resource_names_split and resource_amounts_split and len(resource_types_split) == len(resource_names_split) and len(resource_names_split) == len(resource_amounts_split):
+                    new_resources = []
+                    for i in range(len(resource_amounts_split)):
+                        new_resources.append(Resource(type=int(resource_types_split[i]), name=resource_names_split[i], amount=int(resource_amounts_split[i]), partner=new_partner))
+                    Resource.objects.bulk_create(new_resources)
+                    update_rollups(user.organization_id, [], resource_rows(new_partner.type, new_resources))
+            
+            index_partners([new_partner.pk])
+            mark_dirty(user.organization_id, "partners")
         new_partner.refresh_from_db()
         
         # Return response
-        serializer = PartnerSerializer(new_partner)
+        serializer = PartnerSerializer(new_partner, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class PartnerModification(APIView):
+    @retry_stale_tags
     def post(self, request, format=None):
         """
         Modifying Partner
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         partner_id = request.query_params.get("partner_id", "")
         name = request.query_params.get("name", "")
         description = request.query_params.get("description", "")
@@ -411,14 +566,13 @@ class PartnerModification(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify partner
         try:
-            partner = Partner.objects.prefetch_related('individual').prefetch_related('tags').prefetch_related('resources').get(pk=partner_id, organization=user.organization)
+            partner = Partner.objects.prefetch_related('individual').prefetch_related('tags').get(pk=partner_id, organization_id=user.organization_id)
         except Partner.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
@@ -429,73 +583,186 @@ class PartnerModification(APIView):
         if not is_valid_phone_number(phone) or not is_valid_phone_number(individual_phone):
             return Response(status=status.HTTP_406_NOT_ACCEPTABLE)
         
-        # Check if image given
-        image_data = None
-        if image:
-            image_data = image
+        # Store image if given
+        try:
+            image_blob = store_image(image)
+        except ValueError:
+            return Response(status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        schedule_variants(image_blob)
         
         # Gather all tags
-        tags_data = None
-        tags_split = tags.split(", ")
-        if tags_split:
-            tags_data = Tag.objects.filter(organization=user.organization, name__in=tags_split)
-            if len(tags_data) != len(tags_split):
-                old_tags = list(tags_data.values_list('name', flat=True))
-                new_tags_split = [x for x in tags_split if x not in old_tags]
-
-                count = Tag.objects.count()
-                new_tags = []
-                for tag in new_tags_split:
-                    colour = None
-                    if count > len(colours):
-                        colour = [random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)]
-                    else:
-                        colour = colours[count]
-                    new_tags.append(Tag(name=tag, color_red=colour[0], color_green=colour[1], color_blue=colour[2], organization=user.organization))
-                    count += 1
-                
-                Tag.objects.bulk_create(new_tags)
-                
-                tags_data = Tag.objects.filter(organization=user.organization, name__in=tags_split)
+        tags_data = resolve_tags(user.organization_id, split_tags(tags))
         
         # Gather all resources
-        resources_data = None
         resource_types_split = resource_types.split(", ")
         resource_names_split = resource_names.split(", ")
         resource_amounts_split = resource_amounts.split(", ")
 
-        Resource.objects.filter(partner=partner).delete()
-
+        resources_data = []
         if (resource_names != "" and resource_types != "" and resource_amounts != ""):
             if resource_types_split and resource_names_split and resource_amounts_split and len(resource_types_split) == len(resource_names_split) and len(resource_names_split) == len(resource_amounts_split):
-                new_resources = []
                 for i in range(len(resource_amounts_split)):
-                    new_resources.append(Resource(type=int(resource_types_split[i]), name=resource_names_split[i], amount=int(resource_amounts_split[i]), partner=partner))
-                Resource.objects.bulk_create(new_resources)
-
-        # Modify and save partner
-        partner.individual.first_name =  individual_first_name
-        partner.individual.last_name = individual_last_name
-        partner.individual.email = individual_email
-        partner.individual.phone = format_phone_number(individual_phone)
-        partner.individual.save()
-
-        partner.name = name
-        partner.description = description
-        partner.type = int(type)
-        partner.email = email
-        partner.phone = format_phone_number(phone)
-        partner.image = image_data
-        partner.save()
-
-        partner.tags.clear()
-        partner.tags.set(tags_data)
-        partner.save()
-
+                    resources_data.append({"type": int(resource_types_split[i]), "name": resource_names_split[i], "amount": int(resource_amounts_split[i])})
+
+        with transaction.atomic():
+            # Rollups move by deltas, so the old rows are read under a lock on the partner for concurrent edits not to subtract them twice
+            partner_type = Partner.objects.select_for_update().filter(pk=partner.pk).values_list("type", flat=True).first()
+            if partner_type is None:
+                return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            resources = list(Resource.objects.filter(partner_id=partner.pk))
+
+            # Only write the resources that actually changed, rollups move from the old rows to the new ones
+            resources_before = resource_rows(partner_type, resources)
+            sync_children(resources, resources_data, ("type", "name"), ["amount"], lambda row: Resource(partner=partner, **row))
+            update_rollups(user.organization_id, resources_before, resource_rows(int(type), resources_data))
+
+            # Modify and save partner
+            partner.individual.first_name =  individual_first_name
+            partner.individual.last_name = individual_last_name
+            partner.individual.email = individual_email
+            partner.individual.phone = format_phone_number(individual_phone)
+            partner.individual.save()
+
+            renamed = partner.name != name or partner.email != email
+            partner.name = name
+            partner.description = description
+            partner.type = int(type)
+            partner.email = email
+            partner.phone = format_phone_number(phone)
+            partner.image = None
+            partner.image_blob = image_blob
+            partner.save()
+
+            sync_relation(partner, "tags", tags_data)
+
+            # Events embed the partner's name and feeds its email
+            if renamed:
+                touch_partner_events(partner.pk)
+
+            index_partners([partner.pk])
+            touch_events(user.organization_id)
+            mark_dirty(user.organization_id, "events", "partners")
         partner.refresh_from_db()
         
         # Return response
-        serializer = PartnerSerializer(partner)
+        serializer = PartnerSerializer(partner, **sparse)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @retry_stale_tags
+    def patch(self, request, format=None):
+        """
+        Partially Modifying Partner
+        """
+        # Get all data from request, only the given fields are changed
+        user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
+        partner_id = request.query_params.get("partner_id", "")
+        given = {key: value for key, value in request.query_params.items() if key in PARTNER_FIELDS}
+
+        # Validate inputs
+        if not (user_hash and partner_id.isdigit()) or not all(value for key, value in given.items() if key in PARTNER_REQUIRED_FIELDS):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        if "type" in given and not given["type"].isdigit():
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify partner
+        try:
+            partner = Partner.objects.select_related("individual").get(pk=partner_id, organization_id=user.organization_id)
+        except Partner.DoesNotExist:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Validate email and phone
+        if any(not is_valid_email(given[key]) for key in ["email", "individual_email"] if key in given):
+            return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+        
+        if any(not is_valid_phone_number(given[key]) for key in ["phone", "individual_phone"] if key in given):
+            return Response(status=status.HTTP_406_NOT_ACCEPTABLE)
+        
+        # Resources are only replaced when given, always as three lists of the same length
+        resources_data = None
+        if "resource_types" in given or "resource_names" in given or "resource_amounts" in given:
+            resource_types_split = [x for x in given.get("resource_types", "").split(", ") if x]
+            resource_names_split = [x for x in given.get("resource_names", "").split(", ") if x]
+            resource_amounts_split = [x for x in given.get("resource_amounts", "").split(", ") if x]
+
+            if not (len(resource_types_split) == len(resource_names_split) == len(resource_amounts_split)) or not all(x.isdigit() for x in resource_types_split + resource_amounts_split):
+                return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+            resources_data = [{"type": int(resource_types_split[i]), "name": resource_names_split[i], "amount": int(resource_amounts_split[i])} for i in range(len(resource_names_split))]
+
+        partner_values = {key: given[key] for key in ["name", "description", "email"] if key in given}
+        if "type" in given:
+            partner_values["type"] = int(given["type"])
+        if "phone" in given:
+            partner_values["phone"] = format_phone_number(given["phone"])
+
+        individual_values = {key[len("individual_"):]: given[key] for key in ["individual_first_name", "individual_last_name", "individual_email"] if key in given}
+        if "individual_phone" in given:
+            individual_values["phone"] = format_phone_number(given["individual_phone"])
+
+        # Store image only if given, leaving it out keeps the current one
+        if "image" in request.data:
+            try:
+                image_blob = store_image(request.data["image"])
+            except ValueError:
+                return Response(status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+            schedule_variants(image_blob)
+            partner_values["image"] = None
+            partner_values["image_blob_id"] = image_blob.pk if image_blob else None
+        
+        # Modify and save only the changed columns
+        with transaction.atomic():
+            # Rollups move by deltas, so the type and resources they move from are read under a lock on the partner
+            partner_type = Partner.objects.select_for_update().filter(pk=partner.pk).values_list("type", flat=True).first()
+            if partner_type is None:
+                return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            partner.type = partner_type
+
+            individual_changed = apply_changes(partner.individual, individual_values)
+            if individual_changed:
+                partner.individual.save(update_fields=individual_changed)
+
+            changed = apply_changes(partner, partner_values)
+            if changed:
+                partner.save(update_fields=changed)
+
+            # Feeds and dashboard events list partners by name and email, the AI data feed by name
+            if "name" in changed or "email" in changed:
+                touch_events(user.organization_id)
+                touch_partner_events(partner.pk)
+                mark_dirty(user.organization_id, "events")
+
+            if "tags" in given:
+                sync_relation(partner, "tags", resolve_tags(user.organization_id, split_tags(given["tags"])))
+
+            # Rollups follow new resources as well as a new partner type
+            if resources_data is not None or "type" in changed:
+                resources = list(partner.resources.all())
+                resources_before = resource_rows(partner_type, resources)
+                if resources_data is None:
+                    resources_data = resources
+                else:
+                    sync_children(resources, resources_data, ("type", "name"), ["amount"], lambda row: Resource(partner=partner, **row))
+                update_rollups(user.organization_id, resources_before, resource_rows(partner.type, resources_data))
+                mark_dirty(user.organization_id, "partners")
+
+            # The contact, tags and resources are part of the partner for delta syncs and AI contexts
+            if not changed and (individual_changed or "tags" in given or resources_data is not None):
+                partner.save(update_fields=["updated_at"])
+
+            # Type and phones aren't searchable
+            if set(given) - {"type", "phone", "individual_phone"}:
+                index_partners([partner.pk])
+        
+        # Return response
+        partner = PartnerSerializer.setup_eager_loading(Partner.objects.filter(pk=partner.pk), **sparse).get()
+        serializer = PartnerSerializer(partner, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class PartnerDeletion(APIView):
@@ -512,19 +779,28 @@ class PartnerDeletion(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify partner
         try:
-            partner = Partner.objects.prefetch_related('individual').prefetch_related('tags').prefetch_related('resources').get(pk=partner_id, organization=user.organization)
+            partner = Partner.objects.prefetch_related('individual').prefetch_related('tags').get(pk=partner_id, organization_id=user.organization_id)
         except Partner.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Delete partner
-        partner.individual.delete()
+        # Delete partner, its resources leave the rollups in the same transaction
+        with transaction.atomic():
+            # A concurrent deletion already took the resources out of the rollups
+            partner_type = Partner.objects.select_for_update().filter(pk=partner.pk).values_list("type", flat=True).first()
+            if partner_type is None:
+                return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            update_rollups(user.organization_id, resource_rows(partner_type, Resource.objects.filter(partner_id=partner.pk)), [])
+            touch_partner_events(partner.pk)
+            bury(user.organization_id, TOMBSTONE_PARTNER, [partner.pk])
+            partner.individual.delete()
+            touch_events(user.organization_id)
+            mark_dirty(user.organization_id, "events", "partners")
         
         # Return response
         return Response(status=status.HTTP_200_OK)
@@ -538,22 +814,36 @@ class EventList(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
-        # Verify user
         try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+            start, end = parse_event_window(request)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
 
-        # Retrive all events
-        events = Event.objects.filter(organization=user.organization)
+        # Retrive the events in the window, every event by default
+        events = EventSerializer.setup_eager_loading(filter_window(Event.objects.filter(organization_id=user.organization_id), start, end), **sparse)
+
+        # Return one page when asked for
+        if wants_page(request):
+            try:
+                events, next_cursor = paginate(request, events, EVENT_ORDER)
+            except InvalidPage:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            serializer = EventSerializer(events, many=True, **sparse)
+            return Response({"results": serializer.data, "next": next_cursor}, status=status.HTTP_200_OK)
         
         # Return response
-        serializer = EventSerializer(events, many=True)
+        serializer = EventSerializer(events, many=True, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class EventCreation(APIView):
@@ -563,21 +853,22 @@ class EventCreation(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         name = request.query_params.get("name", "")
         description = request.query_params.get("description", "")
         date = request.query_params.get("date", "")
         start_time = request.query_params.get("start_time", "")
         end_time = request.query_params.get("end_time", "")
         partners = request.query_params.get("partners", "")
+        allow_conflicts = request.query_params.get("allow_conflicts", "") == "1"
 
         # Validate inputs
         if not (user_hash and name and description and date and start_time and end_time):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Validate date and times
@@ -600,22 +891,31 @@ class EventCreation(APIView):
             return Response(status=status.HTTP_412_PRECONDITION_FAILED)
         
         # Gather all partners
-        partners_data = None
+        partners_data = []
 
         if partners:
             partners_split = list(map(int, partners.split(", ")))
             
             if partners_split:
-                partners_data = Partner.objects.filter(organization=user.organization, pk__in=partners_split)
+                partners_data = list(Partner.objects.filter(organization_id=user.organization_id, pk__in=partners_split).values_list("pk", flat=True))
+        
+        # Verify the partners aren't booked at the same time
+        if not allow_conflicts:
+            conflicts = find_conflicts(user.organization_id, date_object, start_time_object, end_time_object, partners_data)
+            if conflicts:
+                return Response({"conflicts": conflicts}, status=status.HTTP_409_CONFLICT)
         
         # Create event
-        new_event = Event.objects.create(name=name, description=description, date=date, start_time=start_time, end_time=end_time, organization=user.organization)
+        new_event = Event.objects.create(name=name, description=description, date=date, start_time=start_time, end_time=end_time, organization_id=user.organization_id)
         if partners_data:
             new_event.partners.set(partners_data)
         new_event.save()
+        index_events([new_event.pk])
+        touch_events(user.organization_id)
+        mark_dirty(user.organization_id, "events")
         
         # Return response
-        serializer = EventSerializer(new_event)
+        serializer = EventSerializer(new_event, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class EventModification(APIView):
@@ -625,6 +925,7 @@ class EventModification(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
         event_id = request.query_params.get("event_id", "")
         name = request.query_params.get("name", "")
         description = request.query_params.get("description", "")
@@ -632,20 +933,20 @@ class EventModification(APIView):
         start_time = request.query_params.get("start_time", "")
         end_time = request.query_params.get("end_time", "")
         partners = request.query_params.get("partners", "")
+        allow_conflicts = request.query_params.get("allow_conflicts", "") == "1"
 
         # Validate inputs
         if not (user_hash and event_id and name and description and date and start_time and end_time):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Validate date and times
         try:
-            event = Event.objects.prefetch_related('partners').get(pk=event_id, organization=user.organization)
+            event = Event.objects.prefetch_related('partners').get(pk=event_id, organization_id=user.organization_id)
         except User.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
@@ -668,13 +969,19 @@ class EventModification(APIView):
             return Response(status=status.HTTP_412_PRECONDITION_FAILED)
          
         # Gather all partners
-        partners_data = None
+        partners_data = []
 
         if partners:
             partners_split = list(map(int, partners.split(", ")))
             
             if partners_split:
-                partners_data = Partner.objects.filter(organization=user.organization, pk__in=partners_split)
+                partners_data = list(Partner.objects.filter(organization_id=user.organization_id, pk__in=partners_split).values_list("pk", flat=True))
+        
+        # Verify the partners aren't booked at the same time by another event
+        if not allow_conflicts:
+            conflicts = find_conflicts(user.organization_id, date_object, start_time_object, end_time_object, partners_data, exclude=event.pk)
+            if conflicts:
+                return Response({"conflicts": conflicts}, status=status.HTTP_409_CONFLICT)
         
         # Modify and save event
         event.name = name
@@ -682,13 +989,86 @@ class EventModification(APIView):
         event.date = date
         event.start_time = start_time
         event.end_time = end_time
-        event.partners.clear()
-        if partners_data:
-            event.partners.set(partners_data)
+        sync_relation(event, "partners", partners_data)
         event.save()
+        index_events([event.pk])
+        touch_events(user.organization_id)
+        mark_dirty(user.organization_id, "events")
         
         # Return response
-        serializer = EventSerializer(event)
+        serializer = EventSerializer(event, **sparse)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    def patch(self, request, format=None):
+        """
+        Partially Modifying Event
+        """
+        # Get all data from request, only the given fields are changed
+        user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
+        event_id = request.query_params.get("event_id", "")
+        given = {key: value for key, value in request.query_params.items() if key in EVENT_FIELDS}
+        allow_conflicts = request.query_params.get("allow_conflicts", "") == "1"
+
+        # Validate inputs
+        if not (user_hash and event_id.isdigit()) or not all(value for key, value in given.items() if key != "partners"):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify event
+        try:
+            event = Event.objects.get(pk=event_id, organization_id=user.organization_id)
+        except Event.DoesNotExist:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Validate date and times
+        event_values = {key: given[key] for key in ["name", "description"] if key in given}
+        for key, parse in [("date", parse_date), ("start_time", parse_time), ("end_time", parse_time)]:
+            if key in given:
+                try:
+                    event_values[key] = parse(given[key])
+                except ValueError:
+                    return Response(status=status.HTTP_409_CONFLICT)
+                if event_values[key] is None:
+                    return Response(status=status.HTTP_412_PRECONDITION_FAILED)
+        
+        # Gather all partners, only when given
+        partners_data = None
+        if "partners" in given:
+            partners_split = [int(x) for x in given["partners"].split(", ") if x.isdigit()]
+            partners_data = list(Partner.objects.filter(organization_id=user.organization_id, pk__in=partners_split).values_list("pk", flat=True)) if partners_split else []
+        
+        # Verify the partners aren't booked at the same time by another event, when the schedule changes
+        if not allow_conflicts and any(key in given for key in SCHEDULE_FIELDS):
+            partner_ids = partners_data if partners_data is not None else list(event.partners.values_list("pk", flat=True))
+            conflicts = find_conflicts(user.organization_id, event_values.get("date", event.date), event_values.get("start_time", event.start_time), event_values.get("end_time", event.end_time), partner_ids, exclude=event.pk)
+            if conflicts:
+                return Response({"conflicts": conflicts}, status=status.HTTP_409_CONFLICT)
+        
+        # Modify and save only the changed columns
+        changed = apply_changes(event, event_values)
+        if changed:
+            event.save(update_fields=changed)
+
+        if "name" in changed or "description" in changed:
+            index_events([event.pk])
+
+        if partners_data is not None:
+            sync_relation(event, "partners", partners_data)
+            if not changed:
+                event.save(update_fields=["updated_at"])
+
+        if changed or partners_data is not None:
+            touch_events(user.organization_id)
+            mark_dirty(user.organization_id, "events")
+        
+        # Return response
+        event = EventSerializer.setup_eager_loading(Event.objects.filter(pk=event.pk), **sparse).get()
+        serializer = EventSerializer(event, **sparse)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class EventDeletion(APIView):
@@ -705,19 +1085,22 @@ class EventDeletion(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify event
         try:
-            event = Event.objects.prefetch_related('partners').get(pk=event_id, organization=user.organization)
+            event = Event.objects.prefetch_related('partners').get(pk=event_id, organization_id=user.organization_id)
         except User.DoesNotExist:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Delete event
-        event.delete()
+        with transaction.atomic():
+            bury(user.organization_id, TOMBSTONE_EVENT, [event.pk])
+            event.delete()
+        touch_events(user.organization_id)
+        mark_dirty(user.organization_id, "events")
 
         # Return response
         return Response(status=status.HTTP_200_OK)
@@ -741,9 +1124,8 @@ class OrganizationModification(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify role
@@ -761,16 +1143,339 @@ class OrganizationModification(APIView):
             message_icon = None
         
         # Modify and save organization
-        user.organization.name = name
-        user.organization.message = message
-        user.organization.message_title = message_title
-        user.organization.message_icon = int(message_icon)
-        user.organization.save()
+        organization = user.organization
+        organization.name = name
+        organization.message = message
+        organization.message_title = message_title
+        organization.message_icon = int(message_icon)
+
+        # The version counters are only ever moved by F() updates, writing them back could undo a concurrent bump
+        # Saving bumps the version and flags the dashboard snapshot, see api.cache
+        organization.save(update_fields=["name", "message", "message_title", "message_icon"])
         
         # Return response
-        serializer = OrganizationSerializer(user.organization)
+        serializer = OrganizationSerializer(organization)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def patch(self, request, format=None):
+        """
+        Partially Modifying Organization
+        """
+        # Get all data from request, only the given fields are changed
+        user_hash = request.query_params.get("user_hash", "")
+        given = {key: value for key, value in request.query_params.items() if key in ORGANIZATION_FIELDS}
+
+        # Validate inputs
+        if not user_hash or given.get("name") == "":
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        if given.get("message_icon") and not given["message_icon"].isdigit():
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify role
+        if user.role != 0 and user.role != 1:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        
+        # Empty messages clear them
+        organization_values = {key: value or None for key, value in given.items()}
+        if organization_values.get("message_icon"):
+            organization_values["message_icon"] = int(organization_values["message_icon"])
+        
+        # Modify and save only the changed columns
+        organization = user.organization
+        changed = apply_changes(organization, organization_values)
+        if changed:
+            # Saving bumps the version and flags the dashboard snapshot, see api.cache
+            organization.save(update_fields=changed)
+        
+        # Return response
+        serializer = OrganizationSerializer(organization)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+class Search(APIView):
+    def post(self, request, format=None):
+        """
+        Searching Partners And Events
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        query = request.query_params.get("q", "")
+        kinds = [kind.strip() for kind in request.query_params.get("kinds", ",".join(SEARCH_KINDS)).split(",") if kind.strip()]
+
+        # Validate inputs
+        if not (user_hash and query) or not kinds or any(kind not in SEARCH_KINDS for kind in kinds):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        try:
+            limit = page_limit(request)
+            offset = page_offset(request)
+        except InvalidPage:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Search, one extra result tells whether there is a next page
+        results = search(user.organization_id, query, kinds, limit + 1, offset)
+        next_cursor = encode_cursor([offset + limit]) if len(results) > limit else None
+        
+        # Return response
+        return Response({"results": results[:limit], "next": next_cursor}, status=status.HTTP_200_OK)
+
+class ResourceSummary(APIView):
+    def post(self, request, format=None):
+        """
+        Summarizing Resources
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+
+        # Validate inputs
+        if not user_hash:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Return response
+        return Response(summarize_rollups(user.organization_id), status=status.HTTP_200_OK)
+
+class DataImport(APIView):
+    def post(self, request, format=None):
+        """
+        Importing Partners Or Events
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        kind = request.query_params.get("kind", "")
+        file = request.FILES.get("file")
+
+        # Validate inputs
+        if not (user_hash and kind in IMPORTERS and file):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify role
+        if user.role != 0 and user.role != 1:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        
+        # Stream the upload in chunks
+        created, errors = import_rows(kind, user.organization_id, read_rows(file))
+
+        # Files that aren't UTF-8 or valid CSV stop where they broke
+        if any(error["error"] == "unreadable_file" for error in errors):
+            return Response({"created": created, "errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Return response
+        return Response({"created": created, "errors": errors}, status=status.HTTP_200_OK)
+
+class Calendar(APIView):
+    def post(self, request, format=None):
+        """
+        Listing A Month Or Week Of Events
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        view = request.query_params.get("view", "month")
+        sparse = get_sparse_fields(request)
+
+        # Validate inputs
+        if not user_hash or view not in CALENDAR_VIEWS:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        try:
+            day = read_date(request.query_params["date"]) if request.query_params.get("date") else timezone.localdate()
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Retrieve the window's events and count them per day in the database
+        start, end = calendar_window(view, day)
+        events = EventSerializer.setup_eager_loading(filter_window(Event.objects.filter(organization_id=user.organization_id), start, end), **sparse).order_by(*WINDOW_ORDER)
+        serializer = EventSerializer(events, many=True, **sparse)
+        
+        # Return response
+        return Response({"from": start.isoformat(), "to": end.isoformat(), "days": day_counts(user.organization_id, start, end), "events": serializer.data}, status=status.HTTP_200_OK)
+
+class PartnerRecommendation(APIView):
+    def post(self, request, format=None):
+        """
+        Recommending Partners For An Event
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        event_id = request.query_params.get("event_id", "")
+
+        # Validate inputs
+        if not (user_hash and event_id):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        try:
+            limit = page_limit(request)
+        except InvalidPage:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify event
+        try:
+            event = Event.objects.only("pk", "name", "description").get(pk=event_id, organization_id=user.organization_id)
+        except (Event.DoesNotExist, ValueError):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Rank the partners in memory, the index only reads partners changed since its last use
+        results = [{"pk": pk, "name": name, "score": score} for pk, name, score in recommend_partners(user.organization_id, event, limit)]
+        
+        # Return response
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+class FreeSlots(APIView):
+    def post(self, request, format=None):
+        """
+        Finding Common Free Slots Of Partners
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        partners = request.query_params.get("partners", "")
+        start_date = request.query_params.get("from", "")
+        end_date = request.query_params.get("to", "")
+        day_start = request.query_params.get("day_start", "00:00")
+        day_end = request.query_params.get("day_end", "")
+        duration = request.query_params.get("duration", "1")
+
+        # Validate inputs
+        if not (user_hash and partners and start_date and end_date):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        try:
+            partners_split = [int(x) for x in partners.split(",") if x.strip()]
+            start_date_object = read_date(start_date)
+            end_date_object = read_date(end_date)
+            day_start_minutes = to_minutes(parse_time(day_start))
+            day_end_minutes = to_minutes(parse_time(day_end)) if day_end else DAY_MINUTES
+            duration_minutes = int(duration)
+        except (TypeError, AttributeError, ValueError):
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        if not partners_split or end_date_object < start_date_object or (end_date_object - start_date_object).days >= MAX_SLOT_DAYS or day_end_minutes <= day_start_minutes or duration_minutes < 1:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Sweep the partners' bookings, other organizations' partners are never booked by this one's events
+        slots = free_slots(user.organization_id, partners_split, start_date_object, end_date_object, day_start_minutes, day_end_minutes, duration_minutes)
+        
+        # Return response
+        return Response({"slots": slots}, status=status.HTTP_200_OK)
+
+class FeedTokenCreation(APIView):
+    def post(self, request, format=None):
+        """
+        Issuing A Feed Token
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+
+        # Validate inputs
+        if not user_hash:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Calendar services store the feed URL, so it carries a feed-only token instead of the session credential
+        feed_token, token = issue_feed_token(user)
+
+        # Return response
+        url = request.build_absolute_uri(f"{reverse('event-view-feed')}?{urlencode({'token': token})}")
+        return Response({"pk": feed_token.pk, "token": token, "url": url}, status=status.HTTP_200_OK)
+
+class FeedTokenDeletion(APIView):
+    def post(self, request, format=None):
+        """
+        Revoking A Feed Token
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        feed_token_id = request.query_params.get("feed_token_id", "")
+
+        # Validate inputs
+        if not (user_hash and feed_token_id.isdigit()):
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify feed token, members may only revoke their own
+        feed_tokens = FeedToken.objects.filter(pk=feed_token_id, organization_id=user.organization_id)
+        if user.role != 0 and user.role != 1:
+            feed_tokens = feed_tokens.filter(user_id=user.pk)
+        
+        # Delete feed token
+        if not feed_tokens.delete()[0]:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Return response
+        return Response(status=status.HTTP_200_OK)
+
+class EventFeed(View):
+    # Plain Django view, calendar apps poll with GET and don't accept JSON
+    def get(self, request):
+        """
+        Streaming The iCalendar Feed Of An Organization Or Partner
+        """
+        # Get all data from request
+        token = request.GET.get("token", "")
+        partner = request.GET.get("partner", "")
+
+        # Validate inputs
+        if not token or (partner and not partner.isdigit()):
+            return HttpResponse(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Verify feed token, and answer pollers from the versions alone while nothing changed
+        partner_id = int(partner) if partner else None
+        organization_id, etag, name = feed_state(token, partner_id)
+        if organization_id is None:
+            return HttpResponse(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = etag
+            return response
+        
+        # Return response
+        response = StreamingHttpResponse(generate_feed(organization_id, name, partner_id), content_type="text/calendar; charset=utf-8")
+        response["ETag"] = etag
+        response["Cache-Control"] = "private, no-cache"
+        return response
+
 ######################################################################################################
 
 class DashboardList(APIView):
@@ -780,24 +1485,60 @@ class DashboardList(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
-        # Verify user
         try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+            start, end = parse_event_window(request)
+        except ValueError:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Retrieve the events in the window, every event by default
+        # The dashboard overview (upcoming events, partner and resource counts, banner) is served from the snapshot by DashboardSnapshotData,
+        # this list stays live for the windows, pages and sparse fields the snapshot cannot answer
+        events = EventDashboardSerializer.setup_eager_loading(filter_window(Event.objects.filter(organization_id=user.organization_id), start, end), **sparse)
+
+        # Return one page when asked for
+        if wants_page(request):
+            try:
+                events, next_cursor = paginate(request, events, EVENT_ORDER)
+            except InvalidPage:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            event_serializer = EventDashboardSerializer(events, many=True, **sparse)
+            return Response([{"results": event_serializer.data, "next": next_cursor}, get_organization_data(user.organization_id)], status=status.HTTP_200_OK)
+        
+        # Return response
+        event_serializer = EventDashboardSerializer(events, many=True, **sparse)
+        return Response([event_serializer.data, get_organization_data(user.organization_id)], status=status.HTTP_200_OK)
+
+class DashboardSnapshotData(APIView):
+    def post(self, request, format=None):
+        """
+        Retrieving The Dashboard Snapshot
+        """
+        # Replaces the unwindowed DashboardList call for the overview: {date, events, partner_types, resource_types, organization}
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+
+        # Validate inputs
+        if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
-        # Retrieve all events
-        events = Event.objects.filter(organization=user.organization)
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Return response
-        event_serializer = EventDashboardSerializer(events, many=True)
-        organization_serializer = OrganizationSerializer(user.organization)
-        return Response([event_serializer.data, organization_serializer.data], status=status.HTTP_200_OK)
+        return Response(get_snapshot(user.organization_id), status=status.HTTP_200_OK)
 
 ######################################################################################################
 
@@ -808,15 +1549,15 @@ class AdminList(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify role
@@ -824,12 +1565,86 @@ class AdminList(APIView):
             return Response(status=status.HTTP_401_UNAUTHORIZED)
         
         # Get all users
-        users = User.objects.filter(organization=user.organization)
+        users = UserAdminSerializer.setup_eager_loading(User.objects.filter(organization_id=user.organization_id), **sparse)
+
+        # Return one page when asked for
+        if wants_page(request):
+            try:
+                users, next_cursor = paginate(request, users, CREATION_ORDER)
+            except InvalidPage:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            user_serializer = UserAdminSerializer(users, many=True, **sparse)
+            return Response([{"results": user_serializer.data, "next": next_cursor}, get_organization_data(user.organization_id)], status=status.HTTP_200_OK)
         
         # Return response
-        user_serializer = UserAdminSerializer(users, many=True)
-        organization_serializer = OrganizationSerializer(user.organization)
-        return Response([user_serializer.data, organization_serializer.data], status=status.HTTP_200_OK)
+        user_serializer = UserAdminSerializer(users, many=True, **sparse)
+        return Response([user_serializer.data, get_organization_data(user.organization_id)], status=status.HTTP_200_OK)
+
+######################################################################################################
+
+class BlobData(View):
+    # Plain Django view, DRF content negotiation would reject image Accept headers
+    def get(self, request, sha256):
+        """
+        Serving A Stored Image Or One Of Its Variants
+        """
+        # Only real hashes may reach the filesystem
+        if len(sha256) != 64 or sha256.strip("0123456789abcdef"):
+            raise Http404()
+
+        # Get all data from request
+        size = request.GET.get("size", "")
+        image_format = request.GET.get("image_format", "")
+        cache_control = "public, max-age=31536000, immutable"
+
+        # Validate inputs
+        if size and size not in VARIANT_SIZES:
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        
+        if image_format and image_format not in VARIANT_FORMATS:
+            return HttpResponse(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Serve WebP to clients that accept it unless a format was asked for
+        if size and not image_format:
+            image_format = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+        
+        # Blobs are addressed by their content, so a matching ETag never needs a lookup
+        etag = f'"{sha256}-{size}.{image_format}"' if size else f'"{sha256}"'
+
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response["ETag"] = etag
+            response["Cache-Control"] = cache_control
+            return response
+        
+        # Serve the variant once the background pool has generated it
+        if size:
+            try:
+                response = FileResponse(open(variant_path(sha256, size, image_format), "rb"), content_type=VARIANT_FORMATS[image_format][1])
+                response["ETag"] = etag
+                response["Cache-Control"] = cache_control
+                response["Vary"] = "Accept"
+                return protect_blob(response)
+            except OSError:
+                # Fall back to the original for now, without letting caches keep it
+                cache_control = "public, max-age=60"
+        
+        # Verify blob
+        try:
+            blob = Blob.objects.get(sha256=sha256)
+            file = open(blob_path(blob.sha256), "rb")
+        except (Blob.DoesNotExist, OSError):
+            raise Http404()
+        
+        # Blobs stored before uploads were checked may carry a client's type, only images are served as such
+        content_type = blob.content_type if blob.content_type.startswith("image/") and "svg" not in blob.content_type else "application/octet-stream"
+
+        # Return response
+        response = FileResponse(file, content_type=content_type)
+        response["Cache-Control"] = cache_control
+        if not size:
+            response["ETag"] = etag
+        return protect_blob(response)
 
 ######################################################################################################
 
@@ -846,9 +1661,8 @@ class GPTAIKEY(APIView):
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Return response
@@ -861,22 +1675,68 @@ class AIData(APIView):
         """
         # Get all data from request
         user_hash = request.query_params.get("user_hash", "")
+        since = request.query_params.get("since", "")
+        sparse = get_sparse_fields(request)
 
         # Validate inputs
         if not user_hash:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Verify user
-        try:
-            user = User.objects.prefetch_related('organization').get(user_hash=user_hash)
-        except User.DoesNotExist:
+        user = get_session_user(user_hash)
+        if user is None:
             return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
-        # Get partners and events
-        partners = Partner.objects.filter(organization=user.organization)
-        events = Event.objects.filter(organization=user.organization)
+        # Read the cursor of the last sync, an expired one means a full resync
+        started = timezone.now()
+        changed_since = None
+        if since:
+            try:
+                changed_since = read_cursor(since, user.organization_id)
+            except ValueError:
+                return Response(status=status.HTTP_400_BAD_REQUEST)
+            except CursorExpired:
+                changed_since = None
+        
+        # Get partners and events, only the changed ones when syncing
+        partners = Partner.objects.filter(organization_id=user.organization_id)
+        events = Event.objects.filter(organization_id=user.organization_id)
+        sync = {"api_key": os.getenv("OPENAI_KEY"), "cursor": issue_cursor(user.organization_id, started), "full": changed_since is None}
+        if changed_since is not None:
+            partners = changed_partners(partners, changed_since)
+            events = changed_events(events, changed_since)
+            sync["deleted"] = deleted_since(user.organization_id, changed_since)
+        
+        # Return response
+        partner_serializer = PartnerAISerializer(PartnerAISerializer.setup_eager_loading(partners, **sparse), many=True, **sparse)
+        event_serializer = EventAISerializer(EventAISerializer.setup_eager_loading(events, **sparse), many=True, **sparse)
+        return Response([sync, partner_serializer.data, event_serializer.data], status=status.HTTP_200_OK)
+
+class AIContext(APIView):
+    def post(self, request, format=None):
+        """
+        Streaming A Size Budgeted AI Context Of Partners & Events
+        """
+        # Get all data from request
+        user_hash = request.query_params.get("user_hash", "")
+        budget = request.query_params.get("budget", str(CONTEXT_BUDGET))
+
+        # Validate inputs
+        if not user_hash:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        if not budget.isdigit() or not 0 < int(budget) <= CONTEXT_BUDGET_MAX:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
+        
+        # Verify user
+        user = get_session_user(user_hash)
+        if user is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        # Built once per data version, every budget is a cut of the same ranked lines
+        lines = get_context(user.organization_id)
+        if lines is None:
+            return Response(status=status.HTTP_422_UNPROCESSABLE_ENTITY)
         
         # Return response
-        partner_serializer = PartnerAISerializer(partners, many=True)
-        event_serializer = EventAISerializer(events, many=True)
-        return Response([{"api_key": os.getenv("OPENAI_KEY")}, partner_serializer.data, event_serializer.data], status=status.HTTP_200_OK)
\ No newline at end of file
+        return StreamingHttpResponse(stream_context(lines, int(budget)), content_type="application/x-ndjson")
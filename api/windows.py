@@ -0,0 +1,70 @@
+import datetime
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from .models import Event
+
+CALENDAR_VIEWS = ["month", "week"]
+
+# Order of events inside a window, served by event_org_date_time_idx
+WINDOW_ORDER = ("date", "start_time", "pk")
+
+def read_date(value):
+    """
+    Parsing an ISO date parameter, raises ValueError if it isn't one
+    """
+    date = parse_date(value)
+    if date is None:
+        raise ValueError(value)
+    return date
+
+def parse_event_window(request):
+    """
+    Reading the from/to dates and upcoming/past shortcuts, returns the first and last day (either may be None)
+    """
+    params = request.query_params
+    start = read_date(params["from"]) if params.get("from") else None
+    end = read_date(params["to"]) if params.get("to") else None
+
+    upcoming = params.get("upcoming", "") == "1"
+    past = params.get("past", "") == "1"
+    if upcoming and past:
+        raise ValueError("upcoming and past")
+
+    today = timezone.localdate()
+    if upcoming:
+        start = max(start, today) if start else today
+    if past:
+        yesterday = today - datetime.timedelta(days=1)
+        end = min(end, yesterday) if end else yesterday
+
+    return start, end
+
+def filter_window(queryset, start, end):
+    """
+    Keeping the events between the first and last day, both included
+    """
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+def calendar_window(view, day):
+    """
+    First and last day of the month or the Monday to Sunday week around a day
+    """
+    if view == "week":
+        start = day - datetime.timedelta(days=day.weekday())
+        return start, start + datetime.timedelta(days=6)
+
+    start = day.replace(day=1)
+    next_month = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, next_month - datetime.timedelta(days=1)
+
+def day_counts(organization_id, start, end):
+    """
+    Counting an organization's events per day in a GROUP BY
+    """
+    rows = filter_window(Event.objects.filter(organization_id=organization_id), start, end).values("date").annotate(count=Count("pk")).values_list("date", "count").order_by("date")
+    return {date.isoformat(): count for date, count in rows}
@@ -82,7 +82,8 @@ WSGI_APPLICATION = 'ventike.wsgi.application'
 DATABASES = {
     'default': dj_database_url.config(
         # Replace this value with your local database's connection string.
-        default=os.getenv("DATABASE_URL"),
+        # Falls back to the local SQLite database when DATABASE_URL is not set.
+        default=os.getenv("DATABASE_URL", f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
         conn_max_age=600
     )
 }
@@ -147,6 +148,46 @@ MEDIA_ROOT = os.path.join(os.path.dirname(BASE_DIR), 'mediafiles')
 # URL used to access the media
 MEDIA_URL = '/media/'
 
+# Content-addressed store for uploaded images, see api.blobs
+BLOB_ROOT = os.getenv("BLOB_ROOT", os.path.join(MEDIA_ROOT, 'blobs'))
+
+# Number of threads generating resized image variants per process
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 1))
+
+# Lifetime in seconds of the signed session tokens issued at login
+API_TOKEN_MAX_AGE = int(os.getenv("API_TOKEN_MAX_AGE", 60 * 60 * 24 * 7))
+
+# How often in seconds each process checks the token revocation list version
+API_TOKEN_REVOCATION_POLL = float(os.getenv("API_TOKEN_REVOCATION_POLL", 5))
+
+# How often in seconds each process checks the version of a cached organization
+ORGANIZATION_CACHE_POLL = float(os.getenv("ORGANIZATION_CACHE_POLL", 5))
+
+# How long in seconds each process trusts its registry of an organization's tag ids
+TAG_REGISTRY_MAX_AGE = float(os.getenv("TAG_REGISTRY_MAX_AGE", 5))
+
+# How long in seconds a dashboard snapshot may be served after a write made it stale
+DASHBOARD_SNAPSHOT_MAX_AGE = float(os.getenv("DASHBOARD_SNAPSHOT_MAX_AGE", 5))
+
+# How long in seconds a delta sync cursor of the AI data feed stays valid before a full resync
+AI_SYNC_MAX_AGE = int(os.getenv("AI_SYNC_MAX_AGE", 60 * 60 * 24 * 7))
+
+# bcrypt cost for new password hashes, older hashes are upgraded on the next login
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", 15))
+
+# Number of threads hashing and verifying passwords per process
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+
+# Number of threads hashing the passwords of bulk provisioning per process, separate from the ones serving logins
+PASSWORD_PROVISION_WORKERS = int(os.getenv("PASSWORD_PROVISION_WORKERS", os.cpu_count() or 1))
+
+# Most users one call to the bulk provisioning endpoint may create, larger lists go through the create_users command
+API_BULK_USERS_MAX = int(os.getenv("API_BULK_USERS_MAX", 10))
+
+# Default and maximum page sizes of the paginated list endpoints
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", 50))
+API_PAGE_SIZE_MAX = int(os.getenv("API_PAGE_SIZE_MAX", 200))
+
 # Debug Logging
 # LOGGING = {
 #     'version': 1,